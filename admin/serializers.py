@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from users.models import User
 from properties.models import (Property, PropertyOwnership, PROPERTY_STAGE_CHOICES,
     MODERATION_STATUS_CHOICES, CHOICES_FOR_PROPERTY_OWNERSHIP_STATUS)
-from utils.constants import STAGES_OF_KYC_VERIFICATION
+from utils.constants import STAGES_OF_KYC_VERIFICATION, BULK_MODERATION_MAX_PROPERTIES, BULK_KYC_MAX_USERS
 
 
 class KycVerificationSerializer(serializers.Serializer):
@@ -19,23 +20,54 @@ class KycVerificationSerializer(serializers.Serializer):
     class Meta:
         fields = ['user_id', 'kyc_verification_stage', 'kyc_verification_status']
 
-    def validate(self, attrs):
-        user_id = attrs.get('user_id', '')
-        kyc_stage = attrs.get('kyc_verification_stage', '')
-        verification_status = attrs.get('kyc_verification_status', '')
-
-        users = User.objects.filter(id=user_id)
+    def save(self):
+        updated_ids = User.set_kyc_verification(
+            [self.validated_data['user_id']], self.validated_data['kyc_verification_stage'],
+            self.validated_data['kyc_verification_status'] == self.KYC_STATUS_CHOICES[0][0])
 
-        if len(users) <= 0:
+        if not updated_ids:
             raise serializers.ValidationError(
-                "resource not found")
+                {api_settings.NON_FIELD_ERRORS_KEY: ["resource not found"]})
+
+        return self.validated_data['kyc_verification_status']
+
+
+class BulkKycVerificationSerializer(serializers.Serializer):
+
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=BULK_KYC_MAX_USERS)
+    kyc_verification_stage = serializers.ChoiceField(STAGES_OF_KYC_VERIFICATION, required=True)
+    kyc_verification_status = serializers.ChoiceField(KycVerificationSerializer.KYC_STATUS_CHOICES, required=True)
+
+    class Meta:
+        fields = ['user_ids', 'kyc_verification_stage', 'kyc_verification_status']
+
+    def save(self):
+        user_ids = list(dict.fromkeys(self.validated_data['user_ids']))
+        status = self.validated_data['kyc_verification_status']
+
+        updated_ids = User.set_kyc_verification(
+            user_ids, self.validated_data['kyc_verification_stage'],
+            status == KycVerificationSerializer.KYC_STATUS_CHOICES[0][0])
 
-        user = users[0]
-        user.stages_of_kyc_verification[kyc_stage] = verification_status == self.KYC_STATUS_CHOICES[0][0]
-        user.stages_of_profile_completion[kyc_stage] = verification_status == self.KYC_STATUS_CHOICES[0][0]
-        user.save()
+        return {
+            'status': status,
+            'updated': len(updated_ids),
+            'results': [
+                {'user_id': user_id, 'result': 'updated' if user_id in updated_ids else 'not_found'}
+                for user_id in user_ids
+            ],
+        }
+
+
+class KycQueueSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ['id', 'firstname', 'lastname', 'email', 'role', 'identity_document_type',
+                  'identity_document_number', 'identity_document_expiry_date',
+                  'stages_of_profile_completion', 'stages_of_kyc_verification', 'created_at']
 
-        return user
 
 class PropertyModerationSerializer(serializers.Serializer):
 
@@ -49,19 +81,95 @@ class PropertyModerationSerializer(serializers.Serializer):
         property_id = attrs.get('property_id', '')
         status = attrs.get('status', '')
 
-        prop = Property.objects.filter(id=property_id)
+        prop = Property.objects.filter(id=property_id).first()
 
-        if len(prop) <= 0:
+        if not prop:
             raise serializers.ValidationError(
                 "resource not found")
 
-        prop = prop[0]
         prop.moderation_status = status
-        prop.save()
+        prop.save(update_fields=['moderation_status', 'updated_at'])
 
         return attrs
 
 
+class PropertyModerationFilterSerializer(serializers.Serializer):
+
+    moderation_status = serializers.ChoiceField(MODERATION_STATUS_CHOICES, required=False)
+    stage = serializers.ChoiceField(PROPERTY_STAGE_CHOICES, required=False)
+    agent_id = serializers.IntegerField(required=False)
+    company_id = serializers.IntegerField(required=False)
+    state = serializers.CharField(required=False)
+    country = serializers.CharField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    LOOKUPS = {
+        'state': 'state__iexact',
+        'country': 'country__iexact',
+        'created_after': 'created_at__gte',
+        'created_before': 'created_at__lt',
+    }
+
+    @classmethod
+    def get_queryset(cls, filters):
+        return Property.objects.filter(**{
+            cls.LOOKUPS.get(field, field): value for field, value in filters.items()})
+
+
+class BulkPropertyModerationSerializer(serializers.Serializer):
+
+    property_ids = serializers.ListField(
+        child=serializers.UUIDField(), required=False, allow_empty=False,
+        max_length=BULK_MODERATION_MAX_PROPERTIES)
+    filter = PropertyModerationFilterSerializer(required=False)
+    status = serializers.ChoiceField(MODERATION_STATUS_CHOICES, required=True)
+
+    class Meta:
+        fields = ['property_ids', 'filter', 'status']
+
+    def validate(self, attrs):
+        if ('property_ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError(
+                "provide either property_ids or filter")
+
+        if 'filter' in attrs and not attrs['filter']:
+            raise serializers.ValidationError(
+                "filter must contain at least one condition")
+
+        return attrs
+
+    def save(self):
+        status = self.validated_data['status']
+        property_ids = self.validated_data.get('property_ids')
+
+        if property_ids is not None:
+            property_ids = list(dict.fromkeys(property_ids))
+            queryset = Property.objects.filter(id__in=property_ids)
+            has_more = False
+        else:
+            ## oldest first and skipping those already moderated, so repeating the call works through a
+            ## large match in batches
+            queryset = PropertyModerationFilterSerializer.get_queryset(
+                self.validated_data['filter']).exclude(moderation_status=status)
+            matched_ids = list(queryset.order_by('created_at', 'id').values_list(
+                'id', flat=True)[:BULK_MODERATION_MAX_PROPERTIES + 1])
+            has_more = len(matched_ids) > BULK_MODERATION_MAX_PROPERTIES
+            property_ids = matched_ids[:BULK_MODERATION_MAX_PROPERTIES]
+            queryset = Property.objects.filter(id__in=property_ids)
+
+        properties, changed_ids = Property.bulk_moderate(queryset, status)
+        found_ids = {property.id for property in properties}
+
+        results = [
+            {'property_id': property_id,
+             'result': 'updated' if property_id in changed_ids else 'unchanged' if property_id in found_ids else 'not_found'}
+            for property_id in property_ids
+        ]
+
+        return {'status': status, 'updated': len(changed_ids), 'has_more': has_more, 'results': results}
+
+
 class ReviewPropertyOwnershipSerializer(serializers.Serializer):
     request_id = serializers.IntegerField(required=True)
     status = serializers.ChoiceField(CHOICES_FOR_PROPERTY_OWNERSHIP_STATUS, required=True)
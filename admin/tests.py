@@ -1,3 +1,180 @@
-from django.test import TestCase
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from users.models import User, Company, get_pending_kyc_condition
+from properties.models import Property
+from notifications.models import Notifications
+from .serializers import KycVerificationSerializer
+from utils.metrics import request_metrics
+
+
+@override_settings(MIDDLEWARE=['utils.metrics.RequestMetricsMiddleware', *settings.MIDDLEWARE])
+class RequestMetricsTestCase(TestCase):
+
+    def setUp(self):
+        request_metrics.reset()
+        self.admin = User.objects.create_user('Ada', 'Obi', 'admin@roofbucks.com', 'AGENT', 'Password1!')
+        self.admin.is_staff = True
+        self.admin.save()
+
+    def test_response_carries_server_timing(self):
+        response = APIClient().get('/api/v1/properties/marketplace/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=')
+
+        [view] = request_metrics.as_dict()
+        self.assertEqual((view['method'], view['route']), ('GET', 'api/v1/properties/marketplace/'))
+        self.assertEqual(view['queries']['count'], 1)
+        self.assertEqual(view['response_bytes']['sum'], len(response.content))
+
+    def test_metrics_endpoint_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('Bola', 'Ade', 'bola@roofbucks.com', 'AGENT', 'Password1!'))
+
+        self.assertEqual(client.get('/api/v1/admin/metrics/').status_code, 403)
+
+    def test_prometheus_text_dump(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        client.get('/api/v1/properties/marketplace/')
+
+        response = client.get('/api/v1/admin/metrics/', {'format': 'prometheus'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn('roofbucks_request_queries_count{method="GET",route="api/v1/properties/marketplace/"} 1',
+                      response.content.decode())
+
+
+class BulkPropertyModerationTestCase(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('Ada', 'Obi', 'admin@roofbucks.com', 'AGENT', 'Password1!')
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        self.agent = User.objects.create_user('Bola', 'Ade', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        company = Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Ade Homes')
+        self.properties = [
+            Property.objects.create(
+                name=f'Property {index}', agent=self.agent, company=company, apartment_type='duplex',
+                address='1 Admiralty Way', state='Lagos' if index < 3 else 'Abuja', country='Nigeria')
+            for index in range(4)
+        ]
+
+    def moderate(self, data):
+        return self.client.patch('/api/v1/admin/bulk_moderate_properties/', data, format='json')
+
+    def test_moderates_listed_ids_in_one_update(self):
+        Property.objects.filter(id=self.properties[1].id).update(moderation_status='APPROVED')
+        missing_id = 'c0ffee00-0000-4000-8000-000000000000'
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.moderate({'property_ids': [str(self.properties[0].id), str(self.properties[1].id), missing_id],
+                                      'status': 'APPROVED'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['result'] for item in response.json()['results']], ['updated', 'unchanged', 'not_found'])
+        self.assertEqual(len([query for query in context.captured_queries
+                              if query['sql'].startswith('UPDATE "Properties"')]), 1)
+        self.assertEqual(Notifications.objects.filter(user=self.agent).count(), 1)
+
+    def test_moderates_by_filter(self):
+        response = self.moderate({'filter': {'state': 'lagos', 'moderation_status': 'PENDING'}, 'status': 'REJECTED'})
+
+        self.assertEqual(response.json()['updated'], 3)
+        self.assertEqual(Property.objects.filter(moderation_status='REJECTED').count(), 3)
+
+    def test_filter_batches_work_through_the_match(self):
+        ## a filter that doesn't exclude the target status itself still makes progress on every call
+        with mock.patch('admin.serializers.BULK_MODERATION_MAX_PROPERTIES', 2):
+            first = self.moderate({'filter': {'state': 'lagos'}, 'status': 'APPROVED'}).json()
+            second = self.moderate({'filter': {'state': 'lagos'}, 'status': 'APPROVED'}).json()
+
+        self.assertEqual((first['updated'], first['has_more']), (2, True))
+        self.assertEqual((second['updated'], second['has_more']), (1, False))
+        self.assertEqual(Property.objects.filter(moderation_status='APPROVED').count(), 3)
+
+    def test_requires_ids_or_filter(self):
+        self.assertEqual(self.moderate({'status': 'APPROVED'}).status_code, 400)
+        self.assertEqual(self.moderate({'filter': {}, 'status': 'APPROVED'}).status_code, 400)
+
+    def test_is_admin_only(self):
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.moderate({'filter': {'state': 'Lagos'}, 'status': 'APPROVED'}).status_code, 403)
+
+
+class KycReviewQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('Ada', 'Obi', 'admin@roofbucks.com', 'AGENT', 'Password1!')
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        self.users = [
+            User.objects.create_user(f'User{index}', 'Ade', f'user{index}@roofbucks.com', 'AGENT', 'Password1!')
+            for index in range(3)
+        ]
+        ## the first two submitted their profile, the last one hasn't
+        User.objects.filter(id__in=[user.id for user in self.users[:2]]).update(
+            stages_of_profile_completion={'profile': True, 'business': False, 'billing': False},
+            stages_of_kyc_verification={'profile': False, 'business': False})
+
+    def test_lists_pending_users_per_stage(self):
+        response = self.client.get('/api/v1/admin/kyc_queue/', {'stage': 'profile'})
+
+        self.assertEqual([item['id'] for item in response.json()['results']], [user.id for user in self.users[:2]])
+        self.assertEqual(self.client.get('/api/v1/admin/kyc_queue/', {'stage': 'business'}).json()['results'], [])
+        self.assertEqual(self.client.get('/api/v1/admin/kyc_queue/', {'stage': 'billing'}).status_code, 400)
+
+    def test_queue_uses_partial_index(self):
+        queryset = User.objects.filter(get_pending_kyc_condition('profile')).order_by('created_at', 'id')
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('users_kyc_profile_pending_idx', queryset.explain())
+
+    def test_bulk_verification_is_one_update(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch('/api/v1/admin/bulk_kyc_verification/', {
+                'user_ids': [self.users[0].id, self.users[1].id, 0],
+                'kyc_verification_stage': 'profile',
+                'kyc_verification_status': 'approved'}, format='json')
+
+        self.assertEqual([item['result'] for item in response.json()['results']], ['updated', 'updated', 'not_found'])
+        self.assertEqual(len([query for query in context.captured_queries
+                              if query['sql'].startswith('UPDATE "Users"')]), 1)
+
+        user = User.objects.get(id=self.users[0].id)
+        self.assertEqual(user.stages_of_kyc_verification, {'profile': True, 'business': False})
+        self.assertEqual(self.client.get('/api/v1/admin/kyc_queue/').json()['results'], [])
+
+    def test_single_verification_writes_on_save_only(self):
+        data = {'user_id': self.users[0].id, 'kyc_verification_stage': 'profile', 'kyc_verification_status': 'approved'}
+        self.assertTrue(KycVerificationSerializer(data=data).is_valid())
+        self.assertEqual(User.objects.get(id=self.users[0].id).stages_of_kyc_verification['profile'], False)
+
+        response = self.client.patch('/api/v1/admin/kyc_verification/', data, format='json')
+        self.assertEqual(response.json(), {'message': 'approved'})
+        self.assertEqual(User.objects.get(id=self.users[0].id).stages_of_kyc_verification['profile'], True)
+
+        response = self.client.patch('/api/v1/admin/kyc_verification/', {**data, 'user_id': 0}, format='json')
+        self.assertEqual(response.json()['payload'], {'error': ['resource not found']})
+
+    def test_rejection_reopens_profile_stage(self):
+        User.set_kyc_verification([self.users[0].id], 'profile', False)
+
+        user = User.objects.get(id=self.users[0].id)
+        self.assertEqual(user.stages_of_profile_completion, {'profile': False, 'business': False, 'billing': False})
@@ -1,11 +1,17 @@
 from django.urls import path
 from .views import (KycVerificationApiView, PropertyModerationApiView,
-                    ReviewPropertyOwnershipRequest, PropertyOwnershipRequestsViewset)
+                    ReviewPropertyOwnershipRequest, PropertyOwnershipRequestsViewset,
+                    RequestMetricsApiView, BulkPropertyModerationApiView,
+                    BulkKycVerificationApiView, KycQueueViewset)
 
 urlpatterns = [
     path('kyc_verification/', KycVerificationApiView.as_view(), name='kyc_verification'),
+    path('bulk_kyc_verification/', BulkKycVerificationApiView.as_view(), name='bulk_kyc_verification'),
+    path('kyc_queue/', KycQueueViewset.as_view({'get': 'list'}), name='kyc_queue'),
     path('moderate_property/', PropertyModerationApiView.as_view(), name='moderate_property'),
+    path('bulk_moderate_properties/', BulkPropertyModerationApiView.as_view(), name='bulk_moderate_properties'),
     path('review_property_ownership/', ReviewPropertyOwnershipRequest.as_view(), name='review_property_ownership_request'),
     path(
         'property_ownership_requests/', PropertyOwnershipRequestsViewset.as_view({'get': 'list'}), name='property_ownership_requests'),
+    path('metrics/', RequestMetricsApiView.as_view(), name='request_metrics'),
 ]
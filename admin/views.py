@@ -2,11 +2,18 @@ from rest_framework import (views, permissions)
 from rest_framework.response import Response
 from .serializers import (
     KycVerificationSerializer, PropertyModerationSerializer,
-    ReviewPropertyOwnershipSerializer)
+    ReviewPropertyOwnershipSerializer, BulkPropertyModerationSerializer,
+    BulkKycVerificationSerializer, KycQueueSerializer)
 from properties.serializers import  PropertyOwnershipSerializer, PropertyOwnership, \
     CHOICES_FOR_PROPERTY_OWNERSHIP_STATUS, CHOICES_FOR_PROPERTY_OWNER_TYPE
 from rest_framework.viewsets import ReadOnlyModelViewSet
-from utils.pagination import CustomPagination
+from rest_framework.settings import api_settings
+from rest_framework.exceptions import ValidationError
+from users.models import User, get_pending_kyc_condition
+from utils.constants import STAGES_OF_KYC_VERIFICATION
+from utils.pagination import CustomPagination, CustomCursorPagination
+from utils.metrics import request_metrics, storage_upload_metrics
+from utils.renderers import PrometheusTextRenderer
 
 
 class KycVerificationApiView(views.APIView):
@@ -18,7 +25,39 @@ class KycVerificationApiView(views.APIView):
 
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
-        return Response({'message': request.data['kyc_verification_status']}, status=200)
+        return Response({'message': serializer.save()}, status=200)
+
+class BulkKycVerificationApiView(views.APIView):
+
+    serializer_class = BulkKycVerificationSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def patch(self, request):
+
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=200)
+
+
+class KycQueuePagination(CustomCursorPagination):
+    ## first come, first reviewed
+    ordering = ('created_at', 'id')
+
+
+class KycQueueViewset(ReadOnlyModelViewSet):
+    """Users awaiting KYC review of ?stage= (profile by default), oldest first."""
+
+    serializer_class = KycQueueSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = KycQueuePagination
+
+    def get_queryset(self):
+        stage = self.request.query_params.get('stage', 'profile')
+        if stage not in STAGES_OF_KYC_VERIFICATION:
+            raise ValidationError({'stage': [f'must be one of {", ".join(STAGES_OF_KYC_VERIFICATION)}']})
+
+        return User.objects.filter(get_pending_kyc_condition(stage))
+
 
 class PropertyModerationApiView(views.APIView):
 
@@ -31,6 +70,17 @@ class PropertyModerationApiView(views.APIView):
         serializer.is_valid(raise_exception=True)
         return Response({'message': request.data['status']}, status=200)
 
+class BulkPropertyModerationApiView(views.APIView):
+
+    serializer_class = BulkPropertyModerationSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def patch(self, request):
+
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=200)
+
 class ReviewPropertyOwnershipRequest(views.APIView):
     serializer_class = ReviewPropertyOwnershipSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -60,4 +110,24 @@ class PropertyOwnershipRequestsViewset(ReadOnlyModelViewSet):
             queryset = queryset.filter(user_type__iexact=user_type)
 
         queryset = queryset.order_by('-created_at')
-        return queryset
\ No newline at end of file
+        return queryset
+
+
+class RequestMetricsApiView(views.APIView):
+    """
+    Per-view request histograms and storage upload timings of this worker process;
+    ?format=prometheus for a text dump.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, PrometheusTextRenderer]
+
+    def get(self, request):
+        if request.accepted_renderer.format == PrometheusTextRenderer.format:
+            return Response(
+                request_metrics.as_prometheus_text() + storage_upload_metrics.as_prometheus_text(), status=200)
+
+        return Response({
+            'requests': request_metrics.as_dict(),
+            'storage_uploads': storage_upload_metrics.as_dict(),
+        }, status=200)
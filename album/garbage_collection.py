@@ -0,0 +1,152 @@
+from datetime import timedelta
+from django.apps import apps
+from django.db import connection, models, transaction
+from django.db.models import Q, Exists, OuterRef
+from django.utils import timezone
+
+from .models import (MediaAlbum, MediaFiles, DirectUpload, StorageDeletion, ContentBlob,
+                     CHOICES_FOR_UPLOAD_STATUS, BLOB_STORAGE_PREFIX)
+from utils.storage import get_bulk_storage_backend
+from utils.constants import STORAGE_GC_GRACE_PERIOD, STORAGE_GC_BATCH_SIZE, STORAGE_GC_REFERENCE_CHUNK_SIZE
+
+
+def get_album_references():
+    """(model, field) of every foreign key to MediaAlbum."""
+    return [(field.related_model, field.field.name) for field in MediaAlbum._meta.get_fields()
+            if field.is_relation and field.auto_created and not field.concrete]
+
+
+def get_orphaned_albums(grace_period=STORAGE_GC_GRACE_PERIOD):
+    """Albums no record points to any more, e.g. those of deleted properties and users."""
+    queryset = MediaAlbum.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=grace_period))
+    for model, field in get_album_references():
+        if model is not MediaFiles:
+            queryset = queryset.filter(~Exists(model.objects.filter(**{field: OuterRef('pk')})))
+    return queryset
+
+
+def delete_orphaned_albums(batch_size=STORAGE_GC_BATCH_SIZE, grace_period=STORAGE_GC_GRACE_PERIOD):
+    """
+    Delete orphaned albums batch by batch; their media rows go with them and queue
+    their files for deletion. Returns the number of albums deleted.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            ## the row locks stop a record from being pointed at an album between
+            ## the orphan check and the delete, which would otherwise cascade to it
+            ids = list(get_orphaned_albums(grace_period).select_for_update(skip_locked=True).values_list(
+                'id', flat=True)[:batch_size])
+            MediaAlbum.objects.filter(id__in=ids).delete()
+
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def expire_direct_uploads():
+    """Drop upload slots that expired unused, queueing whatever was uploaded to them."""
+    with transaction.atomic():
+        expired = DirectUpload.objects.filter(status=CHOICES_FOR_UPLOAD_STATUS[0][0], expires_at__lt=timezone.now())
+        StorageDeletion.enqueue(expired.values_list('key', flat=True))
+        return expired.delete()[0]
+
+
+def get_file_fields():
+    """(model, file fields, variants fields) of every model that keeps files in storage."""
+    for model in apps.get_models():
+        fields = [field for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+        if fields:
+            field_names = {field.name for field in model._meta.concrete_fields}
+            yield model, fields, [f'{field.name}_variants' for field in fields
+                                  if f'{field.name}_variants' in field_names]
+
+
+def get_referenced_names(prefix=''):
+    """
+    Every storage name under `prefix` still recorded on a row, as a file or an image
+    derivative. Built once per sweep with server-side cursors: checking each page or
+    batch against the tables would scan the unindexed file and variants columns every time.
+    """
+    referenced = set(DirectUpload.objects.filter(key__startswith=prefix).values_list(
+        'key', flat=True).iterator(chunk_size=STORAGE_GC_REFERENCE_CHUNK_SIZE))
+
+    for model, fields, variants_fields in get_file_fields():
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field.name}__startswith': prefix}) & ~Q(**{field.name: ''})
+        rows = model.objects.filter(condition).values_list(*[field.name for field in fields])
+        for row in rows.iterator(chunk_size=STORAGE_GC_REFERENCE_CHUNK_SIZE):
+            referenced.update(name for name in row if name and name.startswith(prefix))
+
+        for variants_field in variants_fields:
+            column = model._meta.get_field(variants_field).column
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(
+                    f'SELECT variant.name #>> \'{{}}\' FROM "{model._meta.db_table}" '
+                    f'CROSS JOIN LATERAL jsonb_path_query("{column}", \'$.*.*\') AS variant(name) '
+                    f'WHERE "{column}" <> \'{{}}\' AND starts_with(variant.name #>> \'{{}}\', %s)', [prefix])
+                referenced.update(name for name, in cursor)
+
+    return referenced
+
+
+def release_unreferenced_blobs(batch_size=STORAGE_GC_BATCH_SIZE, grace_period=STORAGE_GC_GRACE_PERIOD):
+    """
+    Delete content blobs no file field points to any more, whatever their reference
+    count says. Counts can only drift upwards, e.g. when a row's file is replaced or
+    a process dies between storing a submission and saving its rows.
+    Returns the number of blobs released.
+    """
+    cutoff, last_id, total = timezone.now() - timedelta(seconds=grace_period), 0, 0
+    ## a reference taken after this moves the blob's updated_at past the cutoff, out of the sweep
+    referenced = get_referenced_names(BLOB_STORAGE_PREFIX)
+    while True:
+        with transaction.atomic():
+            ## updated_at moves whenever a reference is taken, and the lock holds off new ones
+            blobs = list(ContentBlob.objects.select_for_update(skip_locked=True).filter(
+                id__gt=last_id, updated_at__lt=cutoff).order_by('id')[:batch_size])
+            unreferenced = [blob for blob in blobs if blob.name not in referenced]
+
+            ContentBlob.objects.filter(id__in=[blob.id for blob in unreferenced]).delete()
+            StorageDeletion.enqueue(blob.name for blob in unreferenced)
+
+        total += len(unreferenced)
+        if len(blobs) < batch_size:
+            return total
+        last_id = blobs[-1].id
+
+
+def collect_orphaned_objects(prefix='', grace_period=STORAGE_GC_GRACE_PERIOD, dry_run=False):
+    """
+    Page through the storage listing and delete, one bulk request per page, the
+    objects no row refers to. Objects younger than the grace period are left alone,
+    since uploads are stored before the rows recording them are committed.
+    Returns (objects listed, objects deleted, bytes deleted, errors).
+    """
+    backend = get_bulk_storage_backend()
+    cutoff = timezone.now() - timedelta(seconds=grace_period)
+    listed = deleted = deleted_bytes = errors = 0
+    referenced = None
+
+    for page in backend.list(prefix):
+        listed += len(page)
+        candidates = {name: size for name, modified, size in page if modified < cutoff}
+        if not candidates:
+            continue
+
+        ## taken once, when the listing first reaches objects old enough to go; rows written during the
+        ## sweep record objects stored just before them, which the grace period leaves alone
+        if referenced is None:
+            referenced = get_referenced_names(prefix)
+
+        ## a blob's object stays while the blob does; release_unreferenced_blobs decides when it goes
+        orphans = set(candidates) - referenced - set(
+            ContentBlob.objects.filter(name__in=candidates).values_list('name', flat=True))
+        failed = {} if dry_run or not orphans else backend.delete(orphans)
+
+        deleted += len(orphans) - len(failed)
+        deleted_bytes += sum(candidates[name] for name in orphans if name not in failed)
+        errors += len(failed)
+
+    return listed, deleted, deleted_bytes, errors
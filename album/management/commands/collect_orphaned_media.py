@@ -0,0 +1,40 @@
+import json
+from django.core.management.base import BaseCommand
+
+from album.garbage_collection import (get_orphaned_albums, delete_orphaned_albums, expire_direct_uploads,
+                                      release_unreferenced_blobs, collect_orphaned_objects)
+from utils.constants import STORAGE_GC_GRACE_PERIOD, STORAGE_GC_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Delete media albums and storage objects that no record refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=STORAGE_GC_BATCH_SIZE,
+                            help='albums deleted, or content blobs checked, per transaction')
+        parser.add_argument('--grace-hours', type=float, default=STORAGE_GC_GRACE_PERIOD / 3600,
+                            help='leave albums and objects younger than this alone')
+        parser.add_argument('--prefix', default='', help='only sweep storage objects under this prefix')
+        parser.add_argument('--skip-storage', action='store_true',
+                            help='only delete orphaned albums, blobs and expired upload slots, without listing storage')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='count orphaned albums and objects without deleting anything')
+
+    def handle(self, *args, **options):
+        grace_period = options['grace_hours'] * 3600
+
+        if options['dry_run']:
+            report = {'albums': get_orphaned_albums(grace_period).count()}
+        else:
+            report = {
+                'albums': delete_orphaned_albums(options['batch_size'], grace_period),
+                'expired_direct_uploads': expire_direct_uploads(),
+                'blobs_released': release_unreferenced_blobs(options['batch_size'], grace_period),
+            }
+
+        if not options['skip_storage']:
+            ## after the albums, so the objects of their media are already off the rows when the listing is checked
+            report['objects_listed'], report['objects_deleted'], report['bytes_deleted'], report['errors'] = \
+                collect_orphaned_objects(options['prefix'], grace_period, options['dry_run'])
+
+        self.stdout.write(json.dumps(report))
@@ -0,0 +1,76 @@
+import json
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from album.models import ImageDerivativeJob, MediaFiles
+from properties.models import Property
+from users.models import User, Company
+from utils.images import process_image_derivative_jobs
+from utils.constants import IMAGE_DERIVATIVE_BATCH_SIZE
+
+## every image field that gets derivatives, with the column they are recorded in
+IMAGE_FIELDS = [
+    (MediaFiles, 'image'),
+    (Property, 'default_image'),
+    (User, 'display_photo'),
+    (Company, 'company_logo'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/AVIF/JPEG copies of uploaded images with a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=IMAGE_DERIVATIVE_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=5, help='seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='drain the queue and exit')
+        parser.add_argument('--stats', action='store_true', help='print queue depth metrics and exit')
+        parser.add_argument('--enqueue-missing', action='store_true',
+                            help='first queue every stored image that has no derivatives yet')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(ImageDerivativeJob.get_queue_metrics()))
+            return
+
+        if options['enqueue_missing']:
+            for model, field in IMAGE_FIELDS:
+                images = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).filter(
+                    **{f'{field}_variants': {}}).only('pk', field)
+                batch = []
+                for instance in images.iterator(chunk_size=1000):
+                    batch.append(instance)
+                    if len(batch) == 1000:
+                        ImageDerivativeJob.enqueue(batch, field)
+                        batch = []
+                ImageDerivativeJob.enqueue(batch, field)
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        def work():
+            try:
+                while not stop.is_set():
+                    if process_image_derivative_jobs(options['batch_size']) == 0:
+                        if options['once']:
+                            break
+                        stop.wait(options['interval'])
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=work) for _ in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+        self.stdout.write(json.dumps(ImageDerivativeJob.get_queue_metrics()))
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivativeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=64)),
+                ('field', models.CharField(max_length=100)),
+                ('source', models.CharField(max_length=500)),
+                ('status', models.CharField(choices=[('PENDING', 'waiting to be processed'), ('PROCESSING', 'claimed by a worker'), ('DONE', 'derivatives stored'), ('FAILED', 'gave up after the maximum number of attempts')], default='PENDING', max_length=256)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ImageDerivativeJobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='mediafiles',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddIndex(
+            model_name='imagederivativejob',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='image_derivative_queue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='imagederivativejob',
+            constraint=models.UniqueConstraint(fields=('model', 'object_id', 'field', 'source'), name='unique_image_derivative_job'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('album', '0002_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('field', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=500, unique=True)),
+                ('content_type', models.CharField(max_length=255)),
+                ('size', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('PENDING', 'waiting for the client to upload'), ('USED', 'attached to a record')], default='PENDING', max_length=256)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'DirectUploads',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='directupload',
+            index=models.Index(fields=['status', 'expires_at'], name='direct_uploads_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album', '0003_direct_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500, unique=True)),
+                ('status', models.CharField(choices=[('PENDING', 'waiting to be deleted from storage'), ('FAILED', 'gave up after the maximum number of attempts')], default='PENDING', max_length=256)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'StorageDeletions',
+            },
+        ),
+        migrations.AddField(
+            model_name='mediaalbum',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='storagedeletion',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='storage_deletion_queue_idx'),
+        ),
+    ]
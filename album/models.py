@@ -1,4 +1,10 @@
-from django.db import models
+import os
+import uuid
+from collections import Counter
+from typing import Dict, Union
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, Min, F
 from django.utils import timezone
 
 
@@ -9,6 +15,9 @@ MEDIA_TYPE_CHOICES = [
 
 class MediaAlbum(models.Model):
 
+    ## lets the orphan collector leave albums alone while the request creating them is still running
+    created_at = models.DateTimeField(auto_now_add=True)
+
     class Meta:
         db_table = 'MediaAlbums'
 
@@ -40,6 +49,8 @@ class MediaFiles(models.Model):
     )
     album = models.ForeignKey(
         MediaAlbum, related_name='media', on_delete=models.CASCADE)
+    ## {width: {format: storage name}}, filled in by the image derivative worker
+    image_variants = models.JSONField(default=dict, blank=True)
 
     class Meta:
         db_table = 'MediaFiles'
@@ -51,3 +62,248 @@ class MediaFiles(models.Model):
     def delete_document_from_storage(self):
         if self.document:
             self.document.delete(save=False)
+
+
+CHOICES_FOR_DERIVATIVE_STATUS = [
+    ("PENDING", "waiting to be processed"),
+    ("PROCESSING", "claimed by a worker"),
+    ("DONE", "derivatives stored"),
+    ("FAILED", "gave up after the maximum number of attempts"),
+]
+
+
+class ImageDerivativeJob(models.Model):
+    """
+    Queue of uploaded images waiting for their resized/re-encoded copies. The
+    derivatives land in `<field>_variants` of the row the image belongs to.
+    """
+
+    model = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=64)
+    field = models.CharField(max_length=100)
+    source = models.CharField(max_length=500)
+    status = models.CharField(
+        max_length=256,
+        choices=CHOICES_FOR_DERIVATIVE_STATUS,
+        default=CHOICES_FOR_DERIVATIVE_STATUS[0][0])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "ImageDerivativeJobs"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='image_derivative_queue_idx'),
+            models.Index(fields=['source'], name='image_derivative_source_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id', 'field', 'source'],
+                                    name='unique_image_derivative_job'),
+        ]
+
+    @classmethod
+    def enqueue(cls, instances, field: str):
+        """Queue derivatives of `field` for saved model instances; images already queued are skipped."""
+        cls.objects.bulk_create([
+            cls(model=instance._meta.label, object_id=str(instance.pk), field=field,
+                source=getattr(instance, field).name)
+            for instance in instances if getattr(instance, field)
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def get_queue_metrics(cls) -> Dict[str, Union[int, float, None]]:
+        metrics = {status: 0 for status, _ in CHOICES_FOR_DERIVATIVE_STATUS}
+        for row in cls.objects.values('status').annotate(total=Count('id')):
+            metrics[row['status']] = row['total']
+
+        oldest = cls.objects.filter(
+            status=CHOICES_FOR_DERIVATIVE_STATUS[0][0]).aggregate(oldest=Min('created_at'))['oldest']
+        metrics['oldest_pending_seconds'] = (timezone.now() - oldest).total_seconds() if oldest else None
+
+        return metrics
+
+
+CHOICES_FOR_UPLOAD_STATUS = [
+    ("PENDING", "waiting for the client to upload"),
+    ("USED", "attached to a record"),
+]
+
+
+class DirectUpload(models.Model):
+    """
+    A storage key handed to a client to upload to directly, through a presigned URL.
+    The API only records the key once the object is there and attached to a record.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    field = models.CharField(max_length=100)
+    key = models.CharField(max_length=500, unique=True)
+    content_type = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=256,
+        choices=CHOICES_FOR_UPLOAD_STATUS,
+        default=CHOICES_FOR_UPLOAD_STATUS[0][0])
+    expires_at = models.DateTimeField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "DirectUploads"
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='direct_uploads_expiry_idx'),
+        ]
+
+    @classmethod
+    def mark_used(cls, uploads):
+        """Claim pending uploads and return how many were claimed. The update takes the row locks, so inside a
+        transaction a concurrent request attaching the same slot waits for it and then finds the slot used."""
+        return cls.objects.filter(
+            id__in=[upload.id for upload in uploads], status=CHOICES_FOR_UPLOAD_STATUS[0][0],
+        ).update(status=CHOICES_FOR_UPLOAD_STATUS[1][0], updated_at=timezone.now())
+
+
+def get_stored_names(instance):
+    """Storage names of every file of a model instance, including its image derivatives."""
+    names = []
+    for field in instance._meta.concrete_fields:
+        if isinstance(field, models.FileField):
+            file = getattr(instance, field.attname)
+            if file:
+                names.append(file.name)
+            ## {width: {format: storage name}} beside every image that has derivatives
+            for formats in (getattr(instance, f'{field.name}_variants', None) or {}).values():
+                names += formats.values()
+    return names
+
+
+CHOICES_FOR_DELETION_STATUS = [
+    ("PENDING", "waiting to be deleted from storage"),
+    ("FAILED", "gave up after the maximum number of attempts"),
+]
+
+
+class StorageDeletion(models.Model):
+    """
+    Queue of storage objects whose rows are gone. Rows are inserted in the same
+    transaction as the delete, so a file is never removed for a rollback, and a
+    request never waits on the storage backend. A row is dropped once deleted.
+    """
+
+    name = models.CharField(max_length=500, unique=True)
+    status = models.CharField(
+        max_length=256,
+        choices=CHOICES_FOR_DELETION_STATUS,
+        default=CHOICES_FOR_DELETION_STATUS[0][0])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "StorageDeletions"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='storage_deletion_queue_idx'),
+        ]
+
+    @classmethod
+    def enqueue(cls, names):
+        """Queue storage names for deletion; names already queued are skipped."""
+        cls.objects.bulk_create([cls(name=name) for name in set(names) if name], ignore_conflicts=True)
+
+    @classmethod
+    def get_queue_metrics(cls) -> Dict[str, Union[int, float, None]]:
+        metrics = {status: 0 for status, _ in CHOICES_FOR_DELETION_STATUS}
+        for row in cls.objects.values('status').annotate(total=Count('id')):
+            metrics[row['status']] = row['total']
+
+        oldest = cls.objects.filter(
+            status=CHOICES_FOR_DELETION_STATUS[0][0]).aggregate(oldest=Min('created_at'))['oldest']
+        metrics['oldest_pending_seconds'] = (timezone.now() - oldest).total_seconds() if oldest else None
+
+        return metrics
+
+
+BLOB_STORAGE_PREFIX = 'blobs/'
+
+
+def get_content_addressed_name(content_hash, filename):
+    """Storage name of a blob: its SHA-256, fanned out by the first byte, keeping the file's extension."""
+    return f'{BLOB_STORAGE_PREFIX}{content_hash[:2]}/{content_hash}{os.path.splitext(filename)[1].lower()}'
+
+
+class ContentBlob(models.Model):
+    """
+    One stored copy of a file's content, shared by every row that uploaded the same
+    bytes. reference_count is the number of file fields pointing at it; the object
+    (and any derivatives beside it) is only deleted once that drops to zero.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=500, unique=True)
+    size = models.PositiveBigIntegerField()
+    reference_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "ContentBlobs"
+
+    @classmethod
+    def acquire(cls, content_hashes: Dict[str, int]) -> Dict[str, str]:
+        """Take {sha256: references} on blobs already stored. Returns {sha256: name} of those found."""
+        with transaction.atomic():
+            ## row locks, so a blob can't be freed by a concurrent release() while it gains references
+            blobs = list(cls.objects.select_for_update().filter(sha256__in=content_hashes).order_by('id'))
+            for blob in blobs:
+                cls.objects.filter(id=blob.id).update(
+                    reference_count=F('reference_count') + content_hashes[blob.sha256], updated_at=timezone.now())
+        return {blob.sha256: blob.name for blob in blobs}
+
+    @classmethod
+    def create_or_acquire(cls, sha256: str, name: str, size: int, references: int) -> str:
+        """
+        Record a blob just stored under `name`, or, if another upload of the same content
+        got there first, take the references on that one instead. Returns the name to use.
+        """
+        while True:
+            blob, created = cls.objects.get_or_create(
+                sha256=sha256, defaults={'name': name, 'size': size, 'reference_count': references})
+            if created:
+                return blob.name
+            ## only misses if the other copy was released in between
+            acquired = cls.acquire({sha256: references})
+            if acquired:
+                return acquired[sha256]
+
+    @classmethod
+    def release(cls, names):
+        """
+        Drop one reference per occurrence of a blob's name in `names`. Returns the names
+        that may now be deleted from storage: freed blobs, and anything that is neither a
+        blob still in use nor one of its image derivatives.
+        """
+        references = Counter(names)
+        with transaction.atomic():
+            blobs = list(cls.objects.select_for_update().filter(name__in=references).order_by('id'))
+            freed = [blob for blob in blobs if blob.reference_count <= references[blob.name]]
+            kept = [blob for blob in blobs if blob not in freed]
+
+            cls.objects.filter(id__in=[blob.id for blob in freed]).delete()
+            for blob in kept:
+                cls.objects.filter(id=blob.id).update(
+                    reference_count=F('reference_count') - references[blob.name], updated_at=timezone.now())
+
+        ## derivatives are stored beside their source as <name>_w<width>.<format>
+        kept_names = {blob.name for blob in kept}
+        kept_stems = tuple(f'{os.path.splitext(blob.name)[0]}_w' for blob in kept)
+        return [name for name in references if name not in kept_names and not name.startswith(kept_stems)]
@@ -1,13 +1,30 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
 from .models import MediaAlbum, MediaFiles
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """A `<field>_variants` column as {width: {format: url}}, for building srcset/<picture> sources."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        variants = {}
+        for width, formats in (value or {}).items():
+            variants[width] = {}
+            for format, name in formats.items():
+                url = default_storage.url(name)
+                variants[width][format] = request.build_absolute_uri(url) if request else url
+        return variants
+
+
 class MediaFilesSerializer (serializers.ModelSerializer):
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = MediaFiles
-        fields = ['image', 'document', 'id']
+        fields = ['image', 'document', 'id', 'image_variants']
 
 
 class MediaAlbumSerializer (serializers.ModelSerializer):
@@ -0,0 +1,221 @@
+import os
+import time
+import shutil
+import tempfile
+from io import BytesIO
+from datetime import timedelta
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from . import garbage_collection
+from .garbage_collection import delete_orphaned_albums, collect_orphaned_objects, release_unreferenced_blobs
+from .models import MediaAlbum, MediaFiles, ImageDerivativeJob, StorageDeletion, ContentBlob
+from .serializers import MediaFilesSerializer
+from users.models import User
+from utils.images import process_image_derivative_jobs, get_derivative_formats
+from utils.storage import process_storage_deletions, LocalBulkStorageBackend
+from utils.constants import IMAGE_DERIVATIVE_MAX_ATTEMPTS, IMAGE_DERIVATIVE_CLAIM_TIMEOUT
+
+
+class ImageDerivativesTestCase(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, FILE_UPLOAD_STORAGE='local')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.album = MediaAlbum.objects.create()
+
+    def upload(self, size, mode='RGB', format='PNG'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, format)
+        media = MediaFiles(album=self.album, media_type='IMAGE')
+        media.image.save(f'photo.{format.lower()}', ContentFile(buffer.getvalue()), save=False)
+        media.save()
+        ImageDerivativeJob.enqueue([media], 'image')
+        return media
+
+    def test_generates_each_width_and_format(self):
+        media = self.upload((1600, 1200), mode='RGBA')
+        self.assertEqual(process_image_derivative_jobs(), 1)
+
+        media.refresh_from_db()
+        self.assertEqual(list(media.image_variants), ['320', '640', '1280'])
+        for width, formats in media.image_variants.items():
+            self.assertCountEqual(formats, [format.lower() for format in get_derivative_formats()])
+            with default_storage.open(formats['webp']) as file:
+                self.assertEqual(Image.open(file).size, (int(width), int(width) * 3 // 4))
+
+        self.assertEqual(ImageDerivativeJob.objects.get().status, 'DONE')
+        self.assertTrue(MediaFilesSerializer(media).data['image_variants']['320']['webp'].endswith('_w320.webp'))
+
+    def test_small_image_is_only_reencoded(self):
+        media = self.upload((200, 100), format='JPEG')
+        process_image_derivative_jobs()
+
+        media.refresh_from_db()
+        self.assertEqual(list(media.image_variants), ['200'])
+
+    def test_replaced_image_discards_derivatives(self):
+        media = self.upload((800, 600))
+        directory = media.image.name.rsplit('/', 1)[0]
+        MediaFiles.objects.filter(id=media.id).update(image='album/images/other.png')
+        process_image_derivative_jobs()
+
+        media.refresh_from_db()
+        self.assertEqual(media.image_variants, {})
+        self.assertEqual(default_storage.listdir(directory)[1], ['photo.png'])
+
+    def test_deduplicated_image_shares_derivatives(self):
+        media = self.upload((800, 600))
+        name = default_storage.save('blobs/ab/abcd.png', default_storage.open(media.image.name))
+        ContentBlob.objects.create(sha256='abcd', name=name, size=1, reference_count=2)
+        MediaFiles.objects.filter(id=media.id).update(image=name)
+        ImageDerivativeJob.enqueue([MediaFiles.objects.get(id=media.id)], 'image')
+        process_image_derivative_jobs()
+
+        copy = MediaFiles.objects.create(album=self.album, image=name)
+        ImageDerivativeJob.enqueue([copy], 'image')
+        process_image_derivative_jobs()
+
+        media.refresh_from_db()
+        copy.refresh_from_db()
+        self.assertEqual(copy.image_variants, media.image_variants)
+        self.assertEqual(len(default_storage.listdir('blobs/ab')[1]), 1 + 2 * len(get_derivative_formats()))
+
+    def test_unreadable_image_is_retried(self):
+        media = MediaFiles.objects.create(album=self.album, media_type='IMAGE',
+                                          image=default_storage.save('album/images/broken.png', ContentFile(b'nope')))
+        ImageDerivativeJob.enqueue([media], 'image')
+        process_image_derivative_jobs()
+
+        job = ImageDerivativeJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('PENDING', 1))
+        self.assertIn('UnidentifiedImageError', job.last_error)
+
+
+    def test_timed_out_claims_are_retried_until_the_last_attempt(self):
+        timed_out = timezone.now() - timedelta(seconds=IMAGE_DERIVATIVE_CLAIM_TIMEOUT + 1)
+        retried = self.upload((200, 100))
+        exhausted = self.upload((300, 200))
+        ImageDerivativeJob.objects.filter(object_id=retried.id).update(
+            status='PROCESSING', attempts=1, claimed_at=timed_out)
+        ImageDerivativeJob.objects.filter(object_id=exhausted.id).update(
+            status='PROCESSING', attempts=IMAGE_DERIVATIVE_MAX_ATTEMPTS, claimed_at=timed_out)
+
+        self.assertEqual(process_image_derivative_jobs(), 1)
+
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(list(retried.image_variants), ['200'])
+        self.assertEqual(exhausted.image_variants, {})
+        self.assertEqual(
+            set(ImageDerivativeJob.objects.values_list('object_id', 'status', 'attempts')),
+            {(str(retried.id), 'DONE', 2), (str(exhausted.id), 'FAILED', IMAGE_DERIVATIVE_MAX_ATTEMPTS)})
+
+
+class StorageGarbageCollectionTestCase(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, FILE_UPLOAD_STORAGE='local')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def store(self, name, age=None):
+        name = default_storage.save(name, ContentFile(b'data'))
+        if age is not None:
+            modified = time.time() - age.total_seconds()
+            os.utime(default_storage.path(name), (modified, modified))
+        return name
+
+    def test_deleted_media_is_queued_then_deleted_in_bulk(self):
+        album = MediaAlbum.objects.create()
+        image, variant = self.store('album/images/photo.png'), self.store('album/images/photo_w320.webp')
+        media = MediaFiles.objects.create(album=album, image=image, image_variants={'320': {'webp': variant}})
+
+        media.delete()
+        self.assertCountEqual(StorageDeletion.objects.values_list('name', flat=True), [image, variant])
+        self.assertTrue(default_storage.exists(image))
+
+        self.assertEqual(process_storage_deletions(), 2)
+        self.assertFalse(default_storage.exists(image) or default_storage.exists(variant))
+        self.assertFalse(StorageDeletion.objects.exists())
+
+    def test_failed_deletion_is_retried(self):
+        StorageDeletion.enqueue(['album/images/photo.png'])
+        with mock.patch.object(LocalBulkStorageBackend, 'delete', return_value={'album/images/photo.png': 'denied'}):
+            process_storage_deletions()
+
+        deletion = StorageDeletion.objects.get()
+        self.assertEqual((deletion.status, deletion.attempts, deletion.last_error), ('PENDING', 1, 'denied'))
+        self.assertGreater(deletion.next_attempt_at, timezone.now())
+        self.assertEqual(process_storage_deletions(), 0)
+
+    def test_orphaned_albums_are_deleted(self):
+        user = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        kept, orphaned, recent = MediaAlbum.objects.create(), MediaAlbum.objects.create(), MediaAlbum.objects.create()
+        MediaAlbum.objects.filter(id__in=[kept.id, orphaned.id]).update(created_at=timezone.now() - timedelta(days=2))
+        User.objects.filter(id=user.id).update(identity_document_album=kept)
+        MediaFiles.objects.create(album=orphaned, media_type='DOCUMENT', document='album/documents/id.pdf')
+
+        self.assertEqual(delete_orphaned_albums(), 1)
+        self.assertCountEqual(MediaAlbum.objects.values_list('id', flat=True), [kept.id, recent.id])
+        self.assertEqual(StorageDeletion.objects.get().name, 'album/documents/id.pdf')
+
+    def test_unreferenced_objects_are_swept(self):
+        old = timedelta(days=2)
+        album = MediaAlbum.objects.create()
+        image, variant = self.store('album/images/photo.png', old), self.store('album/images/photo_w320.webp', old)
+        MediaFiles.objects.create(album=album, image=image, image_variants={'320': {'webp': variant}})
+        orphan = self.store('album/images/stale_w320.webp', old)
+        recent = self.store('album/images/uploading.png')
+
+        self.assertEqual([len(page) for page in LocalBulkStorageBackend().list(page_size=3)], [3, 1])
+
+        self.assertEqual(collect_orphaned_objects(dry_run=True), (4, 1, 4, 0))
+        self.assertTrue(default_storage.exists(orphan))
+
+        self.assertEqual(collect_orphaned_objects(), (4, 1, 4, 0))
+
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(all(default_storage.exists(name) for name in [image, variant, recent]))
+
+    def test_references_are_collected_once_per_sweep(self):
+        old = timedelta(days=2)
+        album = MediaAlbum.objects.create()
+        for index in range(4):
+            MediaFiles.objects.create(album=album, image=self.store(f'album/images/{index}.png', old))
+        orphan = self.store('album/images/stale.png', old)
+
+        list_pages = LocalBulkStorageBackend.list
+        with mock.patch.object(LocalBulkStorageBackend, 'list',
+                               lambda backend, prefix='': list_pages(backend, prefix, page_size=2)), \
+                mock.patch('album.garbage_collection.get_referenced_names',
+                           wraps=garbage_collection.get_referenced_names) as get_referenced_names:
+            self.assertEqual(collect_orphaned_objects(prefix='album/'), (5, 1, 4, 0))
+
+        get_referenced_names.assert_called_once_with('album/')
+        self.assertFalse(default_storage.exists(orphan))
+
+    def test_unreferenced_blobs_are_released(self):
+        album = MediaAlbum.objects.create()
+        used, drifted = self.store('blobs/aa/aa.png'), self.store('blobs/bb/bb.png')
+        MediaFiles.objects.create(album=album, image=used)
+        ContentBlob.objects.bulk_create([
+            ContentBlob(sha256='aa', name=used, size=4, reference_count=1),
+            ContentBlob(sha256='bb', name=drifted, size=4, reference_count=3),
+        ])
+        self.assertEqual(release_unreferenced_blobs(), 0)
+
+        ContentBlob.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(release_unreferenced_blobs(batch_size=1), 1)
+        self.assertEqual(list(ContentBlob.objects.values_list('name', flat=True)), [used])
+        self.assertEqual(StorageDeletion.objects.get().name, drifted)
@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after setup so the models are ready
+from notifications.streaming import notification_stream
+
+NOTIFICATION_STREAM_PATH = '/api/v1/notifications/stream/'
+
+
+async def application(scope, receive, send):
+    # long-lived SSE streams bypass Django's request cycle, which would hold a thread per client
+    if scope['type'] == 'http' and scope['path'] == NOTIFICATION_STREAM_PATH:
+        return await notification_stream(scope, receive, send)
+
+    return await django_application(scope, receive, send)
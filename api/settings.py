@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'authentication',
     'album',
@@ -73,6 +74,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Opt-in per-request query count / timing instrumentation, read at /api/v1/admin/metrics/
+if os.environ.get('REQUEST_METRICS') == 'True':
+    MIDDLEWARE.insert(0, 'utils.metrics.RequestMetricsMiddleware')
+
 ROOT_URLCONF = 'api.urls'
 
 TEMPLATES = [
@@ -106,6 +111,35 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Local memory by default; set REDIS_URL to share the cache (and its invalidation) across workers.
+# Without it the feed caches only keep entries for a few seconds, see utils.cache.CachedListMixin
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'roofbucks-api',
+        }
+    }
+
+
+# Pub/sub behind the notification stream. PostgresPubSubBackend fans out across processes with
+# LISTEN/NOTIFY; the local backend only reaches streams held by the publishing process
+
+PUBSUB_BACKEND = os.environ.get('PUBSUB_BACKEND', 'utils.pubsub.PostgresPubSubBackend')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -158,6 +192,18 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'utils.error_handlers.custom_exception_handler',
 }
 
+# Opt-in orjson renderer/parser; without it (or without orjson installed) DRF's stdlib JSON is used
+if os.environ.get('FAST_JSON_RENDERER') == 'True':
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+        'utils.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    )
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = (
+        'utils.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    )
+
 # JWT configurations
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(days=1),
@@ -235,6 +281,16 @@ if FILE_UPLOAD_STORAGE == 's3':
     AWS_S3_VERIFY = True
     DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 
+# Where clients PUT property media directly, bypassing the web workers
+DIRECT_UPLOAD_BACKEND = os.environ.get('DIRECT_UPLOAD_BACKEND', (
+    'utils.uploads.S3DirectUploadBackend' if FILE_UPLOAD_STORAGE == 's3'
+    else 'utils.uploads.LocalDirectUploadBackend'))
+
+# Paginated listings and bulk deletes for the storage garbage collector
+BULK_STORAGE_BACKEND = os.environ.get('BULK_STORAGE_BACKEND', (
+    'utils.storage.S3BulkStorageBackend' if FILE_UPLOAD_STORAGE == 's3'
+    else 'utils.storage.LocalBulkStorageBackend'))
+
 # Use Timezones for dates
 USE_TZ = True
 warnings.filterwarnings(
@@ -0,0 +1,70 @@
+import json
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from notifications.models import Notifications
+from notifications.retention import (get_expired_notifications, prune_notifications,
+                                     drop_archive_partitions)
+from utils.constants import NOTIFICATION_RETENTION_DAYS, NOTIFICATION_RETENTION_BATCH_SIZE
+
+
+def get_table_size(table):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_total_relation_size(%s)', [f'"{table}"'])
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = 'Delete or archive notifications past their retention period, in short batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-days', type=int, default=NOTIFICATION_RETENTION_DAYS['READ'],
+                            help='keep READ notifications this many days')
+        parser.add_argument('--unread-days', type=int, default=NOTIFICATION_RETENTION_DAYS['UNREAD'],
+                            help='keep UNREAD notifications this many days')
+        parser.add_argument('--keep-unread', action='store_true', help='never prune UNREAD notifications')
+        parser.add_argument('--batch-size', type=int, default=NOTIFICATION_RETENTION_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0, help='seconds to sleep between batches')
+        parser.add_argument('--archive', action='store_true',
+                            help='move rows to the monthly-partitioned NotificationsArchive instead of deleting')
+        parser.add_argument('--drop-archive-months', type=int,
+                            help='drop archive partitions older than this many months')
+        parser.add_argument('--vacuum', action='store_true', help='VACUUM ANALYZE Notifications afterwards')
+        parser.add_argument('--dry-run', action='store_true', help='only count the expired rows')
+
+    def handle(self, *args, **options):
+        retention_days = {
+            'READ': options['read_days'],
+            'UNREAD': None if options['keep_unread'] else options['unread_days'],
+        }
+        table = Notifications._meta.db_table
+
+        if options['dry_run']:
+            self.stdout.write(json.dumps({'expired_rows': get_expired_notifications(retention_days).count()}))
+            return
+
+        table_bytes_before = get_table_size(table)
+        rows, row_bytes = prune_notifications(
+            retention_days, options['batch_size'], options['archive'], options['pause'])
+
+        report = {
+            'rows': rows,
+            'archived': options['archive'],
+            'row_bytes': row_bytes,
+        }
+
+        if options['vacuum']:
+            ## space freed by DELETE is only reusable after a vacuum, and only returned to the OS by VACUUM FULL
+            with connection.cursor() as cursor:
+                cursor.execute(f'VACUUM ANALYZE "{table}"')
+
+        report['table_bytes_before'] = table_bytes_before
+        report['table_bytes_after'] = get_table_size(table)
+
+        if options['drop_archive_months'] is not None:
+            cutoff = timezone.now() - timedelta(days=31 * options['drop_archive_months'])
+            report['archive_partitions_dropped'], report['archive_bytes_dropped'] = drop_archive_partitions(cutoff)
+
+        self.stdout.write(json.dumps(report))
@@ -0,0 +1,52 @@
+import json
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from notifications.models import EmailOutbox
+from utils.email import send_queued_emails
+from utils.constants import EMAIL_OUTBOX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Deliver mail queued in the EmailOutbox table with a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=EMAIL_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=5, help='seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='drain the queue and exit')
+        parser.add_argument('--stats', action='store_true', help='print queue depth metrics and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(EmailOutbox.get_queue_metrics()))
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        def work():
+            try:
+                while not stop.is_set():
+                    if send_queued_emails(options['batch_size']) == 0:
+                        if options['once']:
+                            break
+                        stop.wait(options['interval'])
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=work) for _ in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+        self.stdout.write(json.dumps(EmailOutbox.get_queue_metrics()))
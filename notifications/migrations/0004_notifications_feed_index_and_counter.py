@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_stages_of_kyc_verification'),
+        ('notifications', '0003_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'NotificationCounters',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='notifications_user_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notifications_feed_index_and_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_id', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('UNREAD', 'unread notifications'), ('READ', 'read notifications')], max_length=256)),
+                ('user_role', models.CharField(choices=[('SHAREHOLDER', 'ShareHolder/Customers/Buyers'), ('AGENT', 'Real Estate Agent')], max_length=256)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'NotificationsArchive',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(
+            sql='''
+                CREATE TABLE "NotificationsArchive" (
+                    "id" bigint NOT NULL,
+                    "user_id" bigint NOT NULL,
+                    "status" varchar(256) NOT NULL,
+                    "user_role" varchar(256) NOT NULL,
+                    "message" text NULL,
+                    "created_at" timestamp with time zone NOT NULL,
+                    "updated_at" timestamp with time zone NOT NULL,
+                    "archived_at" timestamp with time zone NOT NULL,
+                    PRIMARY KEY ("id", "created_at")
+                ) PARTITION BY RANGE ("created_at");
+                CREATE INDEX "notifications_archive_user_idx" ON "NotificationsArchive" ("user_id", "created_at");
+            ''',
+            reverse_sql='DROP TABLE "NotificationsArchive";',
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(condition=models.Q(('status', 'READ')), fields=['created_at'], name='notifications_read_age_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notifications_retention'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(condition=models.Q(('status', 'UNREAD')), fields=['created_at'], name='notifications_unread_age_idx'),
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models, transaction
+from django.db.models import Count, Min, F, Q, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from typing import Union, List, Dict
 
 from users.models import User, USER_ROLES
+from utils.pubsub import publish
 
 CHOICES_FOR_STATUS = [
     ("UNREAD", "unread notifications"),
@@ -27,6 +31,13 @@ class Notifications(models.Model):
 
     class Meta:
         db_table = "Notifications"
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notifications_user_feed_idx'),
+            ## let the retention job find expired rows of each status without scanning the table
+            models.Index(fields=['created_at'], condition=models.Q(status='READ'), name='notifications_read_age_idx'),
+            models.Index(fields=['created_at'], condition=models.Q(status='UNREAD'),
+                         name='notifications_unread_age_idx'),
+        ]
 
     @classmethod
     @transaction.atomic
@@ -36,6 +47,8 @@ class Notifications(models.Model):
                 user=user, 
                 user_role = user.role, 
                 message=message)
+            NotificationCounter.increment({user.id: 1})
+            transaction.on_commit(lambda: publish_notifications([notification]))
 
             return notification
             
@@ -58,7 +71,155 @@ class Notifications(models.Model):
 
             notifications = cls.objects.bulk_create(notificationList)
 
+            unread = {}
+            for notification in notifications:
+                unread[notification.user_id] = unread.get(notification.user_id, 0) + 1
+            NotificationCounter.increment(unread)
+            transaction.on_commit(lambda: publish_notifications(notifications))
+
             return notifications
             
         except Exception as e:
             raise e
+
+    @classmethod
+    @transaction.atomic
+    def mark_as_read(cls, user: User, up_to=None) -> int:
+        """
+        Mark the user's unread notifications as read in a single UPDATE, either all
+        of them or those up to and including notification `up_to` in feed order.
+        Returns the number of notifications marked.
+        """
+        notifications = cls.objects.filter(user=user, status=CHOICES_FOR_STATUS[0][0])
+
+        if up_to is not None:
+            ## feed order is (-created_at, -id), so "up to" means older than or equal to that row
+            created_at = Subquery(cls.objects.filter(user=user, id=up_to).values('created_at'))
+            notifications = notifications.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lte=up_to))
+
+        updated = notifications.update(status=CHOICES_FOR_STATUS[1][0], updated_at=timezone.now())
+        NotificationCounter.decrement(user.id, updated)
+
+        return updated
+
+
+def publish_notifications(notifications: List[Notifications]):
+    """Push new notifications to their users' open notification streams, in one publish."""
+    publish((notification.user_id, {
+        'id': notification.id,
+        'status': notification.status,
+        'message': notification.message,
+        'created_at': notification.created_at.isoformat().replace('+00:00', 'Z'),
+    }) for notification in notifications)
+
+
+class NotificationCounter(models.Model):
+    """
+    Unread notifications per user, kept in step with Notifications so the unread
+    badge is a primary key lookup instead of a COUNT over the user's notifications.
+    A user's row is created on first read from an actual count; until then there is
+    nothing to keep in step.
+    """
+
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE)
+    unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "NotificationCounters"
+
+    @classmethod
+    def get_unread(cls, user: User) -> int:
+        counter = cls.objects.filter(user=user).first()
+        if counter is None:
+            counter = cls.recount(user)
+        return counter.unread
+
+    @classmethod
+    def recount(cls, user: User):
+        unread = Notifications.objects.filter(user=user, status=CHOICES_FOR_STATUS[0][0]).count()
+        counter, _ = cls.objects.update_or_create(user=user, defaults={'unread': unread})
+        return counter
+
+    @classmethod
+    def increment(cls, unread_by_user: Dict[int, int]):
+        for user_id, count in unread_by_user.items():
+            cls.objects.filter(user_id=user_id).update(unread=F('unread') + count)
+
+    @classmethod
+    def decrement(cls, user_id: int, count: int):
+        if count:
+            cls.objects.filter(user_id=user_id).update(unread=Greatest(F('unread') - count, 0))
+
+
+class ArchivedNotification(models.Model):
+    """
+    Notifications moved out by the retention job. The table is range-partitioned by
+    month of created_at (see migration 0005), so old months are dropped whole instead
+    of deleted row by row. Postgres owns the schema, hence managed = False.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    ## plain ids: archived rows outlive the users they belonged to
+    user_id = models.BigIntegerField()
+    status = models.CharField(max_length=256, choices=CHOICES_FOR_STATUS)
+    user_role = models.CharField(max_length=256, choices=USER_ROLES)
+    message = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        managed = False
+        db_table = "NotificationsArchive"
+
+
+CHOICES_FOR_EMAIL_STATUS = [
+    ("PENDING", "waiting to be sent"),
+    ("SENDING", "claimed by a worker"),
+    ("SENT", "delivered to the mail server"),
+    ("FAILED", "gave up after the maximum number of attempts"),
+]
+
+
+class EmailOutbox(models.Model):
+
+    to_email = models.EmailField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(
+        max_length=256,
+        choices=CHOICES_FOR_EMAIL_STATUS,
+        default=CHOICES_FOR_EMAIL_STATUS[0][0])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "EmailOutbox"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_queue_idx'),
+        ]
+
+    @classmethod
+    def enqueue(cls, to_email: str, subject: str, body: str):
+        return cls.objects.create(to_email=to_email, subject=subject, body=body)
+
+    @classmethod
+    def get_queue_metrics(cls) -> Dict[str, Union[int, float, None]]:
+        """Queue depth per status and the age in seconds of the oldest pending mail."""
+        metrics = {status: 0 for status, _ in CHOICES_FOR_EMAIL_STATUS}
+        for row in cls.objects.values('status').annotate(total=Count('id')):
+            metrics[row['status']] = row['total']
+
+        oldest = cls.objects.filter(
+            status=CHOICES_FOR_EMAIL_STATUS[0][0]).aggregate(oldest=Min('created_at'))['oldest']
+        metrics['oldest_pending_seconds'] = (timezone.now() - oldest).total_seconds() if oldest else None
+
+        return metrics
@@ -0,0 +1,123 @@
+import time
+from datetime import timedelta, datetime, timezone as dt_timezone
+from typing import Dict, Optional
+from django.db import connection, transaction
+from django.db.models import Q, Count
+from django.utils import timezone
+
+from .models import Notifications, ArchivedNotification, NotificationCounter, CHOICES_FOR_STATUS
+from utils.constants import NOTIFICATION_RETENTION_DAYS, NOTIFICATION_RETENTION_BATCH_SIZE
+
+ARCHIVE_TABLE = ArchivedNotification._meta.db_table
+
+
+def get_expired_notifications(retention_days: Dict[str, Optional[int]] = NOTIFICATION_RETENTION_DAYS):
+    """Notifications older than the retention period of their status."""
+    now = timezone.now()
+    condition = Q()
+    for status, days in retention_days.items():
+        if days is not None:
+            condition |= Q(status=status, created_at__lt=now - timedelta(days=days))
+
+    if not condition:
+        return Notifications.objects.none()
+    return Notifications.objects.filter(condition)
+
+
+def get_archive_partition_name(month: datetime) -> str:
+    return f'{ARCHIVE_TABLE}_{month:%Y_%m}'
+
+
+def ensure_archive_partitions(created_ats):
+    """Create the monthly archive partitions that rows with these timestamps fall into."""
+    months = {created_at.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+              for created_at in created_ats}
+
+    with connection.cursor() as cursor:
+        for month in months:
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{get_archive_partition_name(month)}" PARTITION OF "{ARCHIVE_TABLE}" '
+                f'FOR VALUES FROM (%s) TO (%s)', [month, next_month])
+
+
+def prune_notifications_batch(queryset, batch_size=NOTIFICATION_RETENTION_BATCH_SIZE, archive=False):
+    """
+    Delete (or move to the archive) one batch of `queryset` in a short transaction.
+    Rows locked by another transaction are skipped, so the job never waits on live traffic.
+    Returns (rows, bytes) removed from the Notifications table.
+    """
+    with transaction.atomic():
+        rows = list(queryset.select_for_update(skip_locked=True).order_by('created_at').values(
+            'id', 'user_id', 'status', 'user_role', 'message', 'created_at', 'updated_at')[:batch_size])
+        if not rows:
+            return 0, 0
+
+        ids = [row['id'] for row in rows]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT coalesce(sum(pg_column_size(n.*)), 0) FROM "{Notifications._meta.db_table}" n '
+                f'WHERE n.id = ANY(%s)', [ids])
+            size = cursor.fetchone()[0]
+
+        if archive:
+            ensure_archive_partitions(row['created_at'] for row in rows)
+            archived_at = timezone.now()
+            ArchivedNotification.objects.bulk_create(
+                [ArchivedNotification(**row, archived_at=archived_at) for row in rows])
+
+        unread_by_user = Notifications.objects.filter(id__in=ids, status=CHOICES_FOR_STATUS[0][0]).values(
+            'user_id').annotate(total=Count('id'))
+        for row in unread_by_user:
+            NotificationCounter.decrement(row['user_id'], row['total'])
+
+        Notifications.objects.filter(id__in=ids).delete()
+
+    return len(rows), size
+
+
+def prune_notifications(retention_days=NOTIFICATION_RETENTION_DAYS, batch_size=NOTIFICATION_RETENTION_BATCH_SIZE,
+                        archive=False, pause=0):
+    """Prune expired notifications batch by batch. Returns total (rows, bytes) removed."""
+    total_rows = total_bytes = 0
+
+    ## one status at a time, so each batch is a range scan of that status' partial index
+    ## rather than an OR the planner can only answer from the whole table
+    for status, days in retention_days.items():
+        queryset = get_expired_notifications({status: days})
+        while True:
+            rows, size = prune_notifications_batch(queryset, batch_size, archive)
+            total_rows += rows
+            total_bytes += size
+
+            if rows < batch_size:
+                break
+            if pause:
+                ## give autovacuum and replicas room between batches
+                time.sleep(pause)
+
+    return total_rows, total_bytes
+
+
+def drop_archive_partitions(before: datetime):
+    """Drop whole archive months that end before `before`. Returns (partitions, bytes) dropped."""
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT child.relname, pg_total_relation_size(child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = %s
+        ''', [ARCHIVE_TABLE])
+        partitions = cursor.fetchall()
+
+        dropped = dropped_bytes = 0
+        for name, size in partitions:
+            month = datetime.strptime(name[len(ARCHIVE_TABLE) + 1:], '%Y_%m').replace(tzinfo=dt_timezone.utc)
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            if next_month <= before:
+                cursor.execute(f'DROP TABLE "{name}"')
+                dropped += 1
+                dropped_bytes += size
+
+    return dropped, dropped_bytes
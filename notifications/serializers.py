@@ -7,5 +7,10 @@ class NotificationsSerializer (serializers.ModelSerializer):
 
     class Meta:
         model = Notifications
-        fields = ["status", "message", "created_at"]
+        fields = ["id", "status", "message", "created_at"]
 
+
+class MarkNotificationsAsReadSerializer (serializers.Serializer):
+
+    ## id of the newest notification to mark; everything older is marked too
+    up_to = serializers.IntegerField(required=False)
@@ -0,0 +1,125 @@
+import json
+import asyncio
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
+
+from .models import Notifications
+from .serializers import NotificationsSerializer
+from users.models import User
+from utils.pubsub import broker, get_pubsub_backend
+from utils.constants import NOTIFICATION_STREAM_HEARTBEAT, NOTIFICATION_STREAM_REPLAY_LIMIT
+
+
+def get_stream_token(scope):
+    """Bearer token from the Authorization header, or ?token= since EventSource can't set headers."""
+    for name, value in scope.get('headers', []):
+        if name == b'authorization' and value.lower().startswith(b'bearer '):
+            return value[7:].decode()
+
+    return parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+
+
+def get_last_event_id(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'last-event-id' and value.isdigit():
+            return int(value)
+    return None
+
+
+@sync_to_async
+def authenticate(token):
+    try:
+        user_id = AccessToken(token)[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+    ## these run outside Django's request cycle, which would otherwise recycle stale connections
+    close_old_connections()
+    return User.objects.filter(id=user_id, is_active=True).values_list('id', flat=True).first()
+
+
+@sync_to_async
+def get_missed_notifications(user_id, last_event_id):
+    close_old_connections()
+    notifications = Notifications.objects.filter(
+        user_id=user_id, id__gt=last_event_id).order_by('-created_at', '-id')[:NOTIFICATION_STREAM_REPLAY_LIMIT]
+    return NotificationsSerializer(reversed(notifications), many=True).data
+
+
+def format_event(notification):
+    return f'id: {notification["id"]}\nevent: notification\ndata: {json.dumps(notification, default=str)}\n\n'.encode()
+
+
+async def notification_stream(scope, receive, send):
+    """
+    Server-Sent Events stream of the authenticated user's new notifications.
+    A reconnecting client sends Last-Event-ID and first gets what it missed.
+    """
+    if scope['method'] != 'GET':
+        return await send_error(send, 405, 'Method not allowed')
+
+    token = get_stream_token(scope)
+    user_id = await authenticate(token) if token else None
+    if user_id is None:
+        return await send_error(send, 401, 'Authentication credentials were not provided or are invalid')
+
+    get_pubsub_backend().start()
+    queue = broker.subscribe(user_id)
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    disconnect = asyncio.ensure_future(wait_for_disconnect())
+
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            ## stop nginx-style proxies from buffering the stream
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+        last_event_id = get_last_event_id(scope)
+        if last_event_id is not None:
+            for notification in await get_missed_notifications(user_id, last_event_id):
+                await send({'type': 'http.response.body', 'body': format_event(notification), 'more_body': True})
+                last_event_id = notification['id']
+
+        while True:
+            next_notification = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_notification, disconnect}, timeout=NOTIFICATION_STREAM_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED)
+
+            if next_notification in done:
+                notification = next_notification.result()
+                ## already sent in the replay, which overlaps the subscription
+                if last_event_id is not None and notification['id'] <= last_event_id:
+                    continue
+                body = format_event(notification)
+            else:
+                next_notification.cancel()
+                if disconnect in done:
+                    break
+                ## comment line keeps idle connections from being reaped by proxies
+                body = b': heartbeat\n\n'
+
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    except OSError:
+        pass
+    finally:
+        broker.unsubscribe(user_id, queue)
+        disconnect.cancel()
+
+
+async def send_error(send, status_code, error):
+    body = json.dumps({'status_code': status_code, 'error': error, 'payload': [error]}).encode()
+    await send({'type': 'http.response.start', 'status': status_code,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
@@ -1,3 +1,274 @@
-from django.test import TestCase
+import json
+import select
+import asyncio
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.db import connection, connections
+from datetime import timedelta
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from users.models import User
+from .models import Notifications, NotificationCounter, ArchivedNotification, EmailOutbox
+from .retention import get_expired_notifications, prune_notifications
+from .streaming import notification_stream
+from utils.constants import (PUBSUB_CHANNEL, EMAIL_OUTBOX_MAX_ATTEMPTS, EMAIL_OUTBOX_RETRY_DELAY,
+                             EMAIL_OUTBOX_CLAIM_TIMEOUT)
+from utils.email import send_queued_emails
+
+
+class NotificationsFeedTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('Ada', 'Obi', 'ada@roofbucks.com', 'AGENT', 'Password1!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        Notifications.new_bulk_entry([{'user': self.user, 'message': f'message {n}'} for n in range(5)])
+
+    def get_unread_count(self):
+        response = self.client.get('/api/v1/notifications/unread_count/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['unread']
+
+    def test_feed_is_cursor_paginated(self):
+        response = self.client.get('/api/v1/notifications/', {'limit': 3})
+        page = response.json()
+
+        self.assertEqual([item['message'] for item in page['results']], ['message 4', 'message 3', 'message 2'])
+        self.assertEqual(page['total'], 5)
+
+        page = self.client.get(page['links']['next']).json()
+        self.assertEqual([item['message'] for item in page['results']], ['message 1', 'message 0'])
+
+    def test_unread_counter_follows_new_notifications(self):
+        self.assertEqual(self.get_unread_count(), 5)
+
+        Notifications.new_entry(self.user, 'one more')
+        Notifications.new_bulk_entry([{'user': self.user, 'message': 'and another'}])
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get_unread_count(), 7)
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_mark_as_read_up_to_notification(self):
+        self.get_unread_count()
+        third_newest = Notifications.objects.filter(user=self.user).order_by('-created_at', '-id')[2]
+
+        with CaptureQueriesContext(connection) as context:
+            updated = Notifications.mark_as_read(self.user, third_newest.id)
+        self.assertEqual(updated, 3)
+        self.assertEqual(len([query for query in context.captured_queries
+                              if query['sql'].startswith('UPDATE "Notifications"')]), 1)
+
+        self.assertEqual(
+            list(Notifications.objects.filter(user=self.user, status='UNREAD').order_by('id').values_list('message', flat=True)),
+            ['message 3', 'message 4'])
+        self.assertEqual(self.get_unread_count(), 2)
+
+    def test_mark_all_as_read(self):
+        response = self.client.post('/api/v1/notifications/mark_as_read/')
+
+        self.assertEqual(response.json(), {'updated': 5, 'unread': 0})
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 0)
+
+
+class NotificationRetentionTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('Ada', 'Obi', 'ada@roofbucks.com', 'AGENT', 'Password1!')
+        Notifications.new_bulk_entry([{'user': self.user, 'message': f'message {n}'} for n in range(6)])
+        NotificationCounter.get_unread(self.user)
+
+        ids = list(Notifications.objects.order_by('id').values_list('id', flat=True))
+        now = timezone.now()
+        ## two expired read, one expired unread, one recent read, two recent unread
+        Notifications.objects.filter(id__in=ids[:2]).update(status='READ', created_at=now - timedelta(days=100))
+        Notifications.objects.filter(id=ids[2]).update(created_at=now - timedelta(days=400))
+        Notifications.objects.filter(id=ids[3]).update(status='READ', created_at=now - timedelta(days=10))
+        NotificationCounter.recount(self.user)
+
+    def test_prunes_expired_rows_in_batches(self):
+        rows, size = prune_notifications({'READ': 90, 'UNREAD': 365}, batch_size=2)
+
+        self.assertEqual(rows, 3)
+        self.assertGreater(size, 0)
+        self.assertEqual(Notifications.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 2)
+
+    def test_archives_into_monthly_partitions(self):
+        rows, _ = prune_notifications({'READ': 90, 'UNREAD': None}, archive=True)
+
+        self.assertEqual(rows, 2)
+        self.assertEqual(ArchivedNotification.objects.filter(user_id=self.user.id, status='READ').count(), 2)
+        self.assertEqual(Notifications.objects.filter(user=self.user).count(), 4)
+
+    def test_each_status_is_pruned_from_its_partial_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for status, index in [('READ', 'notifications_read_age_idx'), ('UNREAD', 'notifications_unread_age_idx')]:
+            queryset = get_expired_notifications({status: 30}).order_by('created_at')
+            self.assertIn(index, queryset.explain())
+
+
+@override_settings(PUBSUB_BACKEND='utils.pubsub.LocalPubSubBackend')
+class NotificationStreamTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('Ada', 'Obi', 'ada@roofbucks.com', 'AGENT', 'Password1!')
+
+    def open_stream(self, headers):
+        """Run the stream until `until` returns, then disconnect. Returns what was sent."""
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/v1/notifications/stream/',
+                 'query_string': b'', 'headers': headers}
+
+        async def run(until):
+            received, sent = asyncio.Queue(), []
+
+            async def send(message):
+                sent.append(message)
+
+            stream = asyncio.ensure_future(notification_stream(scope, received.get, send))
+            await until(sent)
+            await received.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(stream, 5)
+            await sync_to_async(connections.close_all)()
+            return sent
+
+        return run
+
+    def get_body(self, sent):
+        return b''.join(message.get('body', b'') for message in sent).decode()
+
+    def test_rejects_missing_token(self):
+        async def until(sent):
+            await asyncio.sleep(0.1)
+
+        sent = asyncio.run(self.open_stream([])(until))
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_pushes_new_notifications(self):
+        token = str(AccessToken.for_user(self.user)).encode()
+
+        async def until(sent):
+            while not sent:
+                await asyncio.sleep(0.01)
+            await sync_to_async(Notifications.new_entry)(self.user, 'property approved')
+            while 'property approved' not in self.get_body(sent):
+                await asyncio.sleep(0.01)
+
+        sent = asyncio.run(asyncio.wait_for(self.open_stream([(b'authorization', b'Bearer ' + token)])(until), 5))
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn('event: notification', self.get_body(sent))
+
+    def test_replays_missed_notifications(self):
+        token = str(AccessToken.for_user(self.user)).encode()
+        seen, missed = Notifications.new_bulk_entry([
+            {'user': self.user, 'message': 'seen'}, {'user': self.user, 'message': 'missed'}])
+
+        async def until(sent):
+            while 'missed' not in self.get_body(sent):
+                await asyncio.sleep(0.01)
+
+        sent = asyncio.run(asyncio.wait_for(self.open_stream([
+            (b'authorization', b'Bearer ' + token), (b'last-event-id', str(seen.id).encode())])(until), 5))
+
+        self.assertIn(f'id: {missed.id}', self.get_body(sent))
+        self.assertNotIn('"seen"', self.get_body(sent))
+
+
+@override_settings(PUBSUB_BACKEND='utils.pubsub.PostgresPubSubBackend')
+class PostgresPubSubTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.listener = connection.get_new_connection(connection.get_connection_params())
+        self.listener.autocommit = True
+        self.addCleanup(self.listener.close)
+        with self.listener.cursor() as cursor:
+            cursor.execute(f'LISTEN "{PUBSUB_CHANNEL}"')
+
+    def receive(self, count):
+        notifies = []
+        while len(notifies) < count and select.select([self.listener], [], [], 5) != ([], [], []):
+            self.listener.poll()
+            notifies += self.listener.notifies
+            self.listener.notifies.clear()
+        return [json.loads(notify.payload) for notify in notifies]
+
+    def test_bulk_entry_is_published_in_one_statement(self):
+        ada = User.objects.create_user('Ada', 'Obi', 'ada@roofbucks.com', 'AGENT', 'Password1!')
+        bola = User.objects.create_user('Bola', 'Ade', 'bola@roofbucks.com', 'AGENT', 'Password1!')
+
+        with CaptureQueriesContext(connection) as context:
+            Notifications.new_bulk_entry([
+                {'user': ada, 'message': 'first'}, {'user': bola, 'message': 'second'},
+                {'user': ada, 'message': 'third'}])
+
+        self.assertEqual(len([query for query in context.captured_queries if 'pg_notify' in query['sql']]), 1)
+        self.assertCountEqual([(payload['user_id'], payload['message']['message']) for payload in self.receive(3)],
+                              [(ada.id, 'first'), (bola.id, 'second'), (ada.id, 'third')])
+
+
+class EmailOutboxTestCase(TestCase):
+
+    def enqueue(self, to_email='ada@roofbucks.com', **fields):
+        email = EmailOutbox.enqueue(to_email=to_email, subject='Verify Your Email', body='123456')
+        EmailOutbox.objects.filter(id=email.id).update(**fields)
+        return email
+
+    def test_claims_due_emails(self):
+        due = self.enqueue()
+        self.enqueue(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        stale = self.enqueue(status='SENDING', attempts=1,
+                             claimed_at=timezone.now() - timedelta(seconds=EMAIL_OUTBOX_CLAIM_TIMEOUT + 1))
+        self.enqueue(status='SENDING', attempts=1, claimed_at=timezone.now())
+
+        self.assertEqual(send_queued_emails(), 2)
+        self.assertEqual(send_queued_emails(), 0)
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(set(EmailOutbox.objects.filter(status='SENT').values_list('id', 'attempts')),
+                         {(due.id, 1), (stale.id, 2)})
+
+    def test_failed_emails_back_off(self):
+        email = self.enqueue()
+
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError('mail server unavailable')):
+            for attempt in range(1, 3):
+                before = timezone.now()
+                self.assertEqual(send_queued_emails(), 1)
+
+                email.refresh_from_db()
+                self.assertEqual((email.status, email.attempts), ('PENDING', attempt))
+                self.assertIn('mail server unavailable', email.last_error)
+                self.assertGreaterEqual(
+                    email.next_attempt_at, before + timedelta(seconds=EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempt - 1)))
+
+                ## not due again until the delay has passed
+                self.assertEqual(send_queued_emails(), 0)
+                EmailOutbox.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+
+    def test_gives_up_after_the_last_attempt(self):
+        email = self.enqueue(attempts=EMAIL_OUTBOX_MAX_ATTEMPTS - 1)
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError('mailbox unavailable')):
+            send_queued_emails()
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('FAILED', EMAIL_OUTBOX_MAX_ATTEMPTS))
+
+        ## a claim that timed out on the last attempt isn't reclaimed
+        stale = self.enqueue(status='SENDING', attempts=EMAIL_OUTBOX_MAX_ATTEMPTS,
+                             claimed_at=timezone.now() - timedelta(seconds=EMAIL_OUTBOX_CLAIM_TIMEOUT + 1))
+
+        self.assertEqual(send_queued_emails(), 0)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.attempts), ('FAILED', EMAIL_OUTBOX_MAX_ATTEMPTS))
+        self.assertEqual(mail.outbox, [])
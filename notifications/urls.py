@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import (NotificationsListView)
+from .views import (NotificationsListView, UnreadNotificationsCountView, MarkNotificationsAsReadView)
 
 urlpatterns = [
     path('', NotificationsListView.as_view(),name='user_notifications'),
+    path('unread_count/', UnreadNotificationsCountView.as_view(), name='unread_notifications_count'),
+    path('mark_as_read/', MarkNotificationsAsReadView.as_view(), name='mark_notifications_as_read'),
 ]
@@ -1,21 +1,41 @@
-from rest_framework import (views, permissions)
+from rest_framework import (views, permissions, generics)
 from rest_framework.response import Response
 
-from .serializers import NotificationsSerializer
-from .models import Notifications
+from .serializers import NotificationsSerializer, MarkNotificationsAsReadSerializer
+from .models import Notifications, NotificationCounter
+from utils.pagination import CustomCursorPagination
 
-class NotificationsListView(views.APIView):
+class NotificationsListView(generics.ListAPIView):
 
     serializer_class = NotificationsSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CustomCursorPagination
+
+    def get_queryset(self):
+        return Notifications.objects.filter(user=self.request.user)
+
+
+class UnreadNotificationsCountView(views.APIView):
+
+    permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
 
-        notifications = Notifications.objects.filter(
-            user=request.user).order_by("-created_at")
+        return Response({"unread": NotificationCounter.get_unread(request.user)}, status=200)
+
+
+class MarkNotificationsAsReadView(views.APIView):
+
+    serializer_class = MarkNotificationsAsReadSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
-        serializer = self.serializer_class(notifications, many=True)
+    def post(self, request):
 
-        return Response(serializer.data, status=200)
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
+        updated = Notifications.mark_as_read(request.user, serializer.validated_data.get('up_to'))
 
+        return Response({
+            "updated": updated,
+            "unread": NotificationCounter.get_unread(request.user)}, status=200)
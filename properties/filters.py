@@ -0,0 +1,25 @@
+from django.db.models import F
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from rest_framework.filters import SearchFilter
+
+from .models import SEARCH_VECTOR_CONFIG
+
+
+class PropertySearchFilter(SearchFilter):
+    """
+    Full-text search over the indexed `Property.search_vector` column.
+    Matches are ranked by relevance, newest first on ties.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        query = SearchQuery(' '.join(search_terms), search_type='websearch', config=SEARCH_VECTOR_CONFIG)
+
+        return queryset.filter(
+            search_vector=query
+        ).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', *queryset.query.order_by)
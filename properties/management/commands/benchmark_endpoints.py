@@ -0,0 +1,187 @@
+import json
+import time
+import subprocess
+from contextlib import ExitStack
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from properties.models import Property, ShoppingCart
+from utils import paystack
+from utils.paystack import PaystackClient
+from utils.paystack_stub import PaystackStubServer
+from .seed_benchmark_data import get_benchmark_users
+
+
+def get_percentile(sorted_values, percentile):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    index = max(0, -(-len(sorted_values) * percentile // 100) - 1)
+    return sorted_values[int(index)]
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Drive the hot API endpoints through the test client against seeded data and report '
+            'throughput, p50/p95/p99 latency and query counts as JSON')
+
+    ENDPOINTS = ['listings', 'marketplace', 'topdeals', 'detail', 'similar', 'business_profile',
+                 'cart', 'checkout', 'notifications']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='untimed requests per endpoint')
+        parser.add_argument('--endpoints', nargs='+', choices=self.ENDPOINTS, default=self.ENDPOINTS)
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='clear the cache before every request, to measure the database path')
+        parser.add_argument('--seed', action='store_true', help='run seed_benchmark_data first')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help='earlier results file to compare p95 latency against')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            call_command('seed_benchmark_data', stdout=self.stdout)
+
+        agents = list(get_benchmark_users('AGENT'))
+        customers = list(get_benchmark_users('CUSTOMER'))
+        property_ids = list(Property.objects.filter(
+            agent__in=agents, moderation_status='APPROVED').values_list('id', flat=True))
+        if not (agents and customers and property_ids):
+            raise CommandError('No benchmark data found, run seed_benchmark_data or pass --seed')
+
+        self.client = APIClient()
+        self.agents, self.customers, self.property_ids = agents, customers, property_ids
+        self.cold_cache = options['cold_cache']
+        cache.clear()
+
+        results = {}
+        with ExitStack() as stack:
+            if 'checkout' in options['endpoints']:
+                self.use_paystack_stub(stack)
+
+            for name in options['endpoints']:
+                results[name] = self.run_endpoint(name, options)
+                self.stdout.write(
+                    f'{name:>17}: {results[name]["throughput_rps"]:>8.1f} req/s  '
+                    f'p50 {results[name]["p50_ms"]:>7.2f} ms  p95 {results[name]["p95_ms"]:>7.2f} ms  '
+                    f'p99 {results[name]["p99_ms"]:>7.2f} ms  queries {results[name]["queries"]["max"]}')
+
+        report = {
+            'commit': get_git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'cold_cache': options['cold_cache'],
+            'dataset': {'agents': len(agents), 'customers': len(customers), 'properties': len(property_ids)},
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def use_paystack_stub(self, stack):
+        """
+        Charge checkouts against a local Paystack stub for the rest of the run, whatever
+        PAYSTACK_SECRET_KEY and PAYSTACK_BASE_URL say, so a benchmark never bills a real card.
+        """
+        stub = stack.enter_context(PaystackStubServer(secret_key='sk_test_benchmark'))
+        client = PaystackClient(base_url=stub.url, secret_key=stub.secret_key)
+        stack.callback(client.close)
+        stack.enter_context(mock.patch.object(paystack, 'PAYSTACK_SECRET_KEY', stub.secret_key))
+        stack.enter_context(mock.patch.object(paystack, 'get_paystack_client', lambda: client))
+
+    def get_request(self, name, index):
+        """(user, method, path) of the index-th request to an endpoint."""
+        property_id = self.property_ids[index % len(self.property_ids)]
+        agent = self.agents[index % len(self.agents)]
+        customer = self.customers[index % len(self.customers)]
+
+        return {
+            'listings': (None, 'get', '/api/v1/properties/listings/'),
+            'marketplace': (None, 'get', '/api/v1/properties/marketplace/'),
+            'topdeals': (None, 'get', '/api/v1/properties/topdeals/'),
+            'detail': (None, 'get', f'/api/v1/properties/single/{property_id}/'),
+            'similar': (None, 'get', f'/api/v1/properties/similar_properties/{property_id}/'),
+            'business_profile': (None, 'get', f'/api/v1/user/business_profile/{agent.id}/'),
+            'cart': (customer, 'get', '/api/v1/properties/shopping_cart/'),
+            'checkout': (customer, 'post', '/api/v1/transactions/buy_cart_items/'),
+            'notifications': (customer, 'get', '/api/v1/notifications/'),
+        }[name]
+
+    def prepare_request(self, name, user, index):
+        if self.cold_cache:
+            cache.clear()
+
+        ## checkout empties the cart, so every checkout gets a fresh one
+        if name == 'checkout':
+            ShoppingCart.objects.filter(user=user).delete()
+            ShoppingCart.objects.bulk_create([
+                ShoppingCart(user=user, property_id=self.property_ids[(index + n) % len(self.property_ids)])
+                for n in range(3)
+            ])
+
+    def run_endpoint(self, name, options):
+        latencies, query_counts, status_codes = [], [], {}
+
+        for index in range(options['warmup'] + options['iterations']):
+            user, method, path = self.get_request(name, index)
+            self.prepare_request(name, user, index)
+            self.client.force_authenticate(user)
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(self.client, method)(path)
+                elapsed = time.perf_counter() - started
+
+            if index < options['warmup']:
+                continue
+
+            latencies.append(elapsed * 1000)
+            query_counts.append(len(queries.captured_queries))
+            status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / (sum(latencies) / 1000), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(get_percentile(latencies, 50), 3),
+            'p95_ms': round(get_percentile(latencies, 95), 3),
+            'p99_ms': round(get_percentile(latencies, 99), 3),
+            'queries': {
+                'min': min(query_counts),
+                'max': max(query_counts),
+                'mean': round(sum(query_counts) / len(query_counts), 2),
+            },
+            'status_codes': status_codes,
+        }
+
+    def compare(self, path, results):
+        with open(path) as file:
+            previous = json.load(file)
+
+        self.stdout.write(f'p95 against {previous.get("commit") or path}:')
+        for name, result in results.items():
+            before = previous['endpoints'].get(name)
+            if not before:
+                continue
+
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            line = (f'{name:>17}: {before["p95_ms"]:>7.2f} -> {result["p95_ms"]:>7.2f} ms ({change:+.1f}%)  '
+                    f'queries {before["queries"]["max"]} -> {result["queries"]["max"]}')
+            self.stdout.write(self.style.ERROR(line) if change > 10 else line)
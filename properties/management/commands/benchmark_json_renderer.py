@@ -0,0 +1,84 @@
+import uuid
+import json
+import timeit
+from datetime import timedelta
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from utils.renderers import FastJSONRenderer, orjson
+
+
+def build_marketplace_page(size):
+    """A page shaped like PropertyMarketplaceViewset's response, image_album.media included."""
+    now = timezone.now()
+    results = []
+    for index in range(size):
+        created_at = now - timedelta(hours=index)
+        results.append({
+            'id': str(uuid.uuid4()),
+            'name': f'Property {index} — Lekki Phase 1',
+            'created_at': created_at.isoformat().replace('+00:00', 'Z'),
+            'company_name': 'Roofbucks Realty Ltd',
+            'agent': index % 17,
+            'description': 'Four bedroom terrace with BQ, fitted kitchen and 24 hour power. ' * 4,
+            'apartment_type': 'terrace',
+            'address': f'{index} Admiralty Way',
+            'city': 'Lekki',
+            'state': 'Lagos',
+            'country': 'Nigeria',
+            'percentage_discount': index % 30,
+            'promotion_closing_date': (created_at + timedelta(days=30)).date().isoformat(),
+            'number_of_bedrooms': 4,
+            'number_of_toilets': 5,
+            'default_image': f'https://bucket.s3.amazonaws.com/properties/default_images/{index}.jpg',
+            'total_property_cost': 120000000 + index,
+            'total_number_of_shares': 1000,
+            'price_per_share': 120000,
+            'image_album': {'media': [
+                {'image': f'https://bucket.s3.amazonaws.com/properties/images/{index}-{n}.jpg',
+                 'document': None, 'id': index * 5 + n}
+                for n in range(5)
+            ]},
+            'percentage_sold': index % 100,
+        })
+
+    return {
+        'links': {'next': 'http://localhost:8000/api/v1/properties/marketplace/?page=2', 'previous': None},
+        'total': size * 10,
+        'limit': size,
+        'pages': 10,
+        'results': results,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare the stdlib JSONRenderer with FastJSONRenderer on a marketplace page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help='items per page')
+        parser.add_argument('--number', type=int, default=500, help='renders per measurement')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed; FastJSONRenderer would fall back to the stdlib renderer')
+            return
+
+        page = build_marketplace_page(options['size'])
+        number = options['number']
+
+        stdlib_output = JSONRenderer().render(page)
+        fast_output = FastJSONRenderer().render(page)
+        if json.loads(stdlib_output) != json.loads(fast_output):
+            self.stderr.write('renderers disagree on the decoded payload')
+            return
+
+        results = {}
+        for name, renderer in [('stdlib', JSONRenderer()), ('orjson', FastJSONRenderer())]:
+            seconds = min(timeit.repeat(lambda: renderer.render(page), number=number, repeat=5))
+            results[name] = seconds / number * 1000
+
+        self.stdout.write(f'payload: {len(stdlib_output)} bytes, {options["size"]} items')
+        for name, milliseconds in results.items():
+            self.stdout.write(f'{name:>7}: {milliseconds:.3f} ms/render')
+        self.stdout.write(self.style.SUCCESS(f'speedup: {results["stdlib"] / results["orjson"]:.1f}x'))
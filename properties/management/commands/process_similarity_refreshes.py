@@ -0,0 +1,62 @@
+import json
+import signal
+import logging
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from properties.models import SimilarityRefresh
+from properties.similarity import process_similarity_refreshes
+from utils.constants import SIMILARITY_REFRESH_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recompute the similar-property neighbours of properties queued by a save'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=SIMILARITY_REFRESH_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=5, help='seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='drain the queue and exit')
+        parser.add_argument('--stats', action='store_true', help='print the queue depth and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(SimilarityRefresh.get_queue_metrics()))
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        def work():
+            try:
+                while not stop.is_set():
+                    try:
+                        claimed = process_similarity_refreshes(options['batch_size'])
+                    except Exception:
+                        ## the failed batch stays claimed until the timeout; keep the thread alive
+                        logger.exception('similarity refresh batch failed')
+                        stop.wait(options['interval'])
+                        continue
+                    if claimed == 0:
+                        if options['once']:
+                            break
+                        stop.wait(options['interval'])
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=work) for _ in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+        self.stdout.write(json.dumps(SimilarityRefresh.get_queue_metrics()))
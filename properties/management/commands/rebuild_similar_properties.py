@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from properties.models import Property
+from properties.similarity import refresh_similar_properties
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SimilarProperties neighbours table for every property'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        for property in Property.objects.order_by('created_at').iterator(chunk_size=options['chunk_size']):
+            refresh_similar_properties(property)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt similar properties for {total} properties'))
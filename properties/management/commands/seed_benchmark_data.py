@@ -0,0 +1,155 @@
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from album.models import MediaAlbum, MediaFiles
+from notifications.models import Notifications
+from properties.models import (Property, ShoppingCart, PropertyInspection, MODERATION_STATUS_CHOICES,
+                               PROPERTY_STAGE_CHOICES)
+from properties.similarity import refresh_similar_properties
+from users.models import User, Company, Review
+from utils.cache import invalidate_cache_namespace
+from utils.constants import PROPERTY_LISTING_CACHE, PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE
+
+
+## every seeded user gets an address on this domain, so a reseed can find and remove them
+BENCHMARK_EMAIL_DOMAIN = 'bench.roofbucks.test'
+BENCHMARK_PASSWORD = 'Benchmark1!'
+
+STATES = ['Lagos', 'Abuja', 'Rivers', 'Oyo', 'Enugu', 'Kano']
+CITIES = ['Lekki', 'Ikoyi', 'Maitama', 'Wuse', 'Port Harcourt', 'Ibadan', 'Independence Layout']
+APARTMENT_TYPES = ['duplex', 'terrace', 'flat', 'bungalow', 'penthouse']
+AMENITIES = ['pool', 'gym', 'bq', 'cctv', 'parking', '24hr power', 'elevator', 'garden']
+
+
+def get_benchmark_users(role=None):
+    users = User.objects.filter(email__endswith=f'@{BENCHMARK_EMAIL_DOMAIN}')
+    return users.filter(role=role) if role else users
+
+
+def clear_benchmark_data():
+    properties = Property.objects.filter(agent__in=get_benchmark_users())
+    album_ids = [album_id for pair in properties.values_list('image_album_id', 'document_album_id')
+                 for album_id in pair if album_id]
+
+    with transaction.atomic():
+        get_benchmark_users().delete()
+        MediaAlbum.objects.filter(id__in=album_ids).delete()
+
+
+class Command(BaseCommand):
+    help = 'Seed agents, companies, properties with albums, carts, inspections and notifications for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agents', type=int, default=20)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--properties', type=int, default=500)
+        parser.add_argument('--images', type=int, default=5, help='images per property')
+        parser.add_argument('--cart-items', type=int, default=3, help='cart items per customer')
+        parser.add_argument('--inspections', type=int, default=2, help='site visits per customer')
+        parser.add_argument('--notifications', type=int, default=30, help='notifications per user')
+        parser.add_argument('--reviews', type=int, default=10, help='reviews per company')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        clear_benchmark_data()
+
+        password = make_password(BENCHMARK_PASSWORD)
+        now = timezone.now()
+
+        with transaction.atomic():
+            agents = User.objects.bulk_create([
+                User(firstname=f'Agent{index}', lastname='Bench', role='AGENT', password=password,
+                     email=f'agent{index}@{BENCHMARK_EMAIL_DOMAIN}', is_verified=True)
+                for index in range(options['agents'])
+            ])
+            ## IsCustomer checks for a 'customer' role
+            customers = User.objects.bulk_create([
+                User(firstname=f'Customer{index}', lastname='Bench', role='CUSTOMER', password=password,
+                     email=f'customer{index}@{BENCHMARK_EMAIL_DOMAIN}', is_verified=True)
+                for index in range(options['customers'])
+            ])
+
+            companies = Company.objects.bulk_create([
+                Company(user=agent, registration_number=f'RCB{index:06}', reference_number=f'BENCH{index:07}',
+                        registered_name=f'Bench Realty {index}', display_name=f'Bench Realty {index}',
+                        email=f'company{index}@{BENCHMARK_EMAIL_DOMAIN}', city=rng.choice(CITIES),
+                        country='Nigeria', is_verified=True)
+                for index, agent in enumerate(agents)
+            ])
+
+            Review.objects.bulk_create([
+                Review(company=company, reviewer=rng.choice(customers), rating=rng.randint(1, 5),
+                       review='Smooth transaction and honest agent.')
+                for company in companies for _ in range(options['reviews'])
+            ])
+            ## bulk_create skips Company.add_review, which keeps the rating aggregates
+            Company.recompute_review_aggregates([company.id for company in companies])
+
+            image_albums = MediaAlbum.objects.bulk_create([MediaAlbum() for _ in range(options['properties'])])
+            document_albums = MediaAlbum.objects.bulk_create([MediaAlbum() for _ in range(options['properties'])])
+
+            properties = []
+            for index in range(options['properties']):
+                agent_index = index % len(agents)
+                price_per_share = rng.choice([50_000, 120_000, 250_000, 600_000, 1_500_000])
+                total_number_of_shares = rng.choice([100, 500, 1000])
+                properties.append(Property(
+                    name=f'Bench Property {index}', agent=agents[agent_index], company=companies[agent_index],
+                    company_name=companies[agent_index].registered_name,
+                    description='Four bedroom terrace with BQ, fitted kitchen and 24 hour power.',
+                    moderation_status=MODERATION_STATUS_CHOICES[1][0] if rng.random() < 0.9 else MODERATION_STATUS_CHOICES[0][0],
+                    stage=PROPERTY_STAGE_CHOICES[0][0] if rng.random() < 0.6 else PROPERTY_STAGE_CHOICES[1][0],
+                    apartment_type=rng.choice(APARTMENT_TYPES), address=f'{index} Admiralty Way',
+                    city=rng.choice(CITIES), state=rng.choice(STATES), country='Nigeria',
+                    percentage_discount=rng.randint(0, 30),
+                    promotion_closing_date=(now + timedelta(days=rng.randint(1, 60))).date(),
+                    number_of_bedrooms=rng.randint(1, 6), number_of_toilets=rng.randint(1, 7),
+                    amenities=rng.sample(AMENITIES, 3),
+                    default_image=f'properties/default_images/bench-{index}.jpg',
+                    price_per_share=price_per_share, total_number_of_shares=total_number_of_shares,
+                    total_property_cost=price_per_share * total_number_of_shares,
+                    percentage_sold=rng.randint(0, 100),
+                    image_album=image_albums[index], document_album=document_albums[index],
+                ))
+            Property.objects.bulk_create(properties)
+
+            MediaFiles.objects.bulk_create([
+                MediaFiles(album=album, image=f'properties/images/bench-{album.id}-{n}.jpg', media_type='IMAGE')
+                for album in image_albums for n in range(options['images'])
+            ] + [
+                MediaFiles(album=album, document=f'properties/documents/bench-{album.id}.pdf', media_type='DOCUMENT')
+                for album in document_albums
+            ])
+
+            carts, inspections = [], []
+            for customer in customers:
+                for property in rng.sample(properties, min(options['cart_items'], len(properties))):
+                    carts.append(ShoppingCart(user=customer, property=property, quantity=rng.randint(1, 5)))
+                for property in rng.sample(properties, min(options['inspections'], len(properties))):
+                    inspections.append(PropertyInspection(
+                        property=property, agent=property.agent, client=customer,
+                        company_name=property.company_name,
+                        inspection_date=now + timedelta(days=rng.randint(1, 30))))
+            ShoppingCart.objects.bulk_create(carts)
+            PropertyInspection.objects.bulk_create(inspections)
+
+            Notifications.objects.bulk_create([
+                Notifications(user=user, user_role=user.role, message=f'Benchmark notification {n}')
+                for user in agents + customers for n in range(options['notifications'])
+            ])
+
+            ## bulk_create skips the post_save receivers that maintain these
+            Property.update_search_vector(*[property.id for property in properties])
+            invalidate_cache_namespace(PROPERTY_LISTING_CACHE, PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
+
+        for property in properties:
+            refresh_similar_properties(property)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(agents)} agents, {len(customers)} customers, {len(properties)} properties, '
+            f'{len(carts)} cart items, {len(inspections)} inspections'))
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0010_propertyownership_expected_roi_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('moderation_status', 'APPROVED'), ('stage', 'LISTING')), fields=['-created_at', '-id'], name='properties_listing_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('moderation_status', 'APPROVED'), ('stage', 'MARKETPLACE')), fields=['-created_at', '-id'], name='properties_marketplace_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('moderation_status', 'APPROVED')), fields=['-percentage_discount', 'promotion_closing_date'], name='properties_topdeals_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['moderation_status', 'stage', '-created_at'], name='properties_status_stage_idx'),
+        ),
+    ]
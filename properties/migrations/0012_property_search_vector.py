@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def array_to_string(field):
+    return models.Func(models.F(field), models.Value(' '), function='array_to_string',
+                       output_field=models.TextField())
+
+
+def populate_search_vector(apps, schema_editor):
+    ## Property.get_search_vector() as it stood, so later changes to the model can't break this migration
+    Property = apps.get_model('properties', 'Property')
+    Property.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='english')
+        + SearchVector('address', 'city', 'state', weight='B', config='english')
+        + SearchVector(array_to_string('amenities'), array_to_string('landmarks'), weight='C', config='english')
+        + SearchVector('description', weight='D', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0011_property_feed_indexes'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddField(
+            model_name='property',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='properties_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('country'), name='gin_trgm_ops'), name='properties_country_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('state'), name='gin_trgm_ops'), name='properties_state_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['apartment_type'], name='properties_apartment_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
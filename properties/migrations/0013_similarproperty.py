@@ -0,0 +1,35 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0012_property_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProperty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_properties', to='properties.property')),
+                ('similar_property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='properties.property')),
+            ],
+            options={
+                'db_table': 'SimilarProperties',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='similarproperty',
+            index=models.Index(fields=['property', '-score'], name='similar_properties_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='similarproperty',
+            constraint=models.UniqueConstraint(fields=('property', 'similar_property'), name='unique_similar_property'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0013_similarproperty'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='default_image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
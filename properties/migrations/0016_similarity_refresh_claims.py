@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0015_similarity_refreshes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='similarityrefresh',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='similarityrefresh',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,9 +1,18 @@
+import copy
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
+from django.core.cache import cache
 from users.models import User, Company
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Upper
 from album.models import MediaFiles, MediaAlbum
+from notifications.models import Notifications
+from utils.cache import invalidate_cache_namespace
+from utils.constants import (AGENT_SUMMARY_CACHE_TIMEOUT, PROPERTY_LISTING_CACHE,
+                             PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
 
 
 MODERATION_STATUS_CHOICES = [
@@ -21,6 +30,19 @@ PROPERTY_STAGE_CHOICES = [
     ('SOLD', 'Property has been sold off')
 ]
 
+SEARCH_VECTOR_CONFIG = 'english'
+## fields that feed Property.search_vector; saving any other field leaves it untouched
+SEARCH_VECTOR_FIELDS = ['name', 'address', 'city', 'state', 'amenities', 'landmarks', 'description']
+
+
+class ArrayToString(models.Func):
+    function = 'array_to_string'
+    output_field = models.TextField()
+
+    def __init__(self, expression, delimiter=' ', **extra):
+        super().__init__(expression, models.Value(delimiter), **extra)
+
+
 def get_default_image_upload_path(instance, filename):
     name = "properties"
     date = str(timezone.now().date())
@@ -73,6 +95,7 @@ class Property(models.Model):
     # listing_date = models.DateField(null=True)
     # additional_details = models.JSONField(default=dict)
     default_image = models.ImageField(upload_to=get_default_image_upload_path, null=True)
+    default_image_variants = models.JSONField(default=dict, blank=True)
     price_per_share = models.PositiveBigIntegerField(null=True)
     completion_cost = models.PositiveBigIntegerField(null=True)
     completion_date = models.DateField(null=True)
@@ -96,11 +119,133 @@ class Property(models.Model):
     certificate_of_occupancy   = models.FileField(upload_to='certificate_of_occupancy/', null=True)
     registered_deed_of_assignment   = models.FileField(upload_to='registered_deed_of_assignment/', null=True)
 
+    search_vector = SearchVectorField(null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'Properties'
+        indexes = [
+            # public feeds: approved listings/marketplace newest first, top deals by discount
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='properties_listing_feed_idx',
+                condition=models.Q(moderation_status='APPROVED', stage='LISTING')),
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='properties_marketplace_idx',
+                condition=models.Q(moderation_status='APPROVED', stage='MARKETPLACE')),
+            models.Index(
+                fields=['-percentage_discount', 'promotion_closing_date'],
+                name='properties_topdeals_idx',
+                condition=models.Q(moderation_status='APPROVED')),
+            models.Index(
+                fields=['moderation_status', 'stage', '-created_at'],
+                name='properties_status_stage_idx'),
+            # full-text search and fuzzy (icontains/iregex) location filters
+            GinIndex(fields=['search_vector'], name='properties_search_idx'),
+            GinIndex(OpClass(Upper('country'), name='gin_trgm_ops'), name='properties_country_trgm_idx'),
+            GinIndex(OpClass(Upper('state'), name='gin_trgm_ops'), name='properties_state_trgm_idx'),
+            GinIndex(fields=['apartment_type'], opclasses=['gin_trgm_ops'], name='properties_apartment_trgm_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        ## remember the stored status so post_save can tell if a property left the public feeds
+        instance._loaded_moderation_status = instance.__dict__.get('moderation_status')
+        instance._loaded_search_values = instance.get_search_values()
+        return instance
+
+    def get_search_values(self):
+        ## copies, so amenities edited in place still count as a change; deferred fields
+        ## stay out of __dict__, and so compare equal until they are assigned
+        return [copy.copy(self.__dict__.get(field)) for field in SEARCH_VECTOR_FIELDS]
+
+    def has_search_values_changed(self, update_fields=None):
+        if update_fields is not None and not set(update_fields) & set(SEARCH_VECTOR_FIELDS):
+            return False
+        return getattr(self, '_loaded_search_values', None) != self.get_search_values()
+
+    @staticmethod
+    def get_search_vector():
+        return (
+            SearchVector('name', weight='A', config=SEARCH_VECTOR_CONFIG)
+            + SearchVector('address', 'city', 'state', weight='B', config=SEARCH_VECTOR_CONFIG)
+            + SearchVector(ArrayToString('amenities'), ArrayToString('landmarks'),
+                           weight='C', config=SEARCH_VECTOR_CONFIG)
+            + SearchVector('description', weight='D', config=SEARCH_VECTOR_CONFIG)
+        )
+
+    @classmethod
+    def update_search_vector(cls, *property_ids):
+        queryset = cls.objects.all()
+        if property_ids:
+            queryset = queryset.filter(id__in=property_ids)
+        return queryset.update(search_vector=cls.get_search_vector())
+
+    @staticmethod
+    def get_listed_properties_count(agent_id):
+        """Number of approved properties of an agent, cached until one of them changes."""
+        return cache.get_or_set(
+            f'agent_listed_properties:{agent_id}',
+            lambda: Property.objects.filter(agent_id=agent_id, moderation_status='APPROVED').count(),
+            AGENT_SUMMARY_CACHE_TIMEOUT)
+
+    @staticmethod
+    def clear_listed_properties_count(*agent_ids):
+        keys = [f'agent_listed_properties:{agent_id}' for agent_id in agent_ids]
+        ## wait for the write to be visible, or a concurrent read could re-cache the old count
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @classmethod
+    def bulk_moderate(cls, queryset, status):
+        """
+        Set the moderation status of every property in `queryset` with one UPDATE,
+        notify the agents in one insert and invalidate the caches once.
+        Returns the matched properties and the ids whose status actually changed.
+        """
+        with transaction.atomic():
+            properties = list(queryset.select_for_update(of=('self',)).select_related('agent').only(
+                'id', 'name', 'moderation_status', 'agent__id', 'agent__role'))
+            changed = [property for property in properties if property.moderation_status != status]
+            if not changed:
+                return properties, set()
+
+            cls.objects.filter(id__in=[property.id for property in changed]).update(
+                moderation_status=status, updated_at=timezone.now())
+
+            Notifications.new_bulk_entry([
+                {"user": property.agent,
+                 "message": f'Property {property.name} moderation status changed to {status}'}
+                for property in changed
+            ])
+
+            ## queryset.update() skips the post_save receivers that normally do this
+            cls.clear_listed_properties_count(*{property.agent_id for property in changed})
+            approved = MODERATION_STATUS_CHOICES[1][0]
+            if status == approved or any(property.moderation_status == approved for property in changed):
+                invalidate_cache_namespace(PROPERTY_LISTING_CACHE, PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
+
+        return properties, {property.id for property in changed}
+
+    @staticmethod
+    def attach_media(properties, documents=True):
+        """Set `images` (and `documents`) on every property using a single MediaFiles query."""
+        album_ids = [property.image_album_id for property in properties]
+        if documents:
+            album_ids += [property.document_album_id for property in properties]
+
+        media_by_album = {}
+        for media_file in MediaFiles.objects.filter(album_id__in=[id for id in album_ids if id]):
+            media_by_album.setdefault(media_file.album_id, []).append(media_file)
+
+        for property in properties:
+            setattr(property, 'images', media_by_album.get(property.image_album_id, []))
+            if documents:
+                setattr(property, 'documents', media_by_album.get(property.document_album_id, []))
+        return properties
 
     def get_images(self):
         if not self.image_album:
@@ -196,3 +341,50 @@ class PropertyOwnership(models.Model):
 
     class Meta:
         db_table = 'PropertyOwnerships'
+
+
+class SimilarityRefresh(models.Model):
+    """
+    Properties whose neighbours need recomputing after a save. One row per property,
+    so repeated saves collapse into a single refresh by the next worker batch.
+    A row stays while a worker has it claimed, and is deleted once its refresh is done.
+    """
+
+    property = models.OneToOneField(Property, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    queued_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        db_table = 'SimilarityRefreshes'
+
+    @classmethod
+    def enqueue(cls, property_ids):
+        ## a save during a refresh releases the claim, so the worker leaves the row for another pass
+        cls.objects.bulk_create([cls(property_id=property_id) for property_id in property_ids],
+                                update_conflicts=True, unique_fields=['property'],
+                                update_fields=['claimed_at', 'attempts'])
+
+    @classmethod
+    def get_queue_metrics(cls):
+        """Number of queued properties waiting for a worker and claimed by one."""
+        return cls.objects.aggregate(
+            PENDING=models.Count('property', filter=models.Q(claimed_at__isnull=True)),
+            PROCESSING=models.Count('property', filter=models.Q(claimed_at__isnull=False)))
+
+
+class SimilarProperty(models.Model):
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='similar_properties')
+    similar_property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'SimilarProperties'
+        indexes = [
+            models.Index(fields=['property', '-score'], name='similar_properties_score_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'similar_property'], name='unique_similar_property'),
+        ]
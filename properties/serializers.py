@@ -1,4 +1,6 @@
 import json
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ParseError
 
@@ -7,11 +9,24 @@ from .models import (Property, ShoppingCart, PROPERTY_STAGE_CHOICES,
                      PropertyInspection, CHOICES_FOR_INSPECTION_STATUS,
                      PropertyOwnership, CHOICES_FOR_PROPERTY_OWNERSHIP_STATUS,
                      CHOICES_FOR_PROPERTY_OWNER_TYPE)
-from album.models import MediaFiles, MediaAlbum
-from album.serializers import MediaAlbumSerializer, MediaFilesSerializer
+from album.models import MediaFiles, MediaAlbum, ImageDerivativeJob, DirectUpload, CHOICES_FOR_UPLOAD_STATUS
+from album.serializers import MediaAlbumSerializer, MediaFilesSerializer, ImageVariantsField
 from utils.constants import (
-    ALLOWABLE_NUMBER_OF_DOCUMENTS, ALLOWABLE_NUMBER_OF_IMAGES, ALLOWABLE_DOCUMENT_TYPES)
+    ALLOWABLE_NUMBER_OF_DOCUMENTS, ALLOWABLE_NUMBER_OF_IMAGES, ALLOWABLE_DOCUMENT_TYPES,
+    ALLOWABLE_IMAGE_TYPES, DIRECT_UPLOAD_EXPIRY, DIRECT_UPLOAD_MAX_SIZE)
 from utils.date import (greater_than_today)
+from utils.uploads import (get_direct_upload_backend, get_direct_upload_key, get_stored_size,
+                           StorageUploadBatch)
+
+## property fields that can be uploaded straight to storage: (key prefix, content types, files per property)
+DIRECT_UPLOAD_FIELDS = {
+    'images': ('album/images', ALLOWABLE_IMAGE_TYPES, ALLOWABLE_NUMBER_OF_IMAGES),
+    'documents': ('album/documents', ALLOWABLE_DOCUMENT_TYPES, ALLOWABLE_NUMBER_OF_DOCUMENTS),
+    'default_image': ('properties/default_images', ALLOWABLE_IMAGE_TYPES, 1),
+    **{field: (field, ALLOWABLE_DOCUMENT_TYPES, 1) for field in [
+        'approved_survey_plan', 'purchase_receipt', 'excision_document', 'gazette_document',
+        'certificate_of_occupancy', 'registered_deed_of_assignment']},
+}
 
 
 
@@ -82,6 +97,12 @@ class NewPropertySerializer (serializers.ModelSerializer):
             validators=[validate_file_extension, validate_file_size]
             )
     scheduled_stays = serializers.CharField(required=False)
+    uploads = serializers.ListField(
+        child=serializers.UUIDField(),
+        write_only=True,
+        required=False,
+        max_length=sum(limit for _, _, limit in DIRECT_UPLOAD_FIELDS.values())
+    )
 
     class Meta:
         model = Property
@@ -93,11 +114,50 @@ class NewPropertySerializer (serializers.ModelSerializer):
         'percentage_completed', 'total_number_of_shares', 'total_property_cost', 'expected_ROI', 'area_rent_rolls',
         'scheduled_stays', 'images', 'company', 'company_name', 'image_album', 'document_album',
         'registered_deed_of_assignment', 'certificate_of_occupancy', 'gazette_document', 'excision_document', 'purchase_receipt',
-        'approved_survey_plan', 'default_image'
+        'approved_survey_plan', 'default_image', 'uploads'
         ]
         read_only_fields=['id','company','company_name', 'image_album', 'document_album' ]
 
+    def get_direct_uploads(self, upload_ids):
+        """The user's pending direct uploads with these ids, checked to be in storage."""
+        uploads = list(DirectUpload.objects.filter(
+            id__in=upload_ids, user=self.context['request'].user,
+            status=CHOICES_FOR_UPLOAD_STATUS[0][0], expires_at__gt=timezone.now()))
+        if len(uploads) != len(set(upload_ids)):
+            raise serializers.ValidationError({'uploads': ['Unknown, expired or already used upload']})
+
+        for upload in uploads:
+            size = get_stored_size(upload.key)
+            if size is None:
+                raise serializers.ValidationError({'uploads': [f'{upload.id} has not been uploaded']})
+            if size > DIRECT_UPLOAD_MAX_SIZE:
+                raise serializers.ValidationError({'uploads': ['Maximum file size is 8MB']})
+
+        return uploads
+
+    def claim_direct_uploads(self, uploads):
+        """Mark the validated uploads used, failing if another request attached one since validation."""
+        if DirectUpload.mark_used(uploads) != len(uploads):
+            raise serializers.ValidationError({'uploads': ['Unknown, expired or already used upload']})
+
     def validate(self, attrs):
+        upload_ids = attrs.pop('uploads', None)
+        if upload_ids:
+            attrs['direct_uploads'] = self.get_direct_uploads(upload_ids)
+
+            ## the API only records the keys, the files are already in storage
+            for upload in attrs['direct_uploads']:
+                if upload.field in ('images', 'documents'):
+                    attrs[upload.field] = [*attrs.get(upload.field, []), upload.key]
+                else:
+                    attrs[upload.field] = upload.key
+
+            if len(attrs.get('images', [])) > ALLOWABLE_NUMBER_OF_IMAGES:
+                raise serializers.ValidationError({'images': [f'Maximum of {ALLOWABLE_NUMBER_OF_IMAGES} images']})
+            if len(attrs.get('documents', [])) > ALLOWABLE_NUMBER_OF_DOCUMENTS:
+                raise serializers.ValidationError(
+                    {'documents': [f'Maximum of {ALLOWABLE_NUMBER_OF_DOCUMENTS} documents']})
+
         benefits = attrs.get('benefits','')
         amenities = attrs.get('amenities')
         cross_streets = attrs.get('cross_streets')
@@ -132,6 +192,8 @@ class NewPropertySerializer (serializers.ModelSerializer):
             
     def create(self, validated_data):
         media_files_array = []
+        direct_uploads = validated_data.pop('direct_uploads', [])
+        self.claim_direct_uploads(direct_uploads)
 
         uploaded_images = validated_data.get('images')
         uploaded_documents = validated_data.get('documents')
@@ -163,22 +225,33 @@ class NewPropertySerializer (serializers.ModelSerializer):
                 media_files_array.append(
                     MediaFiles(album=document_album, document=document, media_type='DOCUMENT') )
 
-        if len(media_files_array)>0:
-            MediaFiles.objects.bulk_create(media_files_array)
-
         scheduled_stays = validated_data.get('scheduled_stays')
         if scheduled_stays:
             validated_data['scheduled_stays'] = json.loads(scheduled_stays)
         
-        property = Property.objects.create(
+        property = Property(
             **validated_data,
             image_album=image_album,
             document_album=document_album)
 
+        ## store every file of the submission at once rather than one PUT per row saved
+        with StorageUploadBatch() as uploads:
+            uploads.commit([*media_files_array, property])
+
+            if len(media_files_array)>0:
+                MediaFiles.objects.bulk_create(media_files_array)
+            property.save(force_insert=True)
+
+        ImageDerivativeJob.enqueue(media_files_array, 'image')
+        ImageDerivativeJob.enqueue([property], 'default_image')
+
         return property
 
     def update(self, instance, validated_data):
 
+        direct_uploads = validated_data.pop('direct_uploads', [])
+        self.claim_direct_uploads(direct_uploads)
+
         # count existing images and documents for this property if user is attempting to update image/document
         total_images_uploaded, total_documents_uploaded = None, None
 
@@ -189,7 +262,7 @@ class NewPropertySerializer (serializers.ModelSerializer):
             documents = instance.get_documents()
             total_documents_uploaded = len(documents)
 
-        updatable_fields = {}
+        updatable_fields, new_media_files = {}, []
         for key in validated_data:
             if key in ['agent', 'image_album', 'document_album', 'moderation_status']:
                 raise ParseError('Attempting to change Fixed Values')
@@ -224,7 +297,7 @@ class NewPropertySerializer (serializers.ModelSerializer):
                     media_files_array.append(
                         MediaFiles(album=image_album, image=image, media_type='IMAGE'))
 
-                MediaFiles.objects.bulk_create(media_files_array)
+                new_media_files += media_files_array
                 updatable_fields['image_album'] = image_album
 
                 # select one image as default_image if none
@@ -252,7 +325,7 @@ class NewPropertySerializer (serializers.ModelSerializer):
                     media_files_array.append(
                         MediaFiles(album=document_album, document=document, media_type='DOCUMENT'))
 
-                MediaFiles.objects.bulk_create(media_files_array)
+                new_media_files += media_files_array
                 updatable_fields['document_album'] = document_album
 
             elif key == 'scheduled_stays':
@@ -260,7 +333,26 @@ class NewPropertySerializer (serializers.ModelSerializer):
             else:
                 updatable_fields[key] = validated_data.get(key)
 
-        return Property.objects.filter(id=instance.id).update(**updatable_fields)
+        ## the old image's derivatives would be served until the worker replaces them
+        if 'default_image' in updatable_fields:
+            updatable_fields['default_image_variants'] = {}
+
+        ## save() rather than queryset.update() so uploaded files reach storage
+        ## and post_save keeps derived columns (search_vector) in sync
+        for key, value in updatable_fields.items():
+            setattr(instance, key, value)
+
+        with StorageUploadBatch() as uploads:
+            uploads.commit([*new_media_files, instance])
+
+            MediaFiles.objects.bulk_create(new_media_files)
+            instance.save(update_fields=[*updatable_fields, 'updated_at'])
+
+        ImageDerivativeJob.enqueue(new_media_files, 'image')
+        if 'default_image' in updatable_fields:
+            ImageDerivativeJob.enqueue([instance], 'default_image')
+
+        return instance
 
 class StayPeriodSerializer (serializers.Serializer):
 
@@ -286,9 +378,56 @@ class PropertySerializer (serializers.ModelSerializer):
 
     images = MediaFilesSerializer(many=True, required=False)
     documents = MediaFilesSerializer(many=True, required=False)    
+    default_image_variants = ImageVariantsField()
     class Meta:
         model = Property
-        fields = '__all__'
+        exclude = ['search_vector']
+
+
+class DirectUploadSlotSerializer(serializers.Serializer):
+    field = serializers.ChoiceField(choices=list(DIRECT_UPLOAD_FIELDS))
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1, max_value=DIRECT_UPLOAD_MAX_SIZE)
+
+    def validate(self, attrs):
+        _, content_types, _ = DIRECT_UPLOAD_FIELDS[attrs['field']]
+        if attrs['content_type'] not in content_types:
+            raise serializers.ValidationError({'content_type': [f'Allowed types are {", ".join(content_types)}']})
+        return attrs
+
+
+class DirectUploadSlotsSerializer(serializers.Serializer):
+    files = DirectUploadSlotSerializer(many=True, allow_empty=False)
+
+    def validate_files(self, files):
+        for field, (_, _, limit) in DIRECT_UPLOAD_FIELDS.items():
+            if len([file for file in files if file['field'] == field]) > limit:
+                raise serializers.ValidationError(f'At most {limit} {field} per property')
+        return files
+
+    def save(self, user):
+        """Record an upload slot per file. Returns what the client needs to PUT each one."""
+        backend = get_direct_upload_backend()
+        expires_at = timezone.now() + timedelta(seconds=DIRECT_UPLOAD_EXPIRY)
+
+        uploads = DirectUpload.objects.bulk_create([
+            DirectUpload(
+                user=user, field=file['field'], content_type=file['content_type'], size=file['size'],
+                key=get_direct_upload_key(DIRECT_UPLOAD_FIELDS[file['field']][0], file['filename']),
+                expires_at=expires_at)
+            for file in self.validated_data['files']
+        ])
+
+        return [{
+            'id': upload.id,
+            'field': upload.field,
+            'key': upload.key,
+            'method': 'PUT',
+            'url': backend.get_upload_url(upload.key, upload.content_type, upload.size),
+            'headers': {'Content-Type': upload.content_type},
+            'expires_at': upload.expires_at,
+        } for upload in uploads]
 
 
 class SimilarPropertyListSerializer (serializers.ModelSerializer):
@@ -310,41 +449,46 @@ class PropertyTableSerializer (serializers.ModelSerializer):
 
 class PropertyListingSerializer (serializers.ModelSerializer):
 
+    default_image_variants = ImageVariantsField()
     class Meta:
         model = Property
         fields = ['id', 'name', 'created_at', 'company_name', 'agent',
                   'apartment_type', 'address', 'city', 'state', 'apartment_type',
                   'country', 'percentage_discount', 'promotion_closing_date',
-                  'number_of_bedrooms', 'number_of_toilets', 'default_image', 'total_property_cost',
+                  'number_of_bedrooms', 'number_of_toilets', 'default_image', 'default_image_variants', 'total_property_cost',
                   'total_number_of_shares', 'price_per_share']
 
 class PropertyMarketplaceSerializer (serializers.ModelSerializer):
 
     image_album = MediaAlbumSerializer()
+    default_image_variants = ImageVariantsField()
     class Meta:
         model = Property
         fields = ['id', 'name', 'created_at', 'company_name', 'agent', 'description',
                   'apartment_type', 'address', 'city', 'state', 'apartment_type',
                   'country', 'percentage_discount', 'promotion_closing_date',
-                  'number_of_bedrooms', 'number_of_toilets', 'default_image', 'total_property_cost',
+                  'number_of_bedrooms', 'number_of_toilets', 'default_image', 'default_image_variants', 'total_property_cost',
                   'total_number_of_shares', 'price_per_share', 'image_album', 'percentage_sold']
 
 class PropertyTopdealsSerializer (serializers.ModelSerializer):
 
     image_album = MediaAlbumSerializer()
+    default_image_variants = ImageVariantsField()
     class Meta:
         model = Property
         fields = ['id', 'name', 'created_at', 'company_name', 'agent', 'description',
                   'apartment_type', 'address', 'city', 'state', 'apartment_type',
                   'country', 'percentage_discount', 'promotion_closing_date',
-                  'number_of_bedrooms', 'number_of_toilets', 'default_image', 'total_property_cost',
+                  'number_of_bedrooms', 'number_of_toilets', 'default_image', 'default_image_variants', 'total_property_cost',
                   'total_number_of_shares', 'price_per_share', 'image_album']
 class ShoppingCartPropertySerializer(serializers.ModelSerializer):
 
+    default_image_variants = ImageVariantsField()
+
     class Meta:
         model = Property
         fields = ['id', 'company_name', 'name',
-                  'price_per_share', 'total_number_of_shares', 'default_image']
+                  'price_per_share', 'total_number_of_shares', 'default_image', 'default_image_variants']
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
 
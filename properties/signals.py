@@ -0,0 +1,60 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Property, SimilarityRefresh, MODERATION_STATUS_CHOICES
+from album.models import MediaFiles, StorageDeletion, ContentBlob, get_stored_names
+from users.models import User, Company
+from utils.cache import invalidate_cache_namespace
+from utils.constants import (PROPERTY_LISTING_CACHE, PROPERTY_MARKETPLACE_CACHE,
+                             PROPERTY_TOPDEALS_CACHE)
+from .similarity import SIMILARITY_FIELDS
+
+
+@receiver(post_save, sender=Property)
+def refresh_search_vector(sender, instance, update_fields=None, **kwargs):
+    ## most saves leave the searched text alone and shouldn't pay for a second UPDATE;
+    ## queryset.update() doesn't fire post_save, so this can't recurse
+    if instance.has_search_values_changed(update_fields):
+        Property.update_search_vector(instance.id)
+        instance._loaded_search_values = instance.get_search_values()
+
+
+@receiver(post_save, sender=Property)
+def queue_similarity_refresh(sender, instance, update_fields=None, **kwargs):
+    ## the neighbour scan is O(properties), so it runs in the process_similarity_refreshes worker
+    if update_fields is None or set(update_fields) & set(SIMILARITY_FIELDS):
+        SimilarityRefresh.enqueue([instance.id])
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def clear_agent_summary(sender, instance, **kwargs):
+    ## moderation changes go through save(), so this keeps listed_properties exact
+    Property.clear_listed_properties_count(instance.agent_id)
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def invalidate_property_feeds(sender, instance, **kwargs):
+    ## only approved properties are in the public feeds, before or after this change
+    approved = MODERATION_STATUS_CHOICES[1][0]
+    if approved in (instance.moderation_status, getattr(instance, '_loaded_moderation_status', None)):
+        invalidate_cache_namespace(PROPERTY_LISTING_CACHE, PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
+
+
+@receiver(post_save, sender=MediaFiles)
+@receiver(post_delete, sender=MediaFiles)
+def invalidate_property_image_feeds(sender, instance, **kwargs):
+    ## marketplace and topdeals embed image_album.media; listings don't
+    if instance.media_type == 'IMAGE':
+        invalidate_cache_namespace(PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
+
+
+@receiver(post_delete, sender=MediaFiles)
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Company)
+def queue_storage_deletion(sender, instance, **kwargs):
+    ## runs inside the delete's transaction, so the files are only queued if the rows are really gone;
+    ## a deduplicated file only goes once the last row referencing its blob does
+    StorageDeletion.enqueue(ContentBlob.release(get_stored_names(instance)))
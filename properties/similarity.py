@@ -0,0 +1,145 @@
+import math
+from datetime import timedelta
+from typing import Dict
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Property, SimilarProperty, SimilarityRefresh
+from utils.constants import (MAXIMUM_SIMILAR_PROPERTIES, SIMILARITY_REFRESH_BATCH_SIZE,
+                             SIMILARITY_REFRESH_MAX_ATTEMPTS, SIMILARITY_REFRESH_CLAIM_TIMEOUT)
+
+
+## weight of each feature when comparing two properties
+FEATURE_WEIGHTS = {
+    'state': 3.0,
+    'city': 2.0,
+    'apartment_type': 3.0,
+    'bedrooms': 1.5,
+    'toilets': 1.0,
+    'price_band': 2.0,
+    'amenity': 0.5,
+}
+
+## fields that feed the feature vector; saving any other field leaves neighbours untouched
+SIMILARITY_FIELDS = ['state', 'city', 'apartment_type', 'number_of_bedrooms',
+                     'number_of_toilets', 'price_per_share', 'amenities']
+
+
+def get_feature_vector(property: Property) -> Dict[str, float]:
+    features = {}
+
+    for name, value in [('state', property.state), ('city', property.city),
+                        ('apartment_type', property.apartment_type)]:
+        if value:
+            features[f'{name}:{value.strip().lower()}'] = FEATURE_WEIGHTS[name]
+
+    if property.number_of_bedrooms is not None:
+        features[f'bedrooms:{property.number_of_bedrooms}'] = FEATURE_WEIGHTS['bedrooms']
+
+    if property.number_of_toilets is not None:
+        features[f'toilets:{property.number_of_toilets}'] = FEATURE_WEIGHTS['toilets']
+
+    ## price bands double in width, so 1.5M and 1.9M share a band but 1M and 3M don't
+    if property.price_per_share:
+        price_band = int(math.log2(property.price_per_share))
+        features[f'price_band:{price_band}'] = FEATURE_WEIGHTS['price_band']
+
+    for amenity in property.amenities or []:
+        if amenity.strip():
+            features[f'amenity:{amenity.strip().lower()}'] = FEATURE_WEIGHTS['amenity']
+
+    return features
+
+
+def get_similarity_score(a: Dict[str, float], b: Dict[str, float]) -> float:
+    """Weighted Jaccard similarity between two feature vectors."""
+    keys = a.keys() | b.keys()
+    if not keys:
+        return 0.0
+
+    intersection = sum(min(a.get(key, 0), b.get(key, 0)) for key in keys)
+    union = sum(max(a.get(key, 0), b.get(key, 0)) for key in keys)
+    return intersection / union
+
+
+def refresh_similar_properties(property: Property) -> int:
+    """
+    Recompute the neighbours of `property` and store them in both directions.
+    Returns the number of neighbours found.
+    """
+    features = get_feature_vector(property)
+
+    ## only properties sharing a state or apartment type can score well enough to matter
+    candidates = Property.objects.filter(
+        Q(state__iexact=property.state) | Q(apartment_type__iexact=property.apartment_type)
+    ).exclude(id=property.id).only(
+        'id', 'state', 'city', 'apartment_type', 'number_of_bedrooms',
+        'number_of_toilets', 'price_per_share', 'amenities')
+
+    scores = {}
+    for candidate in candidates.iterator():
+        score = get_similarity_score(features, get_feature_vector(candidate))
+        if score > 0:
+            scores[candidate.id] = score
+
+    nearest = sorted(scores, key=scores.get, reverse=True)[:MAXIMUM_SIMILAR_PROPERTIES]
+
+    with transaction.atomic():
+        ## properties that already list this one keep it, with a refreshed score
+        reverse_ids = set(SimilarProperty.objects.filter(
+            similar_property=property).values_list('property_id', flat=True))
+        reverse_ids.update(nearest)
+
+        SimilarProperty.objects.filter(
+            Q(property=property) | Q(similar_property=property)
+        ).delete()
+
+        neighbours = [
+            SimilarProperty(property_id=property.id, similar_property_id=candidate_id, score=scores[candidate_id])
+            for candidate_id in nearest
+        ]
+        neighbours += [
+            SimilarProperty(property_id=candidate_id, similar_property_id=property.id, score=scores[candidate_id])
+            for candidate_id in reverse_ids if candidate_id in scores
+        ]
+
+        ## a concurrent refresh of a neighbour may have stored the same pair; the score is symmetric
+        SimilarProperty.objects.bulk_create(neighbours, ignore_conflicts=True)
+
+    return len(nearest)
+
+
+def process_similarity_refreshes(batch_size=SIMILARITY_REFRESH_BATCH_SIZE) -> int:
+    """
+    Claim a batch of queued properties and recompute their neighbours. A row is deleted
+    once its property is refreshed, unless a save released the claim in the meantime.
+    Returns the number of properties claimed.
+    """
+    now = timezone.now()
+
+    ## claims past the timeout belong to a worker that died or failed mid-batch. Every claim
+    ## counts as an attempt; a property that keeps failing is dropped until its next save
+    stale = Q(claimed_at__lt=now - timedelta(seconds=SIMILARITY_REFRESH_CLAIM_TIMEOUT))
+
+    with transaction.atomic():
+        SimilarityRefresh.objects.filter(stale, attempts__gte=SIMILARITY_REFRESH_MAX_ATTEMPTS).delete()
+
+        property_ids = list(SimilarityRefresh.objects.select_for_update(skip_locked=True).filter(
+            Q(claimed_at__isnull=True) | (stale & Q(attempts__lt=SIMILARITY_REFRESH_MAX_ATTEMPTS))
+        ).order_by('queued_at').values_list('property_id', flat=True)[:batch_size])
+
+        SimilarityRefresh.objects.filter(property_id__in=property_ids).update(
+            claimed_at=now, attempts=F('attempts') + 1)
+
+    done_ids = []
+    try:
+        for property in Property.objects.filter(id__in=property_ids):
+            refresh_similar_properties(property)
+            done_ids.append(property.id)
+    finally:
+        ## what this batch didn't get to stays claimed, and is retried after the timeout
+        SimilarityRefresh.objects.filter(property_id__in=done_ids, claimed_at=now).delete()
+
+    return len(property_ids)
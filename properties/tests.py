@@ -1,3 +1,598 @@
-from django.test import TestCase
+import os
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APIClient
+from PIL import Image
 
-# Create your tests here.
+from .models import Property, SimilarProperty, SimilarityRefresh
+from .serializers import NewPropertySerializer
+from . import similarity
+from .similarity import get_feature_vector, get_similarity_score, process_similarity_refreshes
+from .filters import PropertySearchFilter
+from .views import PropertyListingViewset, PropertyMarketplaceViewset, PropertyTopdealsViewset
+from album.models import MediaAlbum, MediaFiles, ImageDerivativeJob, DirectUpload, ContentBlob, StorageDeletion
+from users.models import User, Company
+from utils.metrics import storage_upload_metrics
+from utils.pagination import get_cached_count
+from utils.constants import (FEED_CACHE_TIMEOUT, FEED_LOCAL_CACHE_TIMEOUT, SIMILARITY_REFRESH_MAX_ATTEMPTS,
+                             SIMILARITY_REFRESH_CLAIM_TIMEOUT)
+from utils.renderers import FastJSONRenderer, FastJSONParser, orjson
+
+
+class PropertyFeedIndexTestCase(TestCase):
+
+    def explain_feed(self, viewset_class):
+        view = viewset_class()
+        view.request = Request(APIRequestFactory().get('/'))
+        queryset = view.get_queryset()
+
+        with connection.cursor() as cursor:
+            # planner always prefers a seq scan on an empty table
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_listing_feed_uses_partial_index(self):
+        self.assertIn('properties_listing_feed_idx', self.explain_feed(PropertyListingViewset))
+
+    def test_marketplace_feed_uses_partial_index(self):
+        self.assertIn('properties_marketplace_idx', self.explain_feed(PropertyMarketplaceViewset))
+
+    def test_topdeals_feed_uses_partial_index(self):
+        self.assertIn('properties_topdeals_idx', self.explain_feed(PropertyTopdealsViewset))
+
+
+
+
+class PropertyFeedCursorPaginationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        self.company = Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+
+    def create_properties(self, count, created_at=None):
+        properties = [Property.objects.create(
+            name=f'Property {index}', agent=self.agent, company=self.company, apartment_type='duplex',
+            address='1 Admiralty Way', state='Lagos', country='Nigeria', moderation_status='APPROVED')
+            for index in range(count)]
+        if created_at:
+            Property.objects.filter(id__in=[property.id for property in properties]).update(created_at=created_at)
+        return properties
+
+    def get_pages(self, url='/api/v1/properties/listings/?pagination=cursor&limit=2', between_pages=None):
+        pages = []
+        while url:
+            response = APIClient().get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.data)
+            url = response.data['links']['next']
+            if between_pages:
+                between_pages()
+        return pages
+
+    def test_cursor_is_stable_across_inserts(self):
+        properties = self.create_properties(5)
+        inserted = []
+
+        pages = self.get_pages(between_pages=lambda: inserted.extend(self.create_properties(1)))
+
+        ## the newer rows sort ahead of the cursor, so no row is skipped or repeated
+        seen = [row['id'] for page in pages for row in page['results']]
+        expected = sorted(properties, key=lambda property: (property.created_at, property.id), reverse=True)
+        self.assertEqual(seen, [str(property.id) for property in expected])
+        self.assertFalse({str(property.id) for property in inserted} & set(seen))
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        properties = self.create_properties(5, created_at=timezone.now())
+
+        pages = self.get_pages()
+
+        seen = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual(seen, sorted((str(property.id) for property in properties), reverse=True))
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+
+    def test_total_comes_from_a_cached_count(self):
+        self.create_properties(3)
+        queryset = Property.objects.filter(moderation_status='APPROVED')
+
+        self.assertEqual(get_cached_count(queryset), 3)
+        self.create_properties(1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_count(queryset.order_by('-created_at')), 3)
+        self.assertEqual(get_cached_count(queryset.filter(state='Lagos')), 4)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_count(queryset.filter(id__in=[])), 0)
+
+        pages = self.get_pages('/api/v1/properties/listings/?pagination=cursor&limit=3')
+        self.assertEqual([(page['total'], page['limit'], page['pages']) for page in pages], [(4, 3, 2)] * 2)
+
+
+class FeedCacheTimeoutTestCase(SimpleTestCase):
+
+    def test_local_memory_cache_keeps_feeds_briefly(self):
+        self.assertEqual(PropertyMarketplaceViewset().get_cache_timeout(), FEED_LOCAL_CACHE_TIMEOUT)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}})
+    def test_shared_cache_keeps_feeds_until_invalidated(self):
+        self.assertEqual(PropertyMarketplaceViewset().get_cache_timeout(), FEED_CACHE_TIMEOUT)
+        self.assertEqual(PropertyTopdealsViewset().get_cache_timeout(), 60 * 60)
+
+
+class PropertyDetailQueryCountTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        company = Company.objects.create(
+            user=agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+        image_album, document_album = MediaAlbum.objects.create(), MediaAlbum.objects.create()
+        MediaFiles.objects.bulk_create([
+            MediaFiles(album=image_album, image='properties/images/front.jpg', media_type='IMAGE'),
+            MediaFiles(album=document_album, document='properties/documents/deed.pdf', media_type='DOCUMENT'),
+        ])
+        self.property = Property.objects.create(
+            name='Lekki Duplex', agent=agent, company=company, apartment_type='duplex',
+            address='1 Admiralty Way', state='Lagos', country='Nigeria',
+            image_album=image_album, document_album=document_album)
+
+    def test_query_count(self):
+        ## the property with its agent, then the media of both albums; a cold
+        ## cache adds the count of the agent's listed properties
+        with self.assertNumQueries(3):
+            response = APIClient().get(f'/api/v1/properties/single/{self.property.id}/')
+        with self.assertNumQueries(2):
+            response = APIClient().get(f'/api/v1/properties/single/{self.property.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['images'], [{'image': 'properties/images/front.jpg', 'image_variants': {}}])
+        self.assertEqual(response.data['documents'], [{'document': 'properties/documents/deed.pdf'}])
+        self.assertEqual(response.data['agent']['listed_properties'], 0)
+
+    def test_listed_count_is_cleared_once_the_change_commits(self):
+        key = f'agent_listed_properties:{self.property.agent_id}'
+        Property.get_listed_properties_count(self.property.agent_id)
+
+        ## a read before the commit would otherwise re-cache the old count
+        with self.captureOnCommitCallbacks(execute=True):
+            Property.bulk_moderate(Property.objects.all(), 'APPROVED')
+            self.assertEqual(cache.get(key), 0)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(Property.get_listed_properties_count(self.property.agent_id), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.property.delete()
+            self.assertEqual(cache.get(key), 1)
+        self.assertIsNone(cache.get(key))
+
+
+class DirectUploadTestCase(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, FILE_UPLOAD_STORAGE='local',
+                                     DIRECT_UPLOAD_BACKEND='utils.uploads.LocalDirectUploadBackend')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    def request_slots(self, files):
+        response = self.client.post('/api/v1/properties/upload_slots/', {'files': files}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['uploads']
+
+    def put(self, upload, body):
+        return self.client.generic('PUT', upload['url'], body, content_type=upload['headers']['Content-Type'])
+
+    def test_property_records_uploaded_keys(self):
+        uploads = self.request_slots([
+            {'field': 'images', 'filename': 'front.png', 'content_type': 'image/png', 'size': 5},
+            {'field': 'default_image', 'filename': 'front.png', 'content_type': 'image/png', 'size': 5},
+            {'field': 'documents', 'filename': 'deed.pdf', 'content_type': 'application/pdf', 'size': 3},
+        ])
+        for upload, body in zip(uploads, [b'image', b'image', b'pdf']):
+            self.assertEqual(self.put(upload, body).status_code, 200)
+
+        response = self.client.post('/api/v1/properties/new/', {
+            'name': 'Lekki Duplex', 'apartment_type': 'duplex', 'address': '1 Admiralty Way', 'state': 'Lagos',
+            'country': 'Nigeria',
+            'uploads': [upload['id'] for upload in uploads]})
+        self.assertEqual(response.status_code, 200, response.content)
+
+        property = Property.objects.get(id=response.json()['id'])
+        self.assertEqual(property.default_image.name, uploads[1]['key'])
+        self.assertEqual(list(MediaFiles.objects.filter(album=property.image_album).values_list('image', flat=True)),
+                         [uploads[0]['key']])
+        self.assertEqual(list(MediaFiles.objects.filter(album=property.document_album).values_list(
+            'document', flat=True)), [uploads[2]['key']])
+        self.assertEqual(ImageDerivativeJob.objects.count(), 2)
+        self.assertEqual(set(DirectUpload.objects.values_list('status', flat=True)), {'USED'})
+
+        ## an upload is only ever attached once
+        response = self.client.patch(f'/api/v1/properties/update/{property.id}/', {
+            'name': 'Lekki Duplex', 'apartment_type': 'duplex', 'address': '1 Admiralty Way', 'state': 'Lagos',
+            'country': 'Nigeria', 'uploads': [uploads[0]['id']]})
+        self.assertEqual(response.json()['payload'], {'uploads': ['Unknown, expired or already used upload']})
+
+    def test_upload_attached_by_a_concurrent_request_is_rejected(self):
+        upload, = self.request_slots([
+            {'field': 'images', 'filename': 'front.png', 'content_type': 'image/png', 'size': 5}])
+        self.assertEqual(self.put(upload, b'image').status_code, 200)
+
+        ## another request attaches the slot after this one has validated it
+        get_direct_uploads = NewPropertySerializer.get_direct_uploads
+        def validate_then_lose_race(serializer, upload_ids):
+            uploads = get_direct_uploads(serializer, upload_ids)
+            DirectUpload.objects.filter(id__in=upload_ids).update(status='USED')
+            return uploads
+
+        with mock.patch.object(NewPropertySerializer, 'get_direct_uploads', validate_then_lose_race):
+            response = self.client.post('/api/v1/properties/new/', {
+                'name': 'Lekki Duplex', 'apartment_type': 'duplex', 'address': '1 Admiralty Way', 'state': 'Lagos',
+                'country': 'Nigeria', 'uploads': [upload['id']]})
+        self.assertEqual(response.json()['payload'], {'uploads': ['Unknown, expired or already used upload']})
+        self.assertFalse(Property.objects.exists())
+        self.assertFalse(MediaFiles.objects.exists())
+
+    def test_rejects_uploads_that_do_not_match_their_slot(self):
+        upload, = self.request_slots([
+            {'field': 'images', 'filename': 'front.png', 'content_type': 'image/png', 'size': 5}])
+
+        response = self.client.post('/api/v1/properties/new/', {
+            'name': 'Lekki Duplex', 'apartment_type': 'duplex', 'address': '1 Admiralty Way', 'state': 'Lagos',
+            'country': 'Nigeria',
+            'uploads': [upload['id']]})
+        self.assertEqual(response.json()['payload'], {'uploads': [f'{upload["id"]} has not been uploaded']})
+
+        self.assertEqual(self.put(upload, b'too long').status_code, 400)
+        self.assertEqual(self.put({**upload, 'headers': {'Content-Type': 'image/gif'}}, b'image').status_code, 400)
+        self.assertEqual(self.put({**upload, 'url': upload['url'][:-3] + '/'}, b'image').status_code, 403)
+
+    def test_slot_limits(self):
+        response = self.client.post('/api/v1/properties/upload_slots/', {'files': [
+            {'field': 'default_image', 'filename': 'front.exe', 'content_type': 'application/x-msdownload',
+             'size': 5}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/v1/properties/upload_slots/', {'files': [
+            {'field': 'images', 'filename': f'{index}.png', 'content_type': 'image/png', 'size': 5}
+            for index in range(6)]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+def get_image(name, color):
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class StorageUploadBatchTestCase(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root, FILE_UPLOAD_STORAGE='local')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        storage_upload_metrics.reset()
+
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    def submit(self):
+        return self.client.post('/api/v1/properties/new/', {
+            'name': 'Lekki Duplex', 'apartment_type': 'duplex', 'address': '1 Admiralty Way', 'state': 'Lagos',
+            'country': 'Nigeria', 'images': [get_image('front.png', 'red'), get_image('back.png', 'blue')],
+            'default_image': get_image('side.png', 'green'),
+            'purchase_receipt': SimpleUploadedFile('receipt.pdf', b'%PDF receipt', content_type='application/pdf'),
+            'registered_deed_of_assignment': SimpleUploadedFile(
+                'deed.pdf', b'%PDF deed', content_type='application/pdf'),
+        })
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_files_of_a_submission_are_stored_concurrently(self):
+        original_save, threads = FileSystemStorage._save, set()
+
+        def slow_save(storage, name, content):
+            threads.add(threading.current_thread().name)
+            time.sleep(0.05)
+            return original_save(storage, name, content)
+
+        with mock.patch.object(FileSystemStorage, '_save', slow_save):
+            response = self.submit()
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(self.stored_files()), 5)
+        ## on the process-wide pool, whose threads outlive the request
+        self.assertTrue(all(name.startswith('storage-upload') for name in threads), threads)
+
+        [metrics] = storage_upload_metrics.as_dict()
+        self.assertEqual((metrics['storage'], metrics['files']['sum']), ('FileSystemStorage', 5))
+        self.assertGreaterEqual(metrics['estimated_sequential_ms']['sum'], 250)
+        self.assertLess(metrics['wall_ms']['sum'], metrics['estimated_sequential_ms']['sum'] / 2)
+
+    def test_failed_upload_discards_the_whole_submission(self):
+        original_save = FileSystemStorage._save
+
+        def failing_save(storage, name, content):
+            if content.name == 'deed.pdf':
+                raise OSError('storage unavailable')
+            return original_save(storage, name, content)
+
+        with mock.patch.object(FileSystemStorage, '_save', failing_save), self.assertRaises(OSError):
+            self.submit()
+
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(Property.objects.exists())
+        self.assertFalse(ContentBlob.objects.exists())
+
+    def test_failed_row_save_discards_the_stored_files(self):
+        self.submit()
+        kept = sorted(self.stored_files())
+        taken = Property.objects.get()
+        original_save = Property.save
+
+        def clashing_save(property, *args, **kwargs):
+            ## a primary key that is already taken breaks the transaction the submission runs in
+            property.id = taken.id
+            return original_save(property, *args, **kwargs)
+
+        client = APIClient()
+        client.force_authenticate(self.agent)
+        with mock.patch.object(Property, 'save', clashing_save), self.assertRaises(IntegrityError):
+            client.post('/api/v1/properties/new/', {
+                'name': 'Ikoyi Terrace', 'apartment_type': 'terrace', 'address': '2 Bourdillon Road',
+                'state': 'Lagos', 'country': 'Nigeria', 'default_image': get_image('roof.png', 'white'),
+                'images': [get_image('front.png', 'red')],
+            })
+
+        ## the new image is gone; the one shared with the earlier submission keeps its reference
+        self.assertEqual(sorted(self.stored_files()), kept)
+        self.assertEqual(Property.objects.count(), 1)
+        self.assertEqual(sorted(ContentBlob.objects.values_list('reference_count', flat=True)), [1, 1, 1, 1, 1])
+
+    def test_replacing_the_default_image_clears_its_variants(self):
+        self.submit()
+        property = Property.objects.get()
+        Property.objects.filter(id=property.id).update(
+            default_image_variants={'320': {'webp': f'{property.default_image.name}_w320.webp'}})
+
+        response = self.client.patch(f'/api/v1/properties/update/{property.id}/', {
+            'name': 'Lekki Duplex', 'apartment_type': 'duplex', 'address': '1 Admiralty Way', 'state': 'Lagos',
+            'country': 'Nigeria', 'default_image': get_image('roof.png', 'white')})
+
+        self.assertEqual(response.status_code, 200, response.content)
+        replaced = Property.objects.get()
+        self.assertNotEqual(replaced.default_image.name, property.default_image.name)
+        self.assertEqual(replaced.default_image_variants, {})
+
+    def test_repeated_files_are_stored_once(self):
+        self.submit()
+        with mock.patch.object(FileSystemStorage, '_save') as save:
+            response = self.submit()
+
+        self.assertEqual(response.status_code, 200, response.content)
+        save.assert_not_called()
+        self.assertEqual(len(self.stored_files()), 5)
+        self.assertEqual(set(ContentBlob.objects.values_list('reference_count', flat=True)), {2})
+        self.assertEqual(storage_upload_metrics.as_dict()[0]['deduplicated']['sum'], 5)
+
+        first, second = Property.objects.order_by('created_at')
+        self.assertEqual(first.registered_deed_of_assignment.name, second.registered_deed_of_assignment.name)
+        self.assertTrue(first.default_image.name.startswith('blobs/'))
+
+        ## a blob stays until the last row pointing at it is gone; the albums outlive the properties
+        first.delete()
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertEqual(sorted(ContentBlob.objects.values_list('reference_count', flat=True)), [1, 1, 1, 2, 2])
+        second.delete()
+        self.assertEqual(StorageDeletion.objects.filter(name__startswith='blobs/').count(), 3)
+
+
+class SimilarPropertiesTestCase(TestCase):
+
+    def setUp(self):
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        self.company = Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+
+    def create_property(self, name, state='Lagos', apartment_type='duplex', price_per_share=1000):
+        return Property.objects.create(
+            name=name, agent=self.agent, company=self.company, apartment_type=apartment_type,
+            address='1 Admiralty Way', state=state, country='Nigeria', price_per_share=price_per_share)
+
+    def test_similarity_score(self):
+        lekki = get_feature_vector(self.create_property('Lekki Duplex'))
+        ikoyi = get_feature_vector(self.create_property('Ikoyi Duplex'))
+        abuja = get_feature_vector(self.create_property('Abuja Flat', state='FCT', apartment_type='flat',
+                                                        price_per_share=100000))
+
+        self.assertEqual(get_similarity_score(lekki, ikoyi), 1.0)
+        self.assertEqual(get_similarity_score(lekki, abuja), 0.0)
+        self.assertEqual(get_similarity_score({}, {}), 0.0)
+
+    def test_saving_queues_a_refresh(self):
+        property = self.create_property('Lekki Duplex')
+        self.create_property('Ikoyi Duplex')
+
+        self.assertTrue(SimilarityRefresh.objects.filter(property=property).exists())
+        self.assertFalse(SimilarProperty.objects.exists())
+
+        ## saving a field the score doesn't use leaves the queue alone
+        SimilarityRefresh.objects.all().delete()
+        property.name = 'Lekki Terrace'
+        property.save(update_fields=['name'])
+        self.assertFalse(SimilarityRefresh.objects.exists())
+
+    def test_worker_stores_neighbours_by_score(self):
+        property = self.create_property('Lekki Duplex')
+        twin = self.create_property('Ikoyi Duplex')
+        cousin = self.create_property('Abuja Duplex', state='FCT')
+        self.create_property('Kano Flat', state='Kano', apartment_type='flat', price_per_share=100000)
+
+        self.assertEqual(process_similarity_refreshes(batch_size=2), 2)
+        self.assertEqual(process_similarity_refreshes(), 2)
+        self.assertEqual(process_similarity_refreshes(), 0)
+
+        neighbours = SimilarProperty.objects.filter(property=property).order_by('-score')
+        self.assertEqual([row.similar_property_id for row in neighbours], [twin.id, cousin.id])
+        self.assertTrue(SimilarProperty.objects.filter(property=cousin, similar_property=property).exists())
+
+        client = APIClient()
+        client.force_authenticate(self.agent)
+        response = client.get(f'/api/v1/properties/similar_properties/{property.id}/')
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([row['id'] for row in response.data], [str(twin.id), str(cousin.id)])
+
+    def test_failed_refreshes_stay_queued_until_the_last_attempt(self):
+        property = self.create_property('Lekki Duplex')
+
+        def fail(instance):
+            raise RuntimeError('database went away')
+
+        for attempt in range(SIMILARITY_REFRESH_MAX_ATTEMPTS):
+            with mock.patch('properties.similarity.refresh_similar_properties', fail):
+                with self.assertRaises(RuntimeError):
+                    process_similarity_refreshes()
+            self.assertEqual(list(SimilarityRefresh.objects.values_list('property_id', 'attempts')),
+                             [(property.id, attempt + 1)])
+            ## the claim holds until it times out
+            self.assertEqual(process_similarity_refreshes(), 0)
+            SimilarityRefresh.objects.update(
+                claimed_at=timezone.now() - timedelta(seconds=SIMILARITY_REFRESH_CLAIM_TIMEOUT + 1))
+
+        ## given up on until the property is saved again
+        self.assertEqual(process_similarity_refreshes(), 0)
+        self.assertFalse(SimilarityRefresh.objects.exists())
+
+    def test_save_during_a_refresh_queues_the_property_again(self):
+        property = self.create_property('Lekki Duplex')
+
+        refresh = similarity.refresh_similar_properties
+        def save_while_refreshing(instance):
+            property.state = 'FCT'
+            property.save()
+            return refresh(instance)
+
+        with mock.patch('properties.similarity.refresh_similar_properties', save_while_refreshing):
+            self.assertEqual(process_similarity_refreshes(), 1)
+
+        self.assertEqual(list(SimilarityRefresh.objects.values_list('claimed_at', 'attempts')), [(None, 0)])
+        self.assertEqual(process_similarity_refreshes(), 1)
+        self.assertFalse(SimilarityRefresh.objects.exists())
+
+
+class PropertySearchTestCase(TestCase):
+
+    def setUp(self):
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        self.company = Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+
+    def create_property(self, name, description=''):
+        return Property.objects.create(
+            name=name, description=description, agent=self.agent, company=self.company,
+            apartment_type='duplex', address='1 Admiralty Way', state='Lagos', country='Nigeria',
+            price_per_share=1000)
+
+    def search(self, terms):
+        request = Request(APIRequestFactory().get('/', {'search': terms}))
+        queryset = Property.objects.order_by('-created_at')
+        return [property.name for property in PropertySearchFilter().filter_queryset(request, queryset, None)]
+
+    def test_matches_rank_by_field_weight(self):
+        self.create_property('Lekki Duplex')
+        self.create_property('Ikoyi Terrace', description='A short drive from the lekki toll gate')
+        self.create_property('Abuja Flat')
+
+        ## a match in the name outranks one in the description, though it is older
+        self.assertEqual(self.search('lekki'), ['Lekki Duplex', 'Ikoyi Terrace'])
+
+    def test_websearch_syntax(self):
+        self.create_property('Lekki Duplex', description='with a swimming pool')
+        self.create_property('Lekki Terrace', description='pool view')
+
+        self.assertEqual(self.search('lekki -terrace'), ['Lekki Duplex'])
+        self.assertEqual(self.search('"swimming pool"'), ['Lekki Duplex'])
+        self.assertEqual(self.search('duplex or terrace'), ['Lekki Terrace', 'Lekki Duplex'])
+
+    def test_search_vector_follows_searched_fields(self):
+        property = self.create_property('Lekki Duplex')
+        self.assertEqual(self.search('lekki'), ['Lekki Duplex'])
+
+        property = Property.objects.get(id=property.id)
+        property.name = 'Ikoyi Duplex'
+        property.save()
+        self.assertEqual(self.search('ikoyi'), ['Ikoyi Duplex'])
+        self.assertEqual(self.search('lekki'), [])
+
+        ## saving without touching searched text doesn't rewrite the vector
+        property = Property.objects.get(id=property.id)
+        property.percentage_sold = 10
+        with mock.patch.object(Property, 'update_search_vector') as update_search_vector:
+            property.save()
+        update_search_vector.assert_not_called()
+
+
+class FastJSONRendererTestCase(SimpleTestCase):
+
+    data = {
+        'id': uuid.UUID('6f1c4ee0-8d5d-4c6b-9d0a-3f0b5f8e2a11'),
+        'price_per_share': Decimal('1000.50'),
+        'created_at': datetime(2026, 10, 18, 9, 0, tzinfo=dt_timezone.utc),
+        ## counts keyed by rating
+        'ratings': {5: 2, 4: 1},
+        'name': 'Lekki Duplex \u2028',
+    }
+
+    def test_orjson_is_installed(self):
+        self.assertIsNotNone(orjson)
+
+    def test_renders_like_the_stdlib_renderer(self):
+        fast = FastJSONRenderer().render(self.data)
+        with mock.patch('utils.renderers.orjson', None):
+            fallback = FastJSONRenderer().render(self.data)
+
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(self.data)))
+        self.assertEqual(fallback, JSONRenderer().render(self.data))
+        self.assertIn(b'"ratings":{"5":2,"4":1}', fast)
+        self.assertIn(b'\\u2028', fast)
+
+    def test_parses_what_it_renders(self):
+        rendered = FastJSONRenderer().render({'ratings': {5: 2}, 'name': 'Lekki Duplex'})
+        self.assertEqual(FastJSONParser().parse(BytesIO(rendered)), {'ratings': {'5': 2}, 'name': 'Lekki Duplex'})
@@ -5,7 +5,7 @@ from .views import (NewPropertyAPIView, StayPeriodAPIView,
                     ShoppingCartAPIView, CreateAndListSiteVisitAPIView, PropertyTopdealsViewset,
                     AcceptAndRejectInspectionAPIView, PropertyListingViewset,PropertyMarketplaceViewset,
                     CancelSiteVisitAPIView, AgentPropertyInspectionsAPIView, CreatePropertyOwnershipAPIView,
-                    CreateMarketplaceBuyOrderAPIView
+                    CreateMarketplaceBuyOrderAPIView, DirectUploadSlotsAPIView, LocalDirectUploadView
                     )
 
 urlpatterns = [
@@ -24,6 +24,8 @@ urlpatterns = [
          StayPeriodAPIView.as_view(), name='delete_stay_periods'),
     path('single/<property_id>/', PropertyDetailView.as_view(), name='single_property'),
     path('update/<property_id>/', UpdatePropertyAPIView.as_view(), name='update_property'),
+    path('upload_slots/', DirectUploadSlotsAPIView.as_view(), name='direct_upload_slots'),
+    path('uploads/<token>/', LocalDirectUploadView.as_view(), name='local_direct_upload'),
     path('media/<media_type>/<property_id>/<media_id>/',
          RemoveMediaView.as_view(), name='property_media'),
     path('similar_properties/<property_id>/',
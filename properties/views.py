@@ -1,25 +1,36 @@
 import json
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import Http404
 from rest_framework import (views, permissions, parsers)
 from rest_framework.response import Response
 from django.db import transaction
 from rest_framework.filters import SearchFilter
 from rest_framework.viewsets import ReadOnlyModelViewSet
-from django.db.models import Q, Prefetch
+from django.db.models import Prefetch
 from django.utils import timezone
 
 from .serializers import (NewPropertySerializer, StayPeriodSerializer, PropertyInspectionQuerySerializer,
                           PropertySerializer, ShoppingCartSerializer, PropertyTableSerializer, PropertyMarketplaceSerializer,
                           SimilarPropertyListSerializer, RemoveShopingCartItemSerializer, PropertyListingSerializer,
                           ScheduleSiteInspectionSerializer, PropertyInspectionSerializer, PropertyTopdealsSerializer,
-                          PropertyOwnershipSerializer, CreatePropertyOwnershipSerializer, CreateMarkeplaceBuyOrderSerializer)
+                          PropertyOwnershipSerializer, CreatePropertyOwnershipSerializer, CreateMarkeplaceBuyOrderSerializer,
+                          DirectUploadSlotsSerializer)
 from authentication.permissions import IsAgent, IsCustomer
-from .models import Property, ShoppingCart, PropertyInspection, MODERATION_STATUS_CHOICES, PROPERTY_STAGE_CHOICES
+from .filters import PropertySearchFilter
+from .models import (Property, ShoppingCart, PropertyInspection, SimilarProperty,
+                     MODERATION_STATUS_CHOICES, PROPERTY_STAGE_CHOICES)
 from album.models import MediaFiles
+from album.serializers import ImageVariantsField
 from users.models import Company
 from notifications.models import Notifications
-from utils.pagination import CustomPagination
-from utils.constants import (MAXIMUM_SIMILAR_PROPERTIES)
+from utils.pagination import CustomPagination, CursorPaginationMixin
+from utils.cache import CachedListMixin
+from utils.constants import (MAXIMUM_SIMILAR_PROPERTIES, PROPERTY_LISTING_CACHE,
+                             PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
 from utils.date import (convert_datetime_to_readable_date)
+from utils.uploads import get_direct_upload_backend, LocalDirectUploadBackend
 
 class NewPropertyAPIView(views.APIView):
 
@@ -37,13 +48,14 @@ class NewPropertyAPIView(views.APIView):
                 'payload': ['Complete business registration before uploading properties']
             }, status=403)
 
-        serializer = self.serializer_class(data= request.data)
+        serializer = self.serializer_class(data= request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
 
 
         with transaction.atomic():
             property=serializer.save(agent = request.user, company_name=company.registered_name, company=company)
             property = Property.objects.filter(id=property.id).values()[0]
+            property.pop('search_vector')
 
             ## fetch media files
             property['images'] = MediaFiles.objects.filter(
@@ -147,12 +159,12 @@ class PropertyListView(ReadOnlyModelViewSet):
         ).order_by('-created_at')
 
 
-class PropertyListingViewset(ReadOnlyModelViewSet):
+class PropertyListingViewset(CachedListMixin, CursorPaginationMixin, ReadOnlyModelViewSet):
 
-    filter_backends = [SearchFilter]
+    filter_backends = [PropertySearchFilter]
     serializer_class = PropertyListingSerializer
-    search_fields = ['name']
     pagination_class = CustomPagination
+    cache_namespace = PROPERTY_LISTING_CACHE
 
     def get_queryset(self):
         queryset = Property.objects.filter(
@@ -188,9 +200,12 @@ class PropertyListingViewset(ReadOnlyModelViewSet):
         queryset = queryset.order_by('-created_at')
         return queryset
 
-class PropertyTopdealsViewset(ReadOnlyModelViewSet):
+class PropertyTopdealsViewset(CachedListMixin, ReadOnlyModelViewSet):
     serializer_class = PropertyTopdealsSerializer
     pagination_class = CustomPagination
+    cache_namespace = PROPERTY_TOPDEALS_CACHE
+    ## deals drop out as promotions close, which no signal reports
+    cache_timeout = 60 * 60
 
     def get_queryset(self):
         queryset = Property.objects.prefetch_related(
@@ -202,11 +217,11 @@ class PropertyTopdealsViewset(ReadOnlyModelViewSet):
         return queryset
 
 
-class PropertyMarketplaceViewset(ReadOnlyModelViewSet):
-    filter_backends = [SearchFilter]
+class PropertyMarketplaceViewset(CachedListMixin, CursorPaginationMixin, ReadOnlyModelViewSet):
+    filter_backends = [PropertySearchFilter]
     serializer_class = PropertyMarketplaceSerializer
-    search_fields = ['name']
     pagination_class = CustomPagination
+    cache_namespace = PROPERTY_MARKETPLACE_CACHE
 
     def get_queryset(self):
         queryset = Property.objects.prefetch_related(
@@ -249,54 +264,22 @@ class SimilarPropertyView(views.APIView):
     serializer_class = SimilarPropertyListSerializer
     pagination_class = CustomPagination
 
+    def get(self, request, property_id):
 
-    def group_by_propertyID(self, cursor):
-        "Return all rows from a cursor as a dict"
-        ## add extra column to store array of images
-        columns = [col[0] for col in cursor.description] + ['images']
-        
-        hashMap = {}
-        output = []
-        for row in cursor.fetchall():
-            ## Break condition
-            if len(output) > MAXIMUM_SIMILAR_PROPERTIES:
-                break
-
-            property_id = row[0]
-            image = row[-1]
-
-            if property_id not in hashMap:
-    
-                row += ( [image], ) ##concatenate tuple
-
-                output.append(dict(zip(columns, row)))
-                ## delete image property from output item
-                del(output[-1]['image'])
-                hashMap[property_id] = {'index':len(output)-1}
-            else:
-                index = hashMap[property_id]['index']
-                images = output[index]['images'] 
-                images.append(image)
-
-        return output
+        ## neighbours are precomputed by the process_similarity_refreshes worker after a save
+        similar_properties = SimilarProperty.objects.filter(
+            property_id=property_id
+        ).select_related('similar_property').order_by('-score')[:MAXIMUM_SIMILAR_PROPERTIES]
 
-    def get(self, request, property_id):
+        properties = [row.similar_property for row in similar_properties]
 
-        properties = Property.objects.filter(id=property_id)
-        if len(properties) < 1:
+        if not properties and not Property.objects.filter(id=property_id).exists():
             return Response({
                 'status_code': 400,
                 'error': 'No property with that ID',
                 'payload': ['No property with that ID']}, status=400)
 
-        properties = Property.objects.filter(
-            ~Q(id=property_id),
-            name__icontains=properties[0].name
-        )[:MAXIMUM_SIMILAR_PROPERTIES]
-
-        for property in properties:
-            out = property.get_images()
-            setattr(property, 'images', out)
+        Property.attach_media(properties, documents=False)
 
         serializer = self.serializer_class(properties, many=True)
 
@@ -310,41 +293,37 @@ class PropertyDetailView(views.APIView):
 
     def get(self, request, property_id):
 
-        properties = Property.objects.filter(id=property_id)
-        if len(properties) < 1:
+        property = Property.objects.select_related('agent').filter(id=property_id).first()
+        if not property:
             return Response({
                 'status_code': 400,
                 'error': 'No property with that ID',
                 'payload': ['No property with that ID']}, status=400)
 
-        property = properties[0]
-
         serializer = self.serializer_class(property)
 
-
-        # fetch media files
+        # fetch media files of both albums in one query
         output = serializer.data
-        output['images'] = MediaFiles.objects.filter(
-            album=property.image_album_id).values('image')
-
-        output['documents'] = MediaFiles.objects.filter(
-            album=property.document_album).values('document')
-
-        ## fetcy agent information and company information
-
-        number_of_listed_properties= Property.objects.filter(
-            agent=property.agent, moderation_status='APPROVED').count()
-
+        Property.attach_media([property])
+        image_variants = ImageVariantsField()
+        output['images'] = [{'image': media.image.name,
+                             'image_variants': image_variants.to_representation(media.image_variants)}
+                            for media in property.images]
+        output['documents'] = [{'document': media.document.name} for media in property.documents]
+
+        ## fetch agent information and company information
+        agent = property.agent
         output['agent'] = {
             'id': property.agent_id,
-            'firstname': property.agent.firstname,
-            'lastname': property.agent.lastname,
-            'display_photo': property.agent.display_photo.url if property.agent.display_photo else None,
-            'natinality': property.agent.nationality,
-            'email': property.agent.email,
-            'phone': property.agent.phone,
+            'firstname': agent.firstname,
+            'lastname': agent.lastname,
+            'display_photo': agent.display_photo.url if agent.display_photo else None,
+            'display_photo_variants': image_variants.to_representation(agent.display_photo_variants),
+            'natinality': agent.nationality,
+            'email': agent.email,
+            'phone': agent.phone,
             'agency': property.company_name,
-            'listed_properties': number_of_listed_properties
+            'listed_properties': Property.get_listed_properties_count(property.agent_id)
         }
 
         return Response(output, status=200)
@@ -371,13 +350,14 @@ class UpdatePropertyAPIView(views.APIView):
                 'error': 'This resource belongs to another user',
                 'payload': ['This resource belongs to another user']}, status=400)
 
-        serializer = self.serializer_class(property, data=request.data)
+        serializer = self.serializer_class(property, data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
 
         with transaction.atomic():
             serializer.save()
 
             property = Property.objects.filter(id=property.id).values()[0]
+            property.pop('search_vector')
 
             # fetch media files
             property['images'] = MediaFiles.objects.filter(
@@ -388,6 +368,64 @@ class UpdatePropertyAPIView(views.APIView):
         return Response(property, status=200)
 
 
+class DirectUploadSlotsAPIView(views.APIView):
+    """
+    Hands out presigned URLs for property media, so files go straight to storage
+    instead of through a web worker. The returned ids are then passed as `uploads`
+    when creating or updating the property.
+    """
+
+    serializer_class = DirectUploadSlotsSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAgent]
+
+    def post(self, request):
+
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        uploads = serializer.save(user=request.user)
+        for upload in uploads:
+            upload['url'] = request.build_absolute_uri(upload['url'])
+
+        return Response({'uploads': uploads}, status=200)
+
+
+class LocalDirectUploadView(views.APIView):
+    """PUT target of LocalDirectUploadBackend; the token stands in for a presigned URL's signature."""
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def put(self, request, token):
+
+        backend = get_direct_upload_backend()
+        if not isinstance(backend, LocalDirectUploadBackend):
+            raise Http404
+
+        try:
+            upload = backend.load_token(token)
+        except signing.BadSignature:
+            return Response({
+                'status_code': 403,
+                'error': 'Upload URL is invalid or has expired',
+                'payload': ['Upload URL is invalid or has expired']}, status=403)
+
+        content_type = request.META.get('CONTENT_TYPE', '').split(';')[0].strip()
+        ## read the stream rather than request.body, which caps bodies at DATA_UPLOAD_MAX_MEMORY_SIZE
+        body = request.stream.read(upload['size'] + 1) if request.stream else b''
+        if content_type != upload['content_type'] or len(body) != upload['size']:
+            return Response({
+                'status_code': 400,
+                'error': 'Content-Type and size must match the upload slot',
+                'payload': ['Content-Type and size must match the upload slot']}, status=400)
+
+        ## a repeated PUT replaces the object, like it would in a bucket
+        default_storage.delete(upload['key'])
+        default_storage.save(upload['key'], ContentFile(body))
+
+        return Response(status=200)
+
+
 class RemoveMediaView(views.APIView):
 
     permission_classes = [permissions.IsAuthenticated, IsAgent]
@@ -428,16 +466,9 @@ class RemoveMediaView(views.APIView):
                 'payload': ['No Media file with that ID']}, status=400)
 
         mediafile = media_files[0]
-        filename = None
-        with transaction.atomic():
-            mediafile.delete()
-            if media_type =='image':
-                filename = mediafile.image.name
-                mediafile.delete_image_from_storage()
-            else :
-                filename = mediafile.document.name
-                mediafile.delete_document_from_storage()
-            ## notice that MediaAlbum is not deleted even if media is last item in album
+        filename = mediafile.image.name if media_type == 'image' else mediafile.document.name
+        ## post_delete queues the file and its derivatives for the delete_storage_objects worker
+        mediafile.delete()
 
         return Response({'message': f'successfully deleted {filename}'}, status=200)
 
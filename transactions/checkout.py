@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from django.db import transaction, connection
+from django.utils import timezone
+
+from .models import TransactionLog, CHOICES_FOR_STATUS
+from properties.models import ShoppingCart
+from users.models import User
+from notifications.models import Notifications
+from utils.paystack import chargeCard, generateTransactionReference, PaymentServiceNotReached
+from utils.constants import CHECKOUT_MAX_CONCURRENT_CHARGES
+
+
+def reserve_cart(user: User, idempotency_key: str) -> Tuple[List[TransactionLog], bool]:
+    """
+    Phase 1: turn the user's cart into PENDING transaction logs and empty the cart.
+    A checkout already reserved under `idempotency_key` is returned as is, with
+    `created` False so the caller doesn't charge it again.
+    """
+    with transaction.atomic():
+        ## locking the cart serialises concurrent retries of the same checkout
+        cart = list(ShoppingCart.objects.select_for_update().select_related(
+            'property__agent').filter(user=user))
+
+        existing_logs = list(TransactionLog.objects.filter(
+            client=user, idempotency_key=idempotency_key))
+        if existing_logs:
+            return existing_logs, False
+
+        logs = [
+            TransactionLog(
+                property_name=item.property.name,
+                reference=generateTransactionReference(),
+                property=item.property,
+                client=user,
+                agent=item.property.agent,
+                number_of_shares=item.quantity,
+                amount=item.property.price_per_share,
+                status=CHOICES_FOR_STATUS[0][0],
+                idempotency_key=idempotency_key,
+            )
+            for item in cart
+        ]
+        TransactionLog.objects.bulk_create(logs)
+        ShoppingCart.objects.filter(id__in=[item.id for item in cart]).delete()
+
+    return logs, True
+
+
+def _charge(log: TransactionLog):
+    try:
+        return chargeCard(log)
+    finally:
+        ## worker threads get their own DB connection if the charge touches the ORM
+        connection.close()
+
+
+def charge_logs(logs: List[TransactionLog]):
+    """Phase 2: charge every reserved log concurrently, outside any DB transaction."""
+    if not logs:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(CHECKOUT_MAX_CONCURRENT_CHARGES, len(logs))) as executor:
+        futures = [(log, executor.submit(_charge, log)) for log in logs]
+
+    for log, future in futures:
+        try:
+            payment_service_response = future.result()
+        except PaymentServiceNotReached as e:
+            ## nothing was charged, and the cart is already gone: close the log for the client to retry
+            log.status = CHOICES_FOR_STATUS[2][0]
+            log.error_message_from_payment_service = str(e)
+            continue
+        except Exception as e:
+            ## the charge may have gone through; leave it PENDING for verify_pending_transactions, never re-charge
+            log.error_message_from_payment_service = str(e)
+            continue
+
+        log.status = payment_service_response['status']
+        log.payment_method = payment_service_response['payment_method']
+
+
+def settle_logs(user: User, logs: List[TransactionLog]):
+    """Phase 3: record charge outcomes and notify client and agents in bulk."""
+    now = timezone.now()
+    notifications = []
+    for log in logs:
+        log.updated_at = now
+        if log.status == CHOICES_FOR_STATUS[0][0]:
+            continue
+
+        notification_message = f'{log.status} transaction for property {log.property_id}'
+        notifications.extend([
+            {"user": user, "message": notification_message}, ##notify client
+            {"user": log.agent, "message": notification_message} ##notify agent
+        ])
+
+    with transaction.atomic():
+        TransactionLog.objects.bulk_update(
+            logs, ['status', 'payment_method', 'error_message_from_payment_service', 'updated_at'])
+        Notifications.new_bulk_entry(notifications)
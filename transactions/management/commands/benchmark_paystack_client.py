@@ -0,0 +1,43 @@
+import time
+import requests
+from django.core.management.base import BaseCommand
+
+from utils.paystack import PaystackClient
+from utils.paystack_stub import PaystackStubServer
+
+
+class Command(BaseCommand):
+    help = 'Compare a new connection per charge with the pooled PaystackClient, against the local stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=300, help='charges per measurement')
+        parser.add_argument('--latency', type=float, default=0, help='stub latency per request, in seconds')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        secret_key = 'sk_test_benchmark'
+
+        with PaystackStubServer(secret_key=secret_key, latency=options['latency']) as stub:
+            headers = {'Authorization': f'Bearer {secret_key}'}
+
+            def unpooled(index):
+                requests.post(f'{stub.url}/charge', json={
+                    'email': 'client@roofbucks.com', 'amount': 100, 'reference': f'rfb_{index}'
+                }, headers=headers, timeout=10).json()
+
+            client = PaystackClient(base_url=stub.url, secret_key=secret_key)
+
+            def pooled(index):
+                client.charge(email='client@roofbucks.com', amount=100, reference=f'rfb_{index}')
+
+            for name, charge in [('unpooled', unpooled), ('pooled', pooled)]:
+                connections = stub.connections
+                started = time.perf_counter()
+                for index in range(number):
+                    charge(index)
+                milliseconds = (time.perf_counter() - started) / number * 1000
+
+                self.stdout.write(
+                    f'{name:>9}: {milliseconds:.3f} ms/charge, {stub.connections - connections} connections')
+
+            client.close()
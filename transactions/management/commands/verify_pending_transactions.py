@@ -0,0 +1,87 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from transactions.models import TransactionLog, CHOICES_FOR_STATUS
+from notifications.models import Notifications
+from utils.paystack import PAYSTACK_SECRET_KEY, get_paystack_client, get_transaction_status
+
+
+class Command(BaseCommand):
+    help = 'Settle PENDING transaction logs by verifying their references with Paystack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=5,
+                            help='only verify logs pending for at least this many minutes')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def settle_batch(self, client, logs):
+        """Returns (verified, settled) counts; logs that couldn't be verified stay PENDING for the next run."""
+        verified = client.verify_transactions([log.reference for log in logs])
+
+        settled, notifications = [], []
+        for log in logs:
+            if log.reference not in verified:
+                continue
+
+            data = verified[log.reference]
+            if data is None:
+                ## older than --older-than and still unknown to Paystack: the charge never got there
+                status, error = CHOICES_FOR_STATUS[2][0], 'Transaction reference not found'
+            else:
+                status, error = get_transaction_status(data.get('status')), None
+                if status == CHOICES_FOR_STATUS[0][0]:
+                    continue
+
+            log.status = status
+            log.error_message_from_payment_service = error
+            log.updated_at = timezone.now()
+            settled.append(log)
+
+            notification_message = f'{log.status} transaction for property {log.property_id}'
+            notifications.extend([
+                {"user": log.client, "message": notification_message}, ##notify client
+                {"user": log.agent, "message": notification_message} ##notify agent
+            ])
+
+        with transaction.atomic():
+            TransactionLog.objects.bulk_update(
+                settled, ['status', 'error_message_from_payment_service', 'updated_at'])
+            Notifications.new_bulk_entry(notifications)
+
+        return len(verified), len(settled)
+
+    def handle(self, *args, **options):
+        if not PAYSTACK_SECRET_KEY:
+            raise CommandError('PAYSTACK_SECRET_KEY is not set')
+
+        client = get_paystack_client()
+        ## younger logs may still have a charge in flight
+        pending = TransactionLog.objects.select_related('client', 'agent').filter(
+            status=CHOICES_FOR_STATUS[0][0],
+            created_at__lte=timezone.now() - timedelta(minutes=options['older_than'])
+        ).order_by('created_at', 'id')
+
+        total = verified = settled = 0
+        last = None
+        while True:
+            ## page by (created_at, id), so logs that stay PENDING don't hide the ones after them
+            page = pending if last is None else pending.filter(
+                Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id))
+            logs = list(page[:options['batch_size']])
+            if not logs:
+                break
+
+            batch_verified, batch_settled = self.settle_batch(client, logs)
+            total += len(logs)
+            verified += batch_verified
+            settled += batch_settled
+            last = logs[-1]
+
+            if len(logs) < options['batch_size'] or client.circuit_breaker.is_open:
+                ## with the circuit open the rest would only fail fast; they wait for the next run
+                break
+
+        self.stdout.write(f'verified {verified} of {total} pending logs, settled {settled}')
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionlog',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=256, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionlog',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('client', 'idempotency_key', 'property'), name='unique_checkout_item'),
+        ),
+    ]
@@ -31,12 +31,20 @@ class TransactionLog(models.Model):
         choices= CHOICES_FOR_PAYMENT_METHOD,
         default = CHOICES_FOR_PAYMENT_METHOD[0][0])
     error_message_from_payment_service = models.TextField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=256, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "TransactionLogs"
+        constraints = [
+            # a retried checkout can never log (and charge) the same cart item twice
+            models.UniqueConstraint(
+                fields=['client', 'idempotency_key', 'property'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='unique_checkout_item'),
+        ]
 
         
 
@@ -1,3 +1,225 @@
-from django.test import TestCase
+from io import StringIO
+from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from .checkout import reserve_cart, charge_logs, settle_logs
+from .models import TransactionLog
+from properties.models import Property, ShoppingCart
+from users.models import User, Company
+from utils.paystack import (PaystackClient, CircuitBreaker, PaymentServiceError, PaymentServiceUnavailable,
+                            PaymentServiceNotReached, get_transaction_status)
+from utils.paystack_stub import PaystackStubServer
+
+
+class PaystackClientTestCase(SimpleTestCase):
+
+    secret_key = 'sk_test_client'
+
+    def setUp(self):
+        self.stub = PaystackStubServer(secret_key=self.secret_key, statuses={'rfb_failed': 'failed'}).start()
+        self.addCleanup(self.stub.stop)
+
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        self.client = PaystackClient(
+            base_url=self.stub.url, secret_key=self.secret_key,
+            max_retries=1, circuit_breaker=self.breaker)
+        self.addCleanup(self.client.close)
+
+    def test_charges_reuse_one_connection(self):
+        for index in range(5):
+            data = self.client.charge(email='client@roofbucks.com', amount=100, reference=f'rfb_{index}')
+            self.assertEqual(get_transaction_status(data['status']), 'SUCCESS')
+
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_verify_retries_unavailable_service(self):
+        self.stub.fail_next(1)
+
+        data = self.client.verify_transaction('rfb_failed')
+
+        self.assertEqual(get_transaction_status(data['status']), 'FAILED')
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def test_charge_is_not_retried(self):
+        self.stub.fail_next(1)
+
+        with self.assertRaises(PaymentServiceUnavailable):
+            self.client.charge(email='client@roofbucks.com', amount=100, reference='rfb_retry')
+
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_open_circuit_fails_fast(self):
+        self.stub.fail_next(2)
+        for _ in range(2):
+            with self.assertRaises(PaymentServiceUnavailable):
+                self.client.charge(email='client@roofbucks.com', amount=100, reference='rfb_down')
+
+        with self.assertRaises(PaymentServiceUnavailable):
+            self.client.charge(email='client@roofbucks.com', amount=100, reference='rfb_down')
+
+        self.assertTrue(self.breaker.is_open)
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def test_refused_connection_never_reached_paystack(self):
+        url = self.stub.url
+        self.stub.stop()
+        self.stub.start()
+        client = PaystackClient(base_url=url, secret_key=self.secret_key, max_retries=0, circuit_breaker=self.breaker)
+        self.addCleanup(client.close)
+
+        with self.assertRaises(PaymentServiceNotReached):
+            client.charge(email='client@roofbucks.com', amount=100, reference='rfb_refused')
+
+    def test_rejected_request_does_not_trip_circuit(self):
+        client = PaystackClient(base_url=self.stub.url, secret_key='sk_wrong', circuit_breaker=self.breaker)
+        self.addCleanup(client.close)
+
+        for _ in range(3):
+            with self.assertRaises(PaymentServiceError):
+                client.verify_transaction('rfb_0')
+
+        self.assertFalse(self.breaker.is_open)
+
+    def test_verify_transactions_in_batch(self):
+        self.stub.verify_unknown = False
+        self.stub.statuses.update({'rfb_1': 'success', 'rfb_2': 'abandoned'})
+
+        verified = self.client.verify_transactions(['rfb_1', 'rfb_2', 'rfb_missing'])
+
+        self.assertEqual({reference: data and data['status'] for reference, data in verified.items()},
+                         {'rfb_1': 'success', 'rfb_2': 'abandoned', 'rfb_missing': None})
+
+    def test_verify_transactions_leaves_out_unverifiable(self):
+        self.stub.fail_next(2)
+
+        self.assertEqual(self.client.verify_transactions(['rfb_1']), {})
+
+
+class CheckoutTestCase(TestCase):
+
+    secret_key = 'sk_test_checkout'
+
+    def setUp(self):
+        self.stub = PaystackStubServer(secret_key=self.secret_key).start()
+        self.addCleanup(self.stub.stop)
+
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        client = PaystackClient(base_url=self.stub.url, secret_key=self.secret_key, circuit_breaker=self.breaker)
+        self.addCleanup(client.close)
+        for patcher in [mock.patch('utils.paystack.PAYSTACK_SECRET_KEY', self.secret_key),
+                        mock.patch('utils.paystack.get_paystack_client', return_value=client)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        company = Company.objects.create(
+            user=agent, registration_number='RC1234', reference_number='REF123456789', registered_name='Obi Homes')
+        self.client_user = User.objects.create_user('Bola', 'Ade', 'client@roofbucks.com', 'SHAREHOLDER', 'Password1!')
+        for index in range(2):
+            property = Property.objects.create(
+                name=f'Property {index}', agent=agent, company=company, apartment_type='duplex',
+                address='1 Admiralty Way', state='Lagos', country='Nigeria', price_per_share=1000)
+            ShoppingCart.objects.create(user=self.client_user, property=property, quantity=2)
+
+    def checkout(self, idempotency_key):
+        ## what PurchasePropertiesAPIView does with a request
+        logs, created = reserve_cart(self.client_user, idempotency_key)
+        if created:
+            charge_logs(logs)
+            settle_logs(self.client_user, logs)
+        return logs
+
+    def charges(self):
+        return [path for method, path in self.stub.requests if method == 'POST']
+
+    def test_replayed_key_returns_the_same_logs(self):
+        first = self.checkout('key-1')
+        second = self.checkout('key-1')
+
+        self.assertCountEqual([log.id for log in second], [log.id for log in first])
+        self.assertEqual({log.status for log in second}, {'SUCCESS'})
+        self.assertEqual(len(self.charges()), 2)
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_charge_that_never_reached_paystack_fails(self):
+        self.breaker.record_failure()
+
+        logs = self.checkout('key-2')
+
+        self.assertEqual({log.status for log in TransactionLog.objects.all()}, {'FAILED'})
+        self.assertIn(PaymentServiceNotReached.default_detail, logs[0].error_message_from_payment_service)
+        self.assertEqual(self.charges(), [])
+
+        ## a retry of the failed checkout is not charged again
+        self.breaker.record_success()
+        self.checkout('key-2')
+        self.assertEqual(self.charges(), [])
+        self.assertEqual(TransactionLog.objects.count(), 2)
+
+    def test_charge_with_unknown_outcome_stays_pending(self):
+        self.stub.fail_next(2)
+
+        self.checkout('key-3')
+
+        self.assertEqual({log.status for log in TransactionLog.objects.all()}, {'PENDING'})
+        self.assertEqual(len(self.charges()), 2)
+
+
+class VerifyPendingTransactionsTestCase(TestCase):
+
+    secret_key = 'sk_test_verify'
+
+    def setUp(self):
+        self.stub = PaystackStubServer(secret_key=self.secret_key, verify_unknown=False).start()
+        self.addCleanup(self.stub.stop)
+
+        client = PaystackClient(base_url=self.stub.url, secret_key=self.secret_key, max_retries=0,
+                                circuit_breaker=CircuitBreaker(failure_threshold=5))
+        self.addCleanup(client.close)
+        for patcher in [
+                mock.patch('transactions.management.commands.verify_pending_transactions.PAYSTACK_SECRET_KEY',
+                           self.secret_key),
+                mock.patch('transactions.management.commands.verify_pending_transactions.get_paystack_client',
+                           return_value=client)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        company = Company.objects.create(
+            user=agent, registration_number='RC1234', reference_number='REF123456789', registered_name='Obi Homes')
+        client_user = User.objects.create_user('Bola', 'Ade', 'client@roofbucks.com', 'SHAREHOLDER', 'Password1!')
+        property = Property.objects.create(
+            name='Property', agent=agent, company=company, apartment_type='duplex',
+            address='1 Admiralty Way', state='Lagos', country='Nigeria', price_per_share=1000)
+
+        TransactionLog.objects.bulk_create([
+            TransactionLog(property_name=property.name, reference=reference, property=property, client=client_user,
+                           agent=agent, number_of_shares=1, amount=1000)
+            for reference in ['rfb_unreachable', 'rfb_unknown', 'rfb_paid']
+        ])
+        for minutes, reference in enumerate(['rfb_paid', 'rfb_unknown', 'rfb_unreachable'], start=10):
+            TransactionLog.objects.filter(reference=reference).update(
+                created_at=timezone.now() - timedelta(minutes=minutes))
+        self.stub.statuses['rfb_paid'] = 'success'
+
+    def get_statuses(self):
+        return dict(TransactionLog.objects.values_list('reference', 'status'))
+
+    def test_unknown_reference_fails_and_errors_do_not_block_later_logs(self):
+        ## the oldest log's verification hits a 503
+        self.stub.fail_next(1)
+
+        output = StringIO()
+        call_command('verify_pending_transactions', '--batch-size', '1', stdout=output)
+
+        self.assertEqual(self.get_statuses(),
+                         {'rfb_unreachable': 'PENDING', 'rfb_unknown': 'FAILED', 'rfb_paid': 'SUCCESS'})
+        self.assertEqual(output.getvalue().strip(), 'verified 2 of 3 pending logs, settled 2')
+        self.assertEqual(TransactionLog.objects.get(reference='rfb_unknown').error_message_from_payment_service,
+                         'Transaction reference not found')
+
+        call_command('verify_pending_transactions', stdout=StringIO())
+        self.assertEqual(self.get_statuses()['rfb_unreachable'], 'FAILED')
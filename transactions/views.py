@@ -1,6 +1,6 @@
+import uuid
 from rest_framework import (views, permissions)
 from rest_framework.response import Response
-from django.db import transaction
 
 
 from .serializers import (
@@ -8,9 +8,7 @@ from .serializers import (
     TransactionLogSerializer)
 from authentication.permissions import IsAgent, IsCustomer
 from .models import TransactionLog
-from properties.models import ShoppingCart
-from utils.paystack import chargeCard, generateTransactionReference
-from notifications.models import Notifications
+from .checkout import reserve_cart, charge_logs, settle_logs
 
 class AgentsTransactionLogsListView(views.APIView):
 
@@ -49,52 +47,15 @@ class PurchasePropertiesAPIView(views.APIView):
 
     def post(self, request):
 
-        with transaction.atomic():
-            bulkLogs, notificationsList = [], []
-            cart = ShoppingCart.objects.filter(user=request.user)
+        ## retries carrying the same Idempotency-Key get the original checkout back
+        idempotency_key = request.headers.get('Idempotency-Key') or str(uuid.uuid4())
 
-            for item in cart:
+        transactionLogs, created = reserve_cart(request.user, idempotency_key)
 
-                property = item.property
+        if created:
+            charge_logs(transactionLogs)
+            settle_logs(request.user, transactionLogs)
 
-                ## generate referenceId
-                referenceId = generateTransactionReference()
-
-                ## delete item from cart
-                item.delete()
-
-                # Queue Transaction
-                payment_service_response = chargeCard()
-
-                ## create Transaction Logs
-                bulkLogs.append(
-                    TransactionLog(**{
-                        "property_name": property.name,
-                        "reference": referenceId,
-                        "property": property,
-                        "client": request.user,
-                        "agent": property.agent,
-                        "number_of_shares": item.quantity,
-                        "amount": property.price_per_share,
-                        **payment_service_response
-                    }))
-
-                ## save notifications object
-                payment_status = payment_service_response.get('status')
-                notification_message = f'{payment_status} transaction for property {property.id}'
-                notificationsList.extend([
-                    {"user": request.user, "message": notification_message}, ##notify client
-                    {"user": property.agent, "message": notification_message} ##notify agent
-                    ])
-
-            transactionLogs = TransactionLog.objects.bulk_create(bulkLogs)
-
-            ## send notifications
-            Notifications.new_bulk_entry(notificationsList)
-
-            serializer = self.serializer_class(transactionLogs, many=True)
+        serializer = self.serializer_class(transactionLogs, many=True)
 
         return Response(serializer.data, status=200)
-
-
-
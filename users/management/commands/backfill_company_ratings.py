@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Recompute the review count, rating sum, average and histogram of companies from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, nargs='+', help='only these company ids')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        companies = Company.objects.order_by('id')
+        if options['company']:
+            companies = companies.filter(id__in=options['company'])
+
+        updated, last_id = 0, 0
+        while True:
+            ## one short transaction per batch, so live reviews only ever wait on a few rows
+            company_ids = list(companies.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not company_ids:
+                break
+
+            updated += Company.recompute_review_aggregates(company_ids)
+            last_id = company_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed review aggregates of {updated} companies'))
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_stages_of_kyc_verification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('stages_of_kyc_verification__profile', False), ('stages_of_profile_completion__profile', True)), fields=['created_at', 'id'], name='users_kyc_profile_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('stages_of_kyc_verification__business', False), ('stages_of_profile_completion__business', True)), fields=['created_at', 'id'], name='users_kyc_business_pending_idx'),
+        ),
+    ]
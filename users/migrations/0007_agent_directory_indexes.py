@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:35
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_kyc_pending_indexes'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_verified', True), ('role', 'AGENT'), ('stages_of_kyc_verification__business', True), ('stages_of_kyc_verification__profile', True), ('stages_of_profile_completion__billing', True), ('stages_of_profile_completion__business', True), ('stages_of_profile_completion__profile', True)), fields=['-created_at'], name='users_onboarded_agents_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('firstname'), name='gin_trgm_ops'), condition=models.Q(('is_verified', True), ('role', 'AGENT'), ('stages_of_kyc_verification__business', True), ('stages_of_kyc_verification__profile', True), ('stages_of_profile_completion__billing', True), ('stages_of_profile_completion__business', True), ('stages_of_profile_completion__profile', True)), name='users_agent_firstname_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('lastname'), name='gin_trgm_ops'), condition=models.Q(('is_verified', True), ('role', 'AGENT'), ('stages_of_kyc_verification__business', True), ('stages_of_kyc_verification__profile', True), ('stages_of_profile_completion__billing', True), ('stages_of_profile_completion__business', True), ('stages_of_profile_completion__profile', True)), name='users_agent_lastname_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:37
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import users.models
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    ## Company.recompute_review_aggregates() as it stood, against the historical model
+    Company = apps.get_model('users', 'Company')
+    company_ids = list(Company.objects.filter(review__isnull=False).distinct().values_list('id', flat=True))
+    for start in range(0, len(company_ids), 500):
+        companies = list(Company.objects.filter(id__in=company_ids[start:start + 500]).annotate(
+            total_reviews=Count('review'),
+            total_ratings=Count('review__rating'),
+            total_rating=Sum('review__rating', default=0),
+            **{f'rated_{rating}': Count('review', filter=Q(review__rating=rating)) for rating in range(1, 6)},
+        ).only('id'))
+
+        for company in companies:
+            company.review_count = company.total_reviews
+            company.rating_count = company.total_ratings
+            company.rating_sum = company.total_rating
+            company.average_rating = (Decimal(company.total_rating) / company.total_ratings).quantize(
+                Decimal('0.01')) if company.total_ratings else None
+            company.rating_histogram = {str(rating): getattr(company, f'rated_{rating}') for rating in range(1, 6)}
+
+        Company.objects.bulk_update(
+            companies, ['review_count', 'rating_count', 'rating_sum', 'average_rating', 'rating_histogram'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_agent_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='average_rating',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='rating_histogram',
+            field=models.JSONField(default=users.models.ratingHistogram),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_company_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='company_logo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='display_photo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='company',
+            name='average_rating',
+            field=models.DecimalField(blank=True, decimal_places=1, max_digits=2, null=True),
+        ),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import F, Q, Value, Count, Sum
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.auth.models import AbstractBaseUser,BaseUserManager,PermissionsMixin
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -45,6 +50,31 @@ IDENTITY_DOCUMENT_CHOICES = [
             ("PASSPORT", "Passport")
             ]
 
+class JSONBSet(models.Func):
+    """jsonb_set(field, '{key}', value): sets one top-level key in place, in SQL."""
+
+    function = 'jsonb_set'
+    output_field = models.JSONField()
+
+    def __init__(self, field_name, key, value, **extra):
+        super().__init__(F(field_name), Value(f'{{{key}}}'), Value(value, output_field=models.JSONField()), **extra)
+
+
+def get_pending_kyc_condition(stage):
+    """Users who completed `stage` of their profile and await its KYC review."""
+    return Q(**{f'stages_of_profile_completion__{stage}': True, f'stages_of_kyc_verification__{stage}': False})
+
+
+def get_onboarded_agent_condition():
+    """Verified agents who completed every profile stage and passed every KYC review."""
+    return Q(
+        role='AGENT',
+        is_verified=True,
+        **{f'stages_of_profile_completion__{stage}': True for stage in STAGES_OF_PROFILE_COMPLETION},
+        **{f'stages_of_kyc_verification__{stage}': True for stage in STAGES_OF_KYC_VERIFICATION},
+    )
+
+
 def stagesOfProfileCompletion():
     return STAGES_OF_PROFILE_COMPLETION
 
@@ -84,6 +114,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     identity_document_number    = models.CharField(max_length=65, null=True)
     identity_document_expiry_date   = models.DateField(null=True)
     display_photo               = models.ImageField(upload_to='display_photo/')
+    display_photo_variants      = models.JSONField(default=dict, blank=True)
     proof_of_address_document   = models.FileField(upload_to='proof_of_address/')
     stages_of_profile_completion = models.JSONField(default=stagesOfProfileCompletion)
     stages_of_kyc_verification = models.JSONField(default=stagesOfKycVerification)
@@ -125,8 +156,43 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         db_table = "Users"
+        indexes = [
+            ## one partial index per stage keeps each KYC review queue an index scan
+            models.Index(fields=['created_at', 'id'], condition=get_pending_kyc_condition(stage),
+                         name=f'users_kyc_{stage}_pending_idx')
+            for stage in STAGES_OF_KYC_VERIFICATION
+        ] + [
+            ## the agent directory only ever reads onboarded agents, so its indexes only cover them
+            models.Index(fields=['-created_at'], condition=get_onboarded_agent_condition(),
+                         name='users_onboarded_agents_idx'),
+            GinIndex(OpClass(Upper('firstname'), name='gin_trgm_ops'), condition=get_onboarded_agent_condition(),
+                     name='users_agent_firstname_trgm_idx'),
+            GinIndex(OpClass(Upper('lastname'), name='gin_trgm_ops'), condition=get_onboarded_agent_condition(),
+                     name='users_agent_lastname_trgm_idx'),
+        ]
+
+    @classmethod
+    def set_kyc_verification(cls, user_ids, stage, approved):
+        """
+        Record the KYC outcome of `stage` for many users in one UPDATE. A rejection also
+        reopens that profile stage so the user can resubmit. Returns the ids updated.
+        """
+        users = cls.objects.filter(id__in=user_ids)
+        updated_ids = set(users.values_list('id', flat=True))
+
+        users.update(
+            stages_of_kyc_verification=JSONBSet('stages_of_kyc_verification', stage, approved),
+            stages_of_profile_completion=JSONBSet('stages_of_profile_completion', stage, approved),
+            updated_at=timezone.now())
+
+        return updated_ids
 
 
+RATINGS = range(1, 6)
+
+def ratingHistogram():
+    return {str(rating): 0 for rating in RATINGS}
+
 class Company(models.Model):
     is_verified                 = models.BooleanField(default=False)
     user                        = models.OneToOneField(to=User, on_delete=models.CASCADE)
@@ -141,8 +207,16 @@ class Company(models.Model):
     country                     = models.CharField(max_length=255)
     description                 = models.TextField()
     company_logo                = models.ImageField(upload_to='company_logo/')
+    company_logo_variants       = models.JSONField(default=dict, blank=True)
     certificate_of_incorporation   = models.FileField(upload_to='certificate_of_incorporation/')
     bank_information            = ArrayField(models.JSONField(default=dict), default= list)
+    ## maintained by add_review and recompute_review_aggregates, so profiles never aggregate Reviews
+    review_count                = models.PositiveIntegerField(default=0)
+    rating_count                = models.PositiveIntegerField(default=0)
+    rating_sum                  = models.PositiveIntegerField(default=0)
+    ## one decimal place, as profiles have always shown it
+    average_rating              = models.DecimalField(max_digits=2, decimal_places=1, null=True, blank=True)
+    rating_histogram            = models.JSONField(default=ratingHistogram)
     created_at                  = models.DateTimeField(auto_now_add=True)
     updated_at                  = models.DateTimeField(auto_now=True)
 
@@ -153,6 +227,82 @@ class Company(models.Model):
         setattr (self, 'reviews', Review.objects.filter(company=self))
         return self.reviews
 
+    @staticmethod
+    def get_average_rating(rating_sum, rating_count):
+        if not rating_count:
+            return None
+        return (Decimal(rating_sum) / rating_count).quantize(Decimal('0.1'))
+
+    def add_review(self, **fields):
+        """
+        Create a review and fold it into the company's aggregates in the same transaction.
+        The company row is locked so concurrent reviews can't lose each other's counts.
+        """
+        with transaction.atomic():
+            company = Company.objects.select_for_update().only(
+                'id', 'review_count', 'rating_count', 'rating_sum', 'rating_histogram').get(id=self.id)
+            review = Review.objects.create(company=company, **fields)
+
+            company.review_count += 1
+            if review.rating is not None:
+                company.rating_count += 1
+                company.rating_sum += review.rating
+                company.rating_histogram[str(review.rating)] = company.rating_histogram.get(str(review.rating), 0) + 1
+            company.average_rating = self.get_average_rating(company.rating_sum, company.rating_count)
+            company.save(update_fields=['review_count', 'rating_count', 'rating_sum', 'average_rating',
+                                        'rating_histogram', 'updated_at'])
+
+        for field in ['review_count', 'rating_count', 'rating_sum', 'average_rating', 'rating_histogram']:
+            setattr(self, field, getattr(company, field))
+        return review
+
+    @classmethod
+    def remove_review(cls, review):
+        """Take a deleted review out of its company's aggregates, under the same row lock as add_review."""
+        with transaction.atomic():
+            company = cls.objects.select_for_update().only(
+                'id', 'review_count', 'rating_count', 'rating_sum', 'rating_histogram').filter(
+                id=review.company_id).first()
+            ## gone already, or going in the same delete
+            if company is None:
+                return
+
+            company.review_count = max(company.review_count - 1, 0)
+            if review.rating is not None:
+                company.rating_count = max(company.rating_count - 1, 0)
+                company.rating_sum -= review.rating
+                company.rating_histogram[str(review.rating)] = max(
+                    company.rating_histogram.get(str(review.rating), 0) - 1, 0)
+            company.average_rating = cls.get_average_rating(company.rating_sum, company.rating_count)
+            company.save(update_fields=['review_count', 'rating_count', 'rating_sum', 'average_rating',
+                                        'rating_histogram', 'updated_at'])
+
+    @classmethod
+    def recompute_review_aggregates(cls, company_ids):
+        """Rebuild the review aggregates of these companies from the Reviews table. Returns how many were updated."""
+        with transaction.atomic():
+            ## same lock as add_review, so no review lands between the count and the write
+            company_ids = list(cls.objects.select_for_update().filter(id__in=company_ids).values_list('id', flat=True))
+            companies = cls.objects.filter(id__in=company_ids).annotate(
+                total_reviews=Count('review'),
+                total_ratings=Count('review__rating'),
+                total_rating=Sum('review__rating', default=0),
+                **{f'rated_{rating}': Count('review', filter=Q(review__rating=rating)) for rating in RATINGS},
+            ).only('id')
+
+            updated = []
+            for company in companies:
+                company.review_count = company.total_reviews
+                company.rating_count = company.total_ratings
+                company.rating_sum = company.total_rating
+                company.average_rating = cls.get_average_rating(company.total_rating, company.total_ratings)
+                company.rating_histogram = {str(rating): getattr(company, f'rated_{rating}') for rating in RATINGS}
+                updated.append(company)
+
+            cls.objects.bulk_update(
+                updated, ['review_count', 'rating_count', 'rating_sum', 'average_rating', 'rating_histogram'])
+        return len(updated)
+
 
 
 class EmailVerification(models.Model):
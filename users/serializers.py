@@ -4,7 +4,8 @@ from django.utils import timezone, dateparse
 dateparse.parse_date
 
 from .models import User, Company, Review
-from album.models import MediaAlbum, MediaFiles
+from album.models import MediaAlbum, MediaFiles, ImageDerivativeJob
+from album.serializers import ImageVariantsField
 from utils.constants import ALLOWABLE_DOCUMENT_TYPES
 from properties.serializers import PropertySerializer
 
@@ -101,8 +102,17 @@ class UpdateProfileSerializer(serializers.ModelSerializer):
                 updatable_fields[key] = validated_data.get(key)
 
         instance.stages_of_profile_completion["profile"] = True
+        ## the old photo's derivatives would be served until the worker replaces them
+        if 'display_photo' in updatable_fields:
+            updatable_fields['display_photo_variants'] = {}
+
+        ## save() rather than queryset.update() so uploaded files reach storage
+        for key, value in updatable_fields.items():
+            setattr(instance, key, value)
         instance.save()
-        User.objects.filter(id=instance.id).update(**updatable_fields)
+
+        if 'display_photo' in updatable_fields:
+            ImageDerivativeJob.enqueue([instance], 'display_photo')
 
         return instance
 
@@ -135,8 +145,21 @@ class UpdateCompanySerializer(serializers.ModelSerializer):
         for key in validated_data:
             updatable_fields[key] = validated_data.get(key)
 
-        Company.objects.filter(user_id=instance.id).update(**updatable_fields)
-        company_serializer = CompanySerializer(instance.get_company())
+        ## the old logo's derivatives would be served until the worker replaces them
+        if 'company_logo' in updatable_fields:
+            updatable_fields['company_logo_variants'] = {}
+
+        ## save() rather than queryset.update() so an uploaded logo reaches storage
+        company = instance.get_company()
+        if company:
+            for key, value in updatable_fields.items():
+                setattr(company, key, value)
+            company.save(update_fields=[*updatable_fields, 'updated_at'])
+
+            if 'company_logo' in updatable_fields:
+                ImageDerivativeJob.enqueue([company], 'company_logo')
+
+        company_serializer = CompanySerializer(company)
 
         return company_serializer.data
 
@@ -224,21 +247,27 @@ class AddBankInfoSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    display_photo_variants = ImageVariantsField()
+
     class Meta:
         model = User
         fields = '__all__'
 
 
 class CompanySerializer(serializers.ModelSerializer):
+    company_logo_variants = ImageVariantsField()
+
     class Meta:
         model = Company
         fields = '__all__'
 
 
 class ReviewersSerializer(serializers.ModelSerializer):
+    display_photo_variants = ImageVariantsField()
+
     class Meta:
         model = User
-        fields = ['id', 'display_photo', 'firstname', 'lastname']
+        fields = ['id', 'display_photo', 'display_photo_variants', 'firstname', 'lastname']
 
 
 class ReviewsSerializer(serializers.ModelSerializer):
@@ -263,9 +292,8 @@ class ReviewsSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data) -> Review:
-        return Review.objects.create(
-            **validated_data
-        )
+        company = validated_data.pop('company')
+        return company.add_review(**validated_data)
 
 
 class BusinessProfileSerializer(serializers.ModelSerializer):
@@ -273,6 +301,7 @@ class BusinessProfileSerializer(serializers.ModelSerializer):
     properties = PropertySerializer(many=True, required=False)
     reviews = ReviewsSerializer(many=True, required=False)
     rating = serializers.DecimalField(required=False, decimal_places=1, max_digits=2, read_only=True)
+    display_photo_variants = ImageVariantsField()
 
     class Meta:
         model = User
@@ -280,8 +309,10 @@ class BusinessProfileSerializer(serializers.ModelSerializer):
 
 
 class AgentListSerializer(serializers.ModelSerializer):
+    display_photo_variants = ImageVariantsField()
+
     class Meta:
         model = User
         fields = ['id', 'firstname', 'lastname', 'phone',
                   'email', 'city', 'country', 'secondary_phone',
-                  'display_photo', 'title', 'summary']
+                  'display_photo', 'display_photo_variants', 'title', 'summary']
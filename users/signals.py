@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Company, Review
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_aggregates(sender, instance, **kwargs):
+    ## Company.add_review keeps the aggregates on the way in; deletes, including the cascade
+    ## from a deleted reviewer, have to take the review back out
+    Company.remove_review(instance)
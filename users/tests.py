@@ -1,3 +1,208 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from PIL import Image
 
-# Create your tests here.
+from .models import User, Company, Review, get_onboarded_agent_condition
+from album.models import MediaAlbum, MediaFiles, ImageDerivativeJob
+from properties.models import Property
+from utils.constants import NUMBER_OF_REVIEWS_TO_DISPLAY
+
+
+class BusinessProfileQueryCountTestCase(TestCase):
+
+    def setUp(self):
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        self.company = Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+
+    def add_properties(self, count):
+        for index in range(count):
+            image_album = MediaAlbum.objects.create()
+            document_album = MediaAlbum.objects.create()
+            MediaFiles.objects.bulk_create([
+                MediaFiles(album=image_album, image=f'properties/images/{index}.jpg', media_type='IMAGE'),
+                MediaFiles(album=document_album, document=f'properties/documents/{index}.pdf', media_type='DOCUMENT'),
+            ])
+            Property.objects.create(
+                name=f'Property {index}', agent=self.agent, company=self.company,
+                apartment_type='duplex', address='1 Admiralty Way', state='Lagos', country='Nigeria',
+                image_album=image_album, document_album=document_album)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = APIClient().get(f'/api/v1/user/business_profile/{self.agent.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def test_query_count_is_constant_in_number_of_properties(self):
+        self.add_properties(2)
+        few_queries, response = self.count_queries()
+        self.assertEqual(len(response['properties'][0]['images']), 1)
+        self.assertEqual(len(response['properties'][0]['documents']), 1)
+
+        self.add_properties(8)
+        many_queries, response = self.count_queries()
+        self.assertEqual(len(response['properties']), 10)
+
+        self.assertEqual(few_queries, many_queries)
+        ## user, company, properties, their media, reviews, and the user's groups and permissions
+        self.assertEqual(many_queries, 7)
+
+
+class AgentListTestCase(TestCase):
+
+    def setUp(self):
+        self.agents = [
+            User.objects.create_user(firstname, 'Obi', f'{firstname.lower()}@roofbucks.com', 'AGENT', 'Password1!')
+            for firstname in ['Ada', 'Chidi', 'Bola']
+        ]
+        ## Bola hasn't passed the business KYC review yet
+        User.objects.filter(id__in=[agent.id for agent in self.agents]).update(
+            is_verified=True,
+            stages_of_profile_completion={'profile': True, 'business': True, 'billing': True},
+            stages_of_kyc_verification={'profile': True, 'business': True})
+        User.objects.filter(id=self.agents[2].id).update(
+            stages_of_kyc_verification={'profile': True, 'business': False})
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.agents[0])
+
+    def test_lists_onboarded_agents(self):
+        response = self.client.get('/api/v1/user/agent_list/')
+        self.assertEqual([agent['id'] for agent in response.json()['results']],
+                         [self.agents[1].id, self.agents[0].id])
+
+        response = self.client.get('/api/v1/user/agent_list/', {'search': 'chi'})
+        self.assertEqual([agent['id'] for agent in response.json()['results']], [self.agents[1].id])
+
+    def test_queries_are_indexed(self):
+        User.objects.bulk_create([
+            User(firstname=f'Agent{index}', lastname='Ade', email=f'agent{index}@roofbucks.com', role='AGENT',
+                 is_verified=True, stages_of_profile_completion={'profile': True, 'business': True, 'billing': True},
+                 stages_of_kyc_verification={'profile': True, 'business': True})
+            for index in range(500)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE "Users"')
+        queryset = User.objects.filter(get_onboarded_agent_condition())
+        self.assertIn('users_onboarded_agents_idx', queryset.order_by('-created_at')[:10].explain())
+
+        ## the planner can't estimate the JSON keys and prefers filtering the tiny btree here,
+        ## so take it out of the running (rolled back with the test) to check the search is indexed
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX users_onboarded_agents_idx')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.filter(Q(firstname__icontains='chi') | Q(lastname__icontains='chi')).explain()
+        self.assertIn('users_agent_firstname_trgm_idx', plan)
+        self.assertIn('users_agent_lastname_trgm_idx', plan)
+
+
+class CompanyReviewAggregatesTestCase(TestCase):
+
+    def setUp(self):
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        self.company = Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes')
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user('Bola', 'Ade', 'customer@roofbucks.com', 'CUSTOMER', 'Password1!'))
+
+    def add_reviews(self, reviews):
+        for review in reviews:
+            response = self.client.post(f'/api/v1/user/add_reviews/{self.company.id}/', review, format='json')
+            self.assertEqual(response.status_code, 200)
+
+    def test_reviews_update_aggregates(self):
+        self.add_reviews([{'rating': 5}, {'rating': 4}, {'review': 'Responsive agent'}, {'rating': 4}])
+
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.review_count, 4)
+        self.assertEqual(self.company.rating_count, 3)
+        self.assertEqual(self.company.rating_sum, 13)
+        self.assertEqual(str(self.company.average_rating), '4.3')
+        self.assertEqual(self.company.rating_histogram, {'1': 0, '2': 0, '3': 0, '4': 2, '5': 1})
+
+    def test_deleted_reviews_leave_the_aggregates(self):
+        self.add_reviews([{'rating': 5}, {'rating': 4}, {'review': 'Responsive agent'}, {'rating': 4}])
+
+        Review.objects.filter(company=self.company, rating=5).delete()
+        Review.objects.filter(company=self.company, rating__isnull=True).delete()
+
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.review_count, 2)
+        self.assertEqual(self.company.rating_count, 2)
+        self.assertEqual(self.company.rating_sum, 8)
+        self.assertEqual(str(self.company.average_rating), '4.0')
+        self.assertEqual(self.company.rating_histogram, {'1': 0, '2': 0, '3': 0, '4': 2, '5': 0})
+
+        ## a deleted reviewer takes their reviews with them
+        Review.objects.first().reviewer.delete()
+        self.company.refresh_from_db()
+        self.assertEqual((self.company.review_count, self.company.average_rating), (0, None))
+
+    def test_profile_rating_covers_every_review(self):
+        self.add_reviews([{'rating': 1}] + [{'rating': 5}] * NUMBER_OF_REVIEWS_TO_DISPLAY)
+
+        with CaptureQueriesContext(connection) as context:
+            response = APIClient().get(f'/api/v1/user/business_profile/{self.agent.id}/')
+
+        self.assertEqual(response.json()['rating'], '4.6')
+        self.company.refresh_from_db()
+        self.assertEqual(response.json()['rating'], str(self.company.average_rating))
+        self.assertFalse([query for query in context.captured_queries if 'AVG(' in query['sql']])
+
+    def test_backfill_matches_incremental_aggregates(self):
+        self.add_reviews([{'rating': 2}, {'rating': 3}, {'review': 'Slow to reply'}])
+        self.company.refresh_from_db()
+        expected = [self.company.review_count, self.company.rating_sum, self.company.average_rating,
+                    self.company.rating_histogram]
+
+        Company.objects.update(review_count=0, rating_count=0, rating_sum=0, average_rating=None)
+        call_command('backfill_company_ratings', stdout=StringIO())
+
+        self.company.refresh_from_db()
+        self.assertEqual([self.company.review_count, self.company.rating_sum, self.company.average_rating,
+                          self.company.rating_histogram], expected)
+
+
+class ReplacedImageVariantsTestCase(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, FILE_UPLOAD_STORAGE='local')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.agent = User.objects.create_user('Ada', 'Obi', 'agent@roofbucks.com', 'AGENT', 'Password1!')
+        self.company = Company.objects.create(
+            user=self.agent, registration_number='RC1234', reference_number='REF123456789',
+            registered_name='Obi Homes', company_logo='company_logo/old.png',
+            company_logo_variants={'320': {'webp': 'company_logo/old_w320.webp'}})
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    def test_replacing_the_logo_clears_its_variants(self):
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, 'PNG')
+
+        response = self.client.patch('/api/v1/user/update_company/', {
+            'phone': '08012345678',
+            'company_logo': SimpleUploadedFile('new.png', buffer.getvalue(), content_type='image/png')})
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.company.refresh_from_db()
+        self.assertNotEqual(self.company.company_logo.name, 'company_logo/old.png')
+        self.assertEqual(self.company.company_logo_variants, {})
+        self.assertEqual(ImageDerivativeJob.objects.get().source, self.company.company_logo.name)
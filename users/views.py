@@ -6,16 +6,16 @@ from rest_framework import (parsers,permissions,authentication)
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from django.db import transaction
 from rest_framework.decorators import permission_classes
-from django.db.models import Avg, Count
+from django.db.models import Count
 
-from .models import User, Company, Review
-from album.models import MediaFiles
+from .models import User, Company, Review, get_onboarded_agent_condition
+from album.models import MediaFiles, ImageDerivativeJob
 from properties.models import Property
 from .serializers import (UpdateProfileSerializer, CreateCompanySerializer,
                           AddBankInfoSerializer, BusinessProfileSerializer,
                           AgentListSerializer, ReviewsSerializer, UpdateCompanySerializer)
 from utils.pagination import CustomPagination
-from utils.constants import (NUMBER_OF_REVIEWS_TO_DISPLAY)
+from utils.constants import (NUMBER_OF_REVIEWS_TO_DISPLAY, NUMBER_OF_PROPERTIES_TO_DISPLAY)
 from authentication.permissions import IsCustomer, IsAgent
 
 
@@ -119,19 +119,19 @@ class BusinessProfileView(views.APIView):
         if request.GET.get('order_by') == 'created_at':
             order = 'created_at'
 
-        properties = Property.objects.filter(agent=user_id).all().order_by(order)
+        properties = list(
+            Property.objects.filter(agent=user_id).order_by(order)[:NUMBER_OF_PROPERTIES_TO_DISPLAY])
 
-        for property in properties:
-            property.get_images()
-            property.get_documents()
+        ## one MediaFiles query for every image and document album
+        Property.attach_media(properties)
 
         setattr(user, 'properties', properties)
 
         ## attach reviews to user object
-        reviews = Review.objects.filter(company=company)[:NUMBER_OF_REVIEWS_TO_DISPLAY].all()
-        rating = reviews.aggregate(Avg('rating'))
+        reviews = Review.objects.select_related('reviewer').filter(company=company)[:NUMBER_OF_REVIEWS_TO_DISPLAY].all()
 
-        setattr(user, 'rating', rating['rating__avg'])
+        ## over every review, not just the ones displayed
+        setattr(user, 'rating', company.average_rating)
         setattr(user, 'reviews', reviews)
 
         serializer = self.serializer_class(user)
@@ -167,7 +167,9 @@ class CreateCompany(views.APIView):
         serializer.is_valid(raise_exception=True)
 
         with transaction.atomic():
-            serializer.save()
+            company = serializer.save()
+            if 'company_logo' in serializer.validated_data:
+                ImageDerivativeJob.enqueue([company], 'company_logo')
 
             user = request.user
             user.stages_of_profile_completion['business'] = True
@@ -207,15 +209,7 @@ class AgentListView(ReadOnlyModelViewSet):
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        return User.objects.filter(
-            role='AGENT',
-            is_verified=True,
-            stages_of_profile_completion__profile=True,
-            stages_of_profile_completion__business=True,
-            stages_of_profile_completion__billing=True,
-            stages_of_kyc_verification__profile=True,
-            stages_of_kyc_verification__business=True
-        ).order_by('-created_at')
+        return User.objects.filter(get_onboarded_agent_condition()).order_by('-created_at')
 
 
 class ReviewListView(views.APIView):
@@ -0,0 +1,72 @@
+import time
+import hashlib
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+from utils.constants import FEED_CACHE_TIMEOUT, FEED_LOCAL_CACHE_TIMEOUT
+
+
+def get_namespace_version(namespace):
+    """
+    Current generation of a cache namespace. Entries are stored under this version,
+    so bumping it drops a whole namespace at once without scanning keys.
+    """
+    key = f'cache_namespace:{namespace}'
+    ## seed with a timestamp so an evicted counter never reuses an old generation
+    cache.add(key, time.time_ns(), None)
+    return cache.get(key)
+
+
+def invalidate_cache_namespace(*namespaces):
+    def bump_versions():
+        for namespace in namespaces:
+            key = f'cache_namespace:{namespace}'
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+
+    ## wait for the write to be visible, or a concurrent read could re-cache stale rows
+    transaction.on_commit(bump_versions)
+
+
+def get_request_cache_key(namespace, request):
+    """Cache key from the request host, path and normalised (sorted) query params."""
+    query_params = sorted(
+        (key, value) for key in request.query_params for value in request.query_params.getlist(key))
+
+    raw_key = f'{request.get_host()}{request.path}?{query_params}'
+    return f'{namespace}:{hashlib.md5(raw_key.encode()).hexdigest()}'
+
+
+class CachedListMixin:
+    """
+    Read-through cache for list endpoints whose output doesn't depend on the user.
+    Entries live until their namespace is invalidated; `cache_timeout` is only a backstop.
+    A local memory cache is per process, so an invalidation only reaches the worker that made
+    the write; there entries are kept for `FEED_LOCAL_CACHE_TIMEOUT` at most.
+    """
+
+    cache_namespace = None
+    cache_timeout = FEED_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        key = get_request_cache_key(self.cache_namespace, request)
+        version = get_namespace_version(self.cache_namespace)
+
+        data = cache.get(key, version=version)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.get_cache_timeout(), version=version)
+
+        return response
+
+    def get_cache_timeout(self):
+        if isinstance(caches['default'], LocMemCache):
+            return min(self.cache_timeout, FEED_LOCAL_CACHE_TIMEOUT)
+        return self.cache_timeout
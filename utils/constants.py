@@ -2,7 +2,11 @@
 ALLOWABLE_NUMBER_OF_DOCUMENTS = 6
 ALLOWABLE_NUMBER_OF_IMAGES = 5
 MAXIMUM_SIMILAR_PROPERTIES = 10
+SIMILARITY_REFRESH_BATCH_SIZE = 50
+SIMILARITY_REFRESH_MAX_ATTEMPTS = 3
+SIMILARITY_REFRESH_CLAIM_TIMEOUT = 60 * 10
 NUMBER_OF_REVIEWS_TO_DISPLAY=10
+NUMBER_OF_PROPERTIES_TO_DISPLAY=20
 STAGES_OF_PROFILE_COMPLETION = {
         'profile': False,
         'business': False,
@@ -13,3 +17,60 @@ STAGES_OF_KYC_VERIFICATION = {
         'business': False,
     }
 ALLOWABLE_DOCUMENT_TYPES = ['application/pdf', 'image/jpeg', 'image/jpg', 'image/png', 'application/octet-stream']
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+AGENT_SUMMARY_CACHE_TIMEOUT = 60 * 60
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_LOCAL_CACHE_TIMEOUT = 30
+PROPERTY_LISTING_CACHE = 'property_listing'
+PROPERTY_MARKETPLACE_CACHE = 'property_marketplace'
+PROPERTY_TOPDEALS_CACHE = 'property_topdeals'
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 60 * 10
+CHECKOUT_MAX_CONCURRENT_CHARGES = 5
+PAYSTACK_CONNECT_TIMEOUT = 3.05
+PAYSTACK_READ_TIMEOUT = 10
+PAYSTACK_MAX_RETRIES = 2
+PAYSTACK_POOL_SIZE = 10
+PAYSTACK_CIRCUIT_FAILURE_THRESHOLD = 5
+PAYSTACK_CIRCUIT_RESET_TIMEOUT = 30
+PAYSTACK_VERIFY_CONCURRENCY = 10
+REQUEST_METRICS_DURATION_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+REQUEST_METRICS_QUERY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200]
+REQUEST_METRICS_SIZE_BUCKETS = [1024, 10240, 102400, 1048576]
+PUBSUB_CHANNEL = 'roofbucks_notifications'
+PUBSUB_QUEUE_SIZE = 100
+NOTIFICATION_STREAM_HEARTBEAT = 15
+NOTIFICATION_STREAM_REPLAY_LIMIT = 100
+## days a notification is kept, by status; None keeps it forever
+NOTIFICATION_RETENTION_DAYS = {
+        'READ': 90,
+        'UNREAD': 365,
+    }
+NOTIFICATION_RETENTION_BATCH_SIZE = 5000
+BULK_MODERATION_MAX_PROPERTIES = 500
+BULK_KYC_MAX_USERS = 500
+## widths (px) of the resized copies made of every uploaded image
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1280]
+IMAGE_DERIVATIVE_QUALITY = {
+        'JPEG': 80,
+        'WEBP': 80,
+        'AVIF': 60,
+    }
+IMAGE_DERIVATIVE_BATCH_SIZE = 10
+IMAGE_DERIVATIVE_MAX_ATTEMPTS = 3
+IMAGE_DERIVATIVE_RETRY_DELAY = 60
+IMAGE_DERIVATIVE_CLAIM_TIMEOUT = 60 * 10
+DIRECT_UPLOAD_EXPIRY = 60 * 60
+DIRECT_UPLOAD_MAX_SIZE = 8388608
+ALLOWABLE_IMAGE_TYPES = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
+STORAGE_UPLOAD_CONCURRENCY = 6
+STORAGE_LISTING_PAGE_SIZE = 1000
+STORAGE_DELETION_BATCH_SIZE = 1000
+STORAGE_DELETION_MAX_ATTEMPTS = 5
+STORAGE_DELETION_RETRY_DELAY = 60
+## unreferenced albums and storage objects younger than this may still be getting attached to a record
+STORAGE_GC_GRACE_PERIOD = 60 * 60 * 24
+STORAGE_GC_BATCH_SIZE = 500
+STORAGE_GC_REFERENCE_CHUNK_SIZE = 2000
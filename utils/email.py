@@ -1,19 +1,82 @@
-from django.core.mail import EmailMessage
+from datetime import timedelta
+from django.core.mail import EmailMessage, get_connection
 from django.contrib.sites.shortcuts import  get_current_site
+from django.db import transaction
+from django.db.models import Q, F
 from django.urls import reverse
+from django.utils import timezone
 from mailjet_rest import Client
 import os
-import threading
 
+from notifications.models import EmailOutbox, CHOICES_FOR_EMAIL_STATUS
+from utils.constants import (EMAIL_OUTBOX_BATCH_SIZE, EMAIL_OUTBOX_MAX_ATTEMPTS,
+                             EMAIL_OUTBOX_RETRY_DELAY, EMAIL_OUTBOX_CLAIM_TIMEOUT)
 
-class EmailThread(threading.Thread):
 
-    def __init__(self, email):
-        self.email = email
-        threading.Thread.__init__(self)
+def send_queued_emails(batch_size=EMAIL_OUTBOX_BATCH_SIZE) -> int:
+    """
+    Claim a batch of due emails from the outbox, send them over one SMTP connection
+    and record the outcome. Failed mails are retried with exponential backoff.
+    Returns the number of emails claimed.
+    """
+    pending, sending, sent, failed = [status for status, _ in CHOICES_FOR_EMAIL_STATUS]
+    now = timezone.now()
 
-    def run(self):
-        self.email.send()
+    ## SENDING rows past the claim timeout belong to a worker that died mid-batch. Every
+    ## claim counts as an attempt, so a mail that keeps killing workers is given up on too
+    stale = Q(status=sending, claimed_at__lt=now - timedelta(seconds=EMAIL_OUTBOX_CLAIM_TIMEOUT))
+
+    with transaction.atomic():
+        EmailOutbox.objects.filter(stale, attempts__gte=EMAIL_OUTBOX_MAX_ATTEMPTS).update(
+            status=failed, last_error='Claim timed out on the last attempt', updated_at=now)
+
+        batch = list(EmailOutbox.objects.select_for_update(skip_locked=True).filter(
+            Q(status=pending, next_attempt_at__lte=now) | (stale & Q(attempts__lt=EMAIL_OUTBOX_MAX_ATTEMPTS))
+        ).order_by('next_attempt_at')[:batch_size])
+
+        EmailOutbox.objects.filter(id__in=[email.id for email in batch]).update(
+            status=sending, claimed_at=now, attempts=F('attempts') + 1)
+
+    if not batch:
+        return 0
+
+    sent_ids, errors = [], {}
+    try:
+        with get_connection() as connection:
+            for email in batch:
+                try:
+                    EmailMessage(
+                        subject=email.subject, body=email.body,
+                        to=[email.to_email], connection=connection).send()
+                    sent_ids.append(email.id)
+                except Exception as e:
+                    errors[email.id] = e
+    except Exception as e:
+        ## connection could not be opened or closed cleanly
+        for email in batch:
+            if email.id not in sent_ids:
+                errors.setdefault(email.id, e)
+
+    EmailOutbox.objects.filter(id__in=sent_ids).update(status=sent, sent_at=timezone.now(), last_error=None)
+
+    retries = []
+    for email in batch:
+        if email.id not in errors:
+            continue
+
+        attempts = email.attempts + 1
+        email.attempts = attempts
+        email.last_error = repr(errors[email.id])
+        if attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+            email.status = failed
+        else:
+            email.status = pending
+            email.next_attempt_at = timezone.now() + timedelta(seconds=EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+        retries.append(email)
+
+    EmailOutbox.objects.bulk_update(retries, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    return len(batch)
 
 
 class SendMail:
@@ -25,9 +88,9 @@ class SendMail:
         
     @staticmethod
     def send_email(data):
-        email = EmailMessage(
-            subject=data['email_subject'], body=data['email_body'], to=[data['to_email']])
-        EmailThread(email).start()
+        ## queued in the outbox and delivered by `manage.py send_queued_emails`
+        EmailOutbox.enqueue(
+            to_email=data['to_email'], subject=data['email_subject'], body=data['email_body'])
 
     @staticmethod
     def send_email_verification_mail(data):
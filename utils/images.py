@@ -0,0 +1,152 @@
+import os
+from io import BytesIO
+from datetime import timedelta
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q, F
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from album.models import ImageDerivativeJob, ContentBlob, CHOICES_FOR_DERIVATIVE_STATUS
+from utils.cache import invalidate_cache_namespace
+from utils.constants import (IMAGE_DERIVATIVE_WIDTHS, IMAGE_DERIVATIVE_QUALITY, IMAGE_DERIVATIVE_BATCH_SIZE,
+                             IMAGE_DERIVATIVE_MAX_ATTEMPTS, IMAGE_DERIVATIVE_RETRY_DELAY,
+                             IMAGE_DERIVATIVE_CLAIM_TIMEOUT, PROPERTY_LISTING_CACHE,
+                             PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'AVIF': 'avif'}
+
+## models whose images are embedded in the cached property feeds
+FEED_MODELS = {'properties.Property', 'album.MediaFiles'}
+
+
+def get_derivative_formats():
+    """JPEG as the universal fallback, then the smaller formats this Pillow build can encode."""
+    return ['JPEG', 'WEBP'] + (['AVIF'] if features.check('avif') else [])
+
+
+def encode_image(image, format):
+    if format == 'JPEG' and image.mode != 'RGB':
+        ## JPEG has no alpha channel, flatten onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+
+    buffer = BytesIO()
+    image.save(buffer, format, quality=IMAGE_DERIVATIVE_QUALITY[format], optimize=format == 'JPEG')
+    return buffer.getvalue()
+
+
+def generate_image_derivatives(name, storage=default_storage, widths=IMAGE_DERIVATIVE_WIDTHS):
+    """
+    Store resized copies of an image in every derivative format beside the original.
+    Widths at or above the original's are skipped; an image narrower than all of them
+    is only re-encoded. Returns {width: {format: storage name}}.
+    """
+    with storage.open(name) as file:
+        image = Image.open(file)
+        widths = [width for width in widths if width < image.width] or [image.width]
+        ## lets JPEG decode straight at a reduced scale instead of at full size
+        image.draft('RGB', (max(widths), max(widths) * image.height // image.width))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    base, _ = os.path.splitext(name)
+    variants = {}
+    for width in sorted(widths):
+        resized = image if width == image.width else image.resize(
+            (width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+        variants[str(width)] = {
+            format.lower(): storage.save(f'{base}_w{width}.{EXTENSIONS[format]}',
+                                         ContentFile(encode_image(resized, format)))
+            for format in get_derivative_formats()
+        }
+
+    return variants
+
+
+def delete_image_derivatives(variants, storage=default_storage):
+    for formats in variants.values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def get_shared_variants(job):
+    """Derivatives another row already has of the same content blob, or None."""
+    if not ContentBlob.objects.filter(name=job.source).exists():
+        return None
+
+    done = CHOICES_FOR_DERIVATIVE_STATUS[2][0]
+    for other in ImageDerivativeJob.objects.filter(source=job.source, status=done).exclude(id=job.id)[:10]:
+        variants = apps.get_model(other.model).objects.filter(
+            pk=other.object_id, **{other.field: other.source}).values_list(f'{other.field}_variants', flat=True).first()
+        if variants:
+            return variants
+    return None
+
+
+def process_image_derivative_jobs(batch_size=IMAGE_DERIVATIVE_BATCH_SIZE) -> int:
+    """
+    Claim a batch of queued images, generate their derivatives and record them on the
+    rows the images belong to. Failed jobs are retried with exponential backoff.
+    Returns the number of jobs claimed.
+    """
+    pending, processing, done, failed = [status for status, _ in CHOICES_FOR_DERIVATIVE_STATUS]
+    now = timezone.now()
+
+    ## PROCESSING rows past the claim timeout belong to a worker that died mid-batch. Every
+    ## claim counts as an attempt, so an image that keeps killing workers is given up on too
+    stale = Q(status=processing, claimed_at__lt=now - timedelta(seconds=IMAGE_DERIVATIVE_CLAIM_TIMEOUT))
+
+    with transaction.atomic():
+        ImageDerivativeJob.objects.filter(stale, attempts__gte=IMAGE_DERIVATIVE_MAX_ATTEMPTS).update(
+            status=failed, last_error='Claim timed out on the last attempt', updated_at=now)
+
+        batch = list(ImageDerivativeJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=pending, next_attempt_at__lte=now) | (stale & Q(attempts__lt=IMAGE_DERIVATIVE_MAX_ATTEMPTS))
+        ).order_by('next_attempt_at')[:batch_size])
+
+        ImageDerivativeJob.objects.filter(id__in=[job.id for job in batch]).update(
+            status=processing, claimed_at=now, attempts=F('attempts') + 1)
+
+    if not batch:
+        return 0
+
+    done_ids, retries, feed_changed = [], [], False
+    for job in batch:
+        try:
+            ## derivatives of a deduplicated image belong to its blob, and are shared like it
+            shared_variants = get_shared_variants(job)
+            variants = shared_variants or generate_image_derivatives(job.source)
+        except Exception as e:
+            job.attempts += 1
+            job.last_error = repr(e)
+            if job.attempts >= IMAGE_DERIVATIVE_MAX_ATTEMPTS:
+                job.status = failed
+            else:
+                job.status = pending
+                job.next_attempt_at = timezone.now() + timedelta(
+                    seconds=IMAGE_DERIVATIVE_RETRY_DELAY * 2 ** (job.attempts - 1))
+            retries.append(job)
+            continue
+
+        ## the image may have been replaced or deleted since it was queued
+        updated = apps.get_model(job.model).objects.filter(
+            pk=job.object_id, **{job.field: job.source}).update(**{f'{job.field}_variants': variants})
+        if not updated and not shared_variants:
+            delete_image_derivatives(variants)
+
+        feed_changed = feed_changed or (updated and job.model in FEED_MODELS)
+        done_ids.append(job.id)
+
+    ImageDerivativeJob.objects.filter(id__in=done_ids).update(status=done, last_error=None)
+    ImageDerivativeJob.objects.bulk_update(retries, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    if feed_changed:
+        ## queryset.update() skips the post_save receivers that normally do this
+        invalidate_cache_namespace(PROPERTY_LISTING_CACHE, PROPERTY_MARKETPLACE_CACHE, PROPERTY_TOPDEALS_CACHE)
+
+    return len(batch)
@@ -0,0 +1,182 @@
+import time
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+from django.db import connections
+
+from utils.constants import (REQUEST_METRICS_DURATION_BUCKETS, REQUEST_METRICS_QUERY_BUCKETS,
+                             REQUEST_METRICS_SIZE_BUCKETS)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the shape Prometheus expects."""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) ## last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            total += count
+            yield bound, total
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'mean': round(self.sum / self.count, 3) if self.count else 0,
+            'buckets': {str(bound): count for bound, count in self.cumulative_counts()},
+        }
+
+
+## metric name -> (help text, bucket bounds)
+REQUEST_METRICS = {
+    'duration_ms': ('Total time spent handling the request', REQUEST_METRICS_DURATION_BUCKETS),
+    'db_ms': ('Time spent waiting on SQL queries', REQUEST_METRICS_DURATION_BUCKETS),
+    'render_ms': ('Time spent rendering the response body', REQUEST_METRICS_DURATION_BUCKETS),
+    'queries': ('Number of SQL queries', REQUEST_METRICS_QUERY_BUCKETS),
+    'response_bytes': ('Size of the response body', REQUEST_METRICS_SIZE_BUCKETS),
+}
+
+STORAGE_UPLOAD_METRICS = {
+    'wall_ms': ('Time to store every file of one submission', REQUEST_METRICS_DURATION_BUCKETS),
+    'estimated_sequential_ms': ('Sum of the single-file upload times, an estimate of storing them one by one '
+                                '(uploads running side by side share bandwidth, so each may take longer)',
+                                REQUEST_METRICS_DURATION_BUCKETS),
+    'files': ('Files stored per submission', REQUEST_METRICS_QUERY_BUCKETS),
+    'deduplicated': ('Files of a submission whose content was already stored', REQUEST_METRICS_QUERY_BUCKETS),
+}
+
+
+class MetricsRegistry:
+    """
+    Histograms of a fixed set of metrics, one set per combination of label values.
+    The registry lives in the process, so each worker reports only what it observed itself.
+    """
+
+    def __init__(self, prefix: str, metrics: Dict[str, tuple], labels: Tuple[str, ...]):
+        self.prefix = prefix
+        self.metrics = metrics
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, Dict[str, Histogram]] = {}
+
+    def observe(self, label_values: tuple, values: Dict[str, float]):
+        with self._lock:
+            histograms = self._series.get(label_values)
+            if histograms is None:
+                histograms = self._series[label_values] = {
+                    name: Histogram(buckets) for name, (_, buckets) in self.metrics.items()}
+
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def as_dict(self):
+        with self._lock:
+            return [
+                {**dict(zip(self.labels, label_values)),
+                 **{name: histogram.as_dict() for name, histogram in histograms.items()}}
+                for label_values, histograms in sorted(self._series.items(), key=lambda item: item[0][::-1])
+            ]
+
+    def as_prometheus_text(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in self.metrics.items():
+                metric = f'{self.prefix}_{name}'
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+
+                for label_values, histograms in self._series.items():
+                    histogram = histograms[name]
+                    labels = ','.join(f'{label}="{value}"' for label, value in zip(self.labels, label_values))
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_sum{{{labels}}} {round(histogram.sum, 3)}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+## per view, keyed on (method, route)
+request_metrics = MetricsRegistry('roofbucks_request', REQUEST_METRICS, ('method', 'route'))
+## per storage backend, see utils.uploads.StorageUploadBatch
+storage_upload_metrics = MetricsRegistry('roofbucks_storage_upload', STORAGE_UPLOAD_METRICS, ('storage',))
+
+
+class QueryTimer:
+    """connection.execute_wrapper that counts queries and adds up their time."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Records query count, DB time, render time and response size for every request.
+    They are returned in a Server-Timing header and added to `request_metrics`, which
+    admins can read at /api/v1/admin/metrics/. Enabled by REQUEST_METRICS=True.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._render_seconds = 0
+        started = time.perf_counter()
+
+        with connections['default'].execute_wrapper(timer):
+            response = self.get_response(request)
+
+        duration = time.perf_counter() - started
+
+        response_bytes = 0 if response.streaming else len(response.content)
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.route if resolver_match else 'unresolved'
+
+        request_metrics.observe((request.method, route), {
+            'duration_ms': duration * 1000,
+            'db_ms': timer.seconds * 1000,
+            'render_ms': request._render_seconds * 1000,
+            'queries': timer.queries,
+            'response_bytes': response_bytes,
+        })
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timer.seconds * 1000:.2f};desc="{timer.queries} queries"',
+            f'render;dur={request._render_seconds * 1000:.2f}',
+            f'total;dur={duration * 1000:.2f}',
+        ])
+
+        return response
+
+    def process_template_response(self, request, response):
+        ## DRF responses are rendered right after this hook; time it with a post-render callback
+        started = time.perf_counter()
+
+        def record_render_time(rendered_response):
+            request._render_seconds = time.perf_counter() - started
+
+        response.add_post_render_callback(record_render_time)
+        return response
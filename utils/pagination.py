@@ -1,8 +1,26 @@
 import math
+import hashlib
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
 from rest_framework.settings import api_settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.response import Response
 
+from utils.constants import PAGINATION_COUNT_CACHE_TIMEOUT
+
+
+def get_cached_count(queryset, timeout=PAGINATION_COUNT_CACHE_TIMEOUT):
+    """Return queryset.count(), cached per distinct query for `timeout` seconds."""
+
+    queryset = queryset.order_by()
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    key = 'pagination_count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count, timeout)
+
 
 class CustomPagination(PageNumberPagination):
 
@@ -24,3 +42,61 @@ class CustomPagination(PageNumberPagination):
             'pages': math.ceil(self.page.paginator.count / page_size ),
             'results': data
         })
+
+
+class CustomCursorPagination(CursorPagination):
+    """
+    Keyset pagination on (created_at, id). Avoids OFFSET scans on deep pages
+    and reports `total` from a cached count instead of counting on every request.
+    """
+
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_queryset = queryset
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        total = get_cached_count(self.count_queryset)
+
+        return Response({
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+            'total': total,
+            'limit': self.page_size,
+            'pages': math.ceil(total / self.page_size),
+            'results': data
+        })
+
+
+class CursorPaginationMixin:
+    """
+    Lets a viewset switch from CustomPagination to keyset pagination.
+
+    Cursor mode is used when the view sets `cursor_pagination = True`, or when
+    the request passes `?pagination=cursor` or a `cursor` token.
+    """
+
+    cursor_pagination = False
+    cursor_pagination_class = CustomCursorPagination
+
+    def use_cursor_pagination(self):
+        query_params = self.request.query_params
+        return (self.cursor_pagination
+                or query_params.get('pagination') == 'cursor'
+                or self.cursor_pagination_class.cursor_query_param in query_params)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
@@ -1,40 +1,338 @@
+import time
+import asyncio
+import threading
 from os import environ
-import requests
 from random import randint
-from rest_framework.exceptions import ParseError
+from functools import lru_cache
+from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.exceptions import ParseError, APIException
 
 from transactions.models import CHOICES_FOR_STATUS, CHOICES_FOR_PAYMENT_METHOD
 from users.models import User
+from utils.constants import (PAYSTACK_CONNECT_TIMEOUT, PAYSTACK_READ_TIMEOUT, PAYSTACK_MAX_RETRIES,
+                             PAYSTACK_POOL_SIZE, PAYSTACK_CIRCUIT_FAILURE_THRESHOLD,
+                             PAYSTACK_CIRCUIT_RESET_TIMEOUT, PAYSTACK_VERIFY_CONCURRENCY)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 
 PAYSTACK_SECRET_KEY = environ.get('PAYSTACK_SECRET_KEY', '')
 PAYSTACK_BASE_URL = environ.get('PAYSTACK_BASE_URL', '')
 
+## statuses worth retrying; anything else is Paystack's final answer
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
 
-def chargeCard():
-    try:
+## Paystack transaction statuses mapped onto CHOICES_FOR_STATUS; unknown ones stay PENDING
+PAYSTACK_TRANSACTION_STATUS = {
+    'success': CHOICES_FOR_STATUS[1][0],
+    'failed': CHOICES_FOR_STATUS[2][0],
+    'abandoned': CHOICES_FOR_STATUS[2][0],
+    'reversed': CHOICES_FOR_STATUS[2][0],
+}
+
+
+class PaymentServiceError(APIException):
+    status_code = 502
+    default_detail = 'The payment service could not process this request.'
+    default_code = 'payment_service_error'
+
+
+class PaymentServiceUnavailable(PaymentServiceError):
+    status_code = 503
+    default_detail = 'The payment service is currently unavailable, try again later.'
+    default_code = 'payment_service_unavailable'
+
+
+class PaymentServiceNotFound(PaymentServiceError):
+    status_code = 404
+    default_detail = 'The payment service has no record of this transaction.'
+    default_code = 'payment_service_not_found'
+
+
+class PaymentServiceNotReached(PaymentServiceUnavailable):
+    """The request was never sent: the circuit is open or no connection could be made."""
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast once `failure_threshold` consecutive calls have failed. After
+    `reset_timeout` seconds one trial call is let through: success closes the
+    circuit again, failure keeps it open for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=PAYSTACK_CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=PAYSTACK_CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                ## re-arm the timer so only this caller probes while the rest keep failing fast
+                self.opened_at = time.monotonic()
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+## shared by every client in the process, so an outage seen by one request trips it for all
+paystack_circuit_breaker = CircuitBreaker()
+
+
+def get_transaction_status(paystack_status: str) -> str:
+    return PAYSTACK_TRANSACTION_STATUS.get(paystack_status, CHOICES_FOR_STATUS[0][0])
+
+
+class BasePaystackClient:
+
+    def __init__(self, base_url=None, secret_key=None, connect_timeout=PAYSTACK_CONNECT_TIMEOUT,
+                 read_timeout=PAYSTACK_READ_TIMEOUT, max_retries=PAYSTACK_MAX_RETRIES,
+                 pool_size=PAYSTACK_POOL_SIZE, circuit_breaker=None):
+        self.base_url = (base_url or PAYSTACK_BASE_URL).rstrip('/')
+        self.secret_key = secret_key or PAYSTACK_SECRET_KEY
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.circuit_breaker = circuit_breaker or paystack_circuit_breaker
+
+        if not self.base_url:
+            raise ImproperlyConfigured('PAYSTACK_BASE_URL is not set')
+
+    @property
+    def headers(self):
+        return {'Authorization': f'Bearer {self.secret_key}', 'Content-Type': 'application/json'}
+
+    def _check_circuit(self):
+        if not self.circuit_breaker.allow_request():
+            raise PaymentServiceNotReached()
+
+    def _handle_response(self, status_code: int, get_body):
+        if status_code in RETRYABLE_STATUS_CODES:
+            self.circuit_breaker.record_failure()
+            raise PaymentServiceUnavailable()
+
+        ## a 4xx is Paystack rejecting this request, not Paystack being down
+        self.circuit_breaker.record_success()
+
+        try:
+            body = get_body()
+        except ValueError:
+            raise PaymentServiceError()
+
+        if status_code == 404:
+            raise PaymentServiceNotFound(body.get('message'))
+        if status_code >= 400 or not body.get('status'):
+            raise PaymentServiceError(body.get('message'))
+
+        return body.get('data') or {}
+
+    @staticmethod
+    def _charge_payload(email: str, amount: int, reference: str, **extra):
+        return {'email': email, 'amount': amount, 'reference': reference, **extra}
 
-        # data={}
-        # headers = {'Authorization': f'Bearer {PAYSTACK_SECRET_KEY}'}
-        # url = f'{PAYSTACK_BASE_URL}/charge'
 
-        # requests.post(
-        #     url,
-        #     data,
-        #     headers,
-        # )
+class PaystackClient(BasePaystackClient):
+    """
+    Paystack API client over one pooled keep-alive session. Safe to share between threads.
+
+    Connection failures are retried for every call, since the request never reached
+    Paystack. Read failures and 5xx responses are only retried for verification GETs,
+    never for a charge.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            allowed_methods=frozenset(['GET']),
+            status_forcelist=RETRYABLE_STATUS_CODES,
+            backoff_factor=0.2,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method: str, path: str, **kwargs) -> Dict:
+        self._check_circuit()
+
+        try:
+            response = self.session.request(
+                method, f'{self.base_url}{path}',
+                timeout=(self.connect_timeout, self.read_timeout), **kwargs)
+        except requests.RequestException as e:
+            self.circuit_breaker.record_failure()
+            ## only a request that never got a connection is known not to have charged anyone;
+            ## NewConnectionError is a ConnectTimeoutError too
+            reason = getattr(e.args[0], 'reason', None) if e.args else None
+            if isinstance(e, requests.ConnectTimeout) or isinstance(reason, ConnectTimeoutError):
+                raise PaymentServiceNotReached() from e
+            raise PaymentServiceUnavailable() from e
+
+        return self._handle_response(response.status_code, response.json)
+
+    def charge(self, email: str, amount: int, reference: str, **extra) -> Dict:
+        return self.request('POST', '/charge', json=self._charge_payload(email, amount, reference, **extra))
+
+    def verify_transaction(self, reference: str) -> Dict:
+        return self.request('GET', f'/transaction/verify/{reference}')
+
+    def verify_transactions(self, references: List[str], concurrency=PAYSTACK_VERIFY_CONCURRENCY) -> Dict[str, Dict]:
+        """
+        Verify many references concurrently over the shared pool. Returns the
+        transaction data by reference, None for references Paystack has no transaction
+        for; references that couldn't be verified are left out.
+        """
+        if not references:
+            return {}
+
+        def verify(reference):
+            try:
+                return reference, self.verify_transaction(reference)
+            except PaymentServiceNotFound:
+                return reference, None
+            except PaymentServiceError:
+                return reference, False
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, self.pool_size, len(references))) as executor:
+            results = executor.map(verify, references)
+
+        return {reference: data for reference, data in results if data is not False}
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncPaystackClient(BasePaystackClient):
+    """asyncio counterpart of PaystackClient, on a pooled httpx.AsyncClient."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if httpx is None:
+            raise ImproperlyConfigured('AsyncPaystackClient requires httpx to be installed')
+
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            ## transport retries only cover failed connects, which is what a charge may retry
+            transport=httpx.AsyncHTTPTransport(retries=self.max_retries),
+        )
+
+    async def request(self, method: str, path: str, **kwargs) -> Dict:
+        self._check_circuit()
+
+        attempts = self.max_retries + 1 if method == 'GET' else 1
+        for attempt in range(attempts):
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.HTTPError as e:
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(0.2 * 2 ** attempt)
+                    continue
+                self.circuit_breaker.record_failure()
+                if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    raise PaymentServiceNotReached() from e
+                raise PaymentServiceUnavailable() from e
+
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt + 1 < attempts:
+                await asyncio.sleep(0.2 * 2 ** attempt)
+                continue
+
+            return self._handle_response(response.status_code, response.json)
+
+    async def charge(self, email: str, amount: int, reference: str, **extra) -> Dict:
+        return await self.request('POST', '/charge', json=self._charge_payload(email, amount, reference, **extra))
+
+    async def verify_transaction(self, reference: str) -> Dict:
+        return await self.request('GET', f'/transaction/verify/{reference}')
+
+    async def verify_transactions(self, references: List[str], concurrency=PAYSTACK_VERIFY_CONCURRENCY) -> Dict[str, Dict]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def verify(reference):
+            async with semaphore:
+                try:
+                    return reference, await self.verify_transaction(reference)
+                except PaymentServiceNotFound:
+                    return reference, None
+                except PaymentServiceError:
+                    return reference, False
+
+        results = await asyncio.gather(*[verify(reference) for reference in references])
+        return {reference: data for reference, data in results if data is not False}
+
+    async def close(self):
+        await self.client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_paystack_client() -> PaystackClient:
+    """The process-wide client, so every charge reuses the same connection pool."""
+    return PaystackClient()
+
+
+def chargeCard(log):
+    if not PAYSTACK_SECRET_KEY:
+        ## no Paystack account configured (local development): simulate an outcome
         index = randint(0,2)
         return {
-            "status": CHOICES_FOR_STATUS[index][0], 
+            "status": CHOICES_FOR_STATUS[index][0],
             "payment_method": CHOICES_FOR_PAYMENT_METHOD[0][0]}
-    
-    except Exception as e:
-        raise ParseError(e.args)
+
+    data = get_paystack_client().charge(
+        email=log.client.email,
+        amount=log.amount * log.number_of_shares * 100, ## in kobo
+        reference=log.reference)
+
+    return {
+        "status": get_transaction_status(data.get('status')),
+        "payment_method": CHOICES_FOR_PAYMENT_METHOD[0][0]}
 
 def generateTransactionReference():
     try:
         token = User.objects.make_random_password(
-            length=10, 
+            length=10,
             allowed_chars=f'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789abcdefghijklmnopqrstuvwxyz')
 
         return f'rfb_{token}'
@@ -0,0 +1,140 @@
+import json
+import re
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PaystackStubHandler(BaseHTTPRequestHandler):
+    ## HTTP/1.1 keeps connections alive, so clients can be checked for connection reuse
+    protocol_version = 'HTTP/1.1'
+    ## headers and body go out in separate writes; Nagle would stall every keep-alive response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code, body):
+        content = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_stub_request(self, path):
+        stub = self.server.stub
+        stub.record_request(self.command, path)
+
+        ## drain the body up front, or it is read as the next request on this connection
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        if stub.take_failure():
+            return self.send_json(503, {'status': False, 'message': 'Service unavailable'})
+
+        if self.headers.get('Authorization') != f'Bearer {stub.secret_key}':
+            return self.send_json(401, {'status': False, 'message': 'Invalid key'})
+
+        if self.command == 'POST' and path == '/charge':
+            reference = payload.get('reference')
+            return self.send_json(200, {'status': True, 'message': 'Charge attempted', 'data': {
+                'reference': reference,
+                'amount': payload.get('amount'),
+                'status': stub.statuses.get(reference, 'success'),
+            }})
+
+        match = re.fullmatch(r'/transaction/verify/([\w-]+)', path)
+        if self.command == 'GET' and match:
+            reference = match.group(1)
+            if reference not in stub.statuses and not stub.verify_unknown:
+                return self.send_json(404, {'status': False, 'message': 'Transaction reference not found'})
+            return self.send_json(200, {'status': True, 'message': 'Verification successful', 'data': {
+                'reference': reference,
+                'status': stub.statuses.get(reference, 'success'),
+            }})
+
+        return self.send_json(404, {'status': False, 'message': 'Not found'})
+
+    def do_GET(self):
+        self.handle_stub_request(self.path)
+
+    def do_POST(self):
+        self.handle_stub_request(self.path)
+
+
+class CountingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        self.stub.record_connection()
+        super().process_request(request, client_address)
+
+
+class PaystackStubServer:
+    """
+    A local stand-in for the Paystack API serving /charge and /transaction/verify/<reference>.
+    It counts the TCP connections and requests it sees, so tests and benchmarks can check
+    pooling. It can also add latency and fail the next N requests with a 503.
+
+        with PaystackStubServer(secret_key='sk_test') as stub:
+            client = PaystackClient(base_url=stub.url, secret_key='sk_test')
+    """
+
+    def __init__(self, secret_key='sk_test_stub', latency=0, statuses=None, verify_unknown=True):
+        self.secret_key = secret_key
+        self.latency = latency
+        ## reference -> Paystack status; unlisted references succeed
+        self.statuses = statuses or {}
+        self.verify_unknown = verify_unknown
+        self.connections = 0
+        self.requests = []
+        self.failures_remaining = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def fail_next(self, count):
+        with self._lock:
+            self.failures_remaining = count
+
+    def take_failure(self):
+        with self._lock:
+            if self.failures_remaining > 0:
+                self.failures_remaining -= 1
+                return True
+            return False
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_request(self, method, path):
+        with self._lock:
+            self.requests.append((method, path))
+
+    def start(self, port=0):
+        self._server = CountingHTTPServer(('127.0.0.1', port), PaystackStubHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,148 @@
+import json
+import time
+import select
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from utils.constants import PUBSUB_CHANNEL, PUBSUB_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    """
+    In-process fan-out of messages to per-user asyncio queues. Subscribers live on
+    the event loop of the ASGI server; `dispatch` may be called from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=PUBSUB_QUEUE_SIZE)
+        queue.loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            self._subscribers[user_id].discard(queue)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def dispatch(self, user_id, message):
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+
+        for queue in queues:
+            queue.loop.call_soon_threadsafe(self._put, queue, message)
+
+    @staticmethod
+    def _put(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            ## a stalled client loses messages rather than memory; it catches up on reconnect
+            pass
+
+
+broker = Broker()
+
+
+class LocalPubSubBackend:
+    """Delivers straight to this process's broker. Only for a single-process deployment."""
+
+    def publish(self, messages):
+        for user_id, message in messages:
+            broker.dispatch(user_id, message)
+
+    def start(self):
+        pass
+
+
+class PostgresPubSubBackend:
+    """
+    Cross-process delivery over Postgres LISTEN/NOTIFY, so any web or worker process
+    can publish to streams held open by any ASGI process. A listener thread per
+    process forwards notifications to the local broker.
+    """
+
+    def __init__(self, channel=PUBSUB_CHANNEL):
+        self.channel = channel
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, messages):
+        """Notify every (user_id, message) pair in one statement, however many there are."""
+        payloads = [json.dumps({'user_id': user_id, 'message': message}, default=str)
+                    for user_id, message in messages]
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                           [self.channel, payloads])
+
+    def start(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self.listen, daemon=True)
+                self._listener.start()
+
+    def listen(self):
+        database = connections['default']
+        while True:
+            try:
+                ## a dedicated connection: LISTEN has to stay outside Django's per-request connections
+                connection = database.get_new_connection(database.get_connection_params())
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+
+                while True:
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        payload = json.loads(notify.payload)
+                        broker.dispatch(payload['user_id'], payload['message'])
+            except Exception:
+                logger.exception('pubsub listener lost its connection, reconnecting')
+                time.sleep(1)
+
+
+_backend = None
+
+
+def get_pubsub_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.PUBSUB_BACKEND)()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_pubsub_backend(setting, **kwargs):
+    ## so override_settings(PUBSUB_BACKEND=...) takes effect on the next publish
+    global _backend
+    if setting == 'PUBSUB_BACKEND':
+        _backend = None
+
+
+def publish(messages):
+    """Publish (user_id, message) pairs to the users' open streams."""
+    messages = list(messages)
+    if not messages:
+        return
+    try:
+        get_pubsub_backend().publish(messages)
+    except Exception:
+        ## real-time delivery is best effort; the rows are already saved
+        logger.exception('could not publish to users %s', sorted({user_id for user_id, _ in messages}))
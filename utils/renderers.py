@@ -0,0 +1,67 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson. UUIDs, dates and datetimes are encoded natively;
+    anything else (Decimals, querysets, lazy strings) goes through DRF's JSONEncoder.
+    Falls back to the stdlib renderer when orjson isn't installed or the client
+    asks for indented output.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        ## orjson only writes compact utf-8, so other output styles keep the stdlib path
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ## OPT_NON_STR_KEYS: int keys are written as strings, as json.dumps does, where orjson would raise
+        ret = orjson.dumps(data, default=JSONEncoder().default,
+                           option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+        # same escaping as JSONRenderer, see rest_framework/renderers.py
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser backed by orjson, falling back to the stdlib parser without it."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        if orjson is None or encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class PrometheusTextRenderer(BaseRenderer):
+    """Passes pre-formatted Prometheus exposition text through; selected with ?format=prometheus."""
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data.encode(self.charset) if isinstance(data, str) else b''
@@ -0,0 +1,120 @@
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from album.models import StorageDeletion, CHOICES_FOR_DELETION_STATUS
+from utils.constants import (STORAGE_LISTING_PAGE_SIZE, STORAGE_DELETION_BATCH_SIZE,
+                             STORAGE_DELETION_MAX_ATTEMPTS, STORAGE_DELETION_RETRY_DELAY)
+
+
+class S3BulkStorageBackend:
+    """Paginated listings and multi-object deletes against the bucket behind default_storage."""
+
+    ## most keys one DeleteObjects request accepts
+    max_delete = 1000
+
+    @property
+    def client(self):
+        return default_storage.connection.meta.client
+
+    def get_key(self, name):
+        from storages.utils import clean_name
+
+        return default_storage._normalize_name(clean_name(name))
+
+    def list(self, prefix='', page_size=STORAGE_LISTING_PAGE_SIZE):
+        """Yield pages of (name, last modified, size) of the objects under `prefix`."""
+        ## keys carry the AWS_LOCATION prefix that storage names don't
+        location = f'{default_storage.location}/' if default_storage.location else ''
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=default_storage.bucket_name, Prefix=self.get_key(prefix),
+                                       PaginationConfig={'PageSize': page_size}):
+            yield [(item['Key'][len(location):], item['LastModified'], item['Size'])
+                   for item in page.get('Contents', [])]
+
+    def delete(self, names):
+        """Delete objects in as few requests as possible. Returns {name: error} of those that failed."""
+        keys, errors = {self.get_key(name): name for name in names}, {}
+        batch = list(keys)
+        for start in range(0, len(batch), self.max_delete):
+            response = self.client.delete_objects(Bucket=default_storage.bucket_name, Delete={
+                'Objects': [{'Key': key} for key in batch[start:start + self.max_delete]],
+                'Quiet': True,
+            })
+            for error in response.get('Errors', []):
+                errors[keys[error['Key']]] = f'{error["Code"]}: {error["Message"]}'
+        return errors
+
+
+class LocalBulkStorageBackend:
+    """The same operations on the local media directory, for development and tests."""
+
+    def list(self, prefix='', page_size=STORAGE_LISTING_PAGE_SIZE):
+        page = []
+        ## sorted walk, so a listing pages through the tree in the same order as S3's
+        for directory, directories, files in os.walk(default_storage.path(prefix)):
+            directories.sort()
+            for filename in sorted(files):
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                page.append((os.path.relpath(path, default_storage.location).replace(os.sep, '/'),
+                             datetime.fromtimestamp(stat.st_mtime, dt_timezone.utc), stat.st_size))
+                if len(page) == page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def delete(self, names):
+        errors = {}
+        for name in names:
+            try:
+                default_storage.delete(name)
+            except OSError as e:
+                errors[name] = repr(e)
+        return errors
+
+
+def get_bulk_storage_backend():
+    return import_string(settings.BULK_STORAGE_BACKEND)()
+
+
+def process_storage_deletions(batch_size=STORAGE_DELETION_BATCH_SIZE) -> int:
+    """
+    Claim a batch of queued storage names and delete them with one bulk request.
+    Failed names are retried with exponential backoff. Returns the number claimed.
+    """
+    pending, failed = [status for status, _ in CHOICES_FOR_DELETION_STATUS]
+
+    ## deleting an object twice is harmless, so the rows stay locked for the whole
+    ## batch instead of being claimed, and a worker that dies just leaves them queued
+    with transaction.atomic():
+        batch = list(StorageDeletion.objects.select_for_update(skip_locked=True).filter(
+            status=pending, next_attempt_at__lte=timezone.now()).order_by('next_attempt_at')[:batch_size])
+        if not batch:
+            return 0
+
+        try:
+            errors = get_bulk_storage_backend().delete([deletion.name for deletion in batch])
+        except Exception as e:
+            errors = {deletion.name: repr(e) for deletion in batch}
+
+        StorageDeletion.objects.filter(
+            id__in=[deletion.id for deletion in batch if deletion.name not in errors]).delete()
+
+        retries = [deletion for deletion in batch if deletion.name in errors]
+        for deletion in retries:
+            deletion.attempts += 1
+            deletion.last_error = errors[deletion.name]
+            if deletion.attempts >= STORAGE_DELETION_MAX_ATTEMPTS:
+                deletion.status = failed
+            else:
+                deletion.next_attempt_at = timezone.now() + timedelta(
+                    seconds=STORAGE_DELETION_RETRY_DELAY * 2 ** (deletion.attempts - 1))
+        StorageDeletion.objects.bulk_update(retries, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    return len(batch)
@@ -0,0 +1,200 @@
+import os
+import time
+import hashlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db import connection, models
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.text import get_valid_filename
+
+from album.models import ContentBlob, get_content_addressed_name
+from utils.constants import DIRECT_UPLOAD_EXPIRY, STORAGE_UPLOAD_CONCURRENCY
+from utils.metrics import storage_upload_metrics
+
+
+def get_direct_upload_key(prefix, filename, max_length=100):
+    """A fresh storage key under `prefix` that fits a FileField's max_length."""
+    stem, extension = os.path.splitext(get_valid_filename(filename))
+    key = f'{prefix}/{timezone.now().date()}/{uuid.uuid4().hex[:12]}-'
+    return key + stem[:max(0, max_length - len(key) - len(extension))] + extension
+
+
+def get_stored_size(key):
+    """Size in bytes of an uploaded object, or None if nothing was uploaded under the key."""
+    try:
+        return default_storage.size(key)
+    except OSError:
+        return None
+
+
+class S3DirectUploadBackend:
+    """Presigned S3 PUT URLs. Content-Type and Content-Length are signed, so S3 rejects anything else."""
+
+    def get_upload_url(self, key, content_type, size, expires_in=DIRECT_UPLOAD_EXPIRY):
+        from storages.utils import clean_name
+
+        return default_storage.connection.meta.client.generate_presigned_url(
+            'put_object',
+            Params={
+                'Bucket': default_storage.bucket_name,
+                ## same key django-storages reads, including any AWS_LOCATION prefix
+                'Key': default_storage._normalize_name(clean_name(key)),
+                'ContentType': content_type,
+                'ContentLength': size,
+            },
+            ExpiresIn=expires_in,
+            HttpMethod='PUT')
+
+
+class LocalDirectUploadBackend:
+    """
+    Stand-in for a bucket in development and tests: the "presigned" URL is a signed
+    token for LocalDirectUploadView, which writes the body to the local storage.
+    """
+
+    salt = 'utils.uploads.LocalDirectUploadBackend'
+
+    def get_upload_url(self, key, content_type, size, expires_in=DIRECT_UPLOAD_EXPIRY):
+        token = signing.dumps({'key': key, 'content_type': content_type, 'size': size}, salt=self.salt)
+        return reverse('local_direct_upload', args=[token])
+
+    def load_token(self, token, max_age=DIRECT_UPLOAD_EXPIRY):
+        return signing.loads(token, salt=self.salt, max_age=max_age)
+
+
+def get_direct_upload_backend():
+    return import_string(settings.DIRECT_UPLOAD_BACKEND)()
+
+
+def get_content_hash(file):
+    """SHA-256 of a file, read chunk by chunk so a large upload is never held in memory."""
+    content_hash = hashlib.sha256()
+    for chunk in file.chunks():
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+## shared by every batch of the process: S3Storage keeps one boto3 connection per thread,
+## so long-lived workers reuse their connections instead of opening new ones per submission
+upload_executor = ThreadPoolExecutor(max_workers=STORAGE_UPLOAD_CONCURRENCY, thread_name_prefix='storage-upload')
+
+
+class StorageUploadBatch:
+    """
+    Stores the not yet saved files of several model instances concurrently through the
+    process' bounded upload pool, instead of one blocking storage PUT after another in
+    save() and bulk_create(). Files are content addressed: each distinct content is stored
+    once as a ContentBlob and every file field holding it takes a reference, so a
+    re-uploaded photo or document is neither uploaded nor stored again.
+
+    All or nothing: if an upload fails, or the block the batch is used in raises,
+    every reference it took is released and every object it stored is deleted again.
+
+        with StorageUploadBatch() as uploads:
+            uploads.commit([property, *media_files])
+            MediaFiles.objects.bulk_create(media_files)
+            property.save()
+    """
+
+    def __init__(self):
+        ## objects stored that no blob owns yet, blobs this batch created, and blob names referenced by it
+        self.stored = []
+        self.created = []
+        self.references = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+
+    @staticmethod
+    def get_pending_files(instances):
+        files = []
+        for instance in instances:
+            for field in instance._meta.concrete_fields:
+                if isinstance(field, models.FileField):
+                    file = getattr(instance, field.attname)
+                    ## _committed is what FileField.pre_save checks before uploading
+                    if file and not file._committed:
+                        files.append(file)
+        return files
+
+    def store(self, name, file):
+        """Store one file. Returns its storage name and the seconds the upload took."""
+        started = time.perf_counter()
+        name = file.storage.save(name, file.file)
+        self.stored.append(name)
+        return name, time.perf_counter() - started
+
+    def commit(self, instances):
+        files = self.get_pending_files(instances)
+        if not files:
+            return
+
+        ## files wrapping the same upload (an image that is also the default image) share one stream
+        hashes, groups = {}, {}
+        for file in files:
+            if id(file.file) not in hashes:
+                hashes[id(file.file)] = get_content_hash(file.file)
+            groups.setdefault(hashes[id(file.file)], []).append(file)
+
+        names = ContentBlob.acquire({content_hash: len(group) for content_hash, group in groups.items()})
+        for content_hash, name in names.items():
+            self.references += [name] * len(groups[content_hash])
+
+        missing = [content_hash for content_hash in groups if content_hash not in names]
+        futures, started = {}, time.perf_counter()
+        if missing:
+            futures = {content_hash: upload_executor.submit(
+                self.store, get_content_addressed_name(content_hash, groups[content_hash][0].name),
+                groups[content_hash][0]) for content_hash in missing}
+            wait(futures.values())
+
+            errors = [future.exception() for future in futures.values() if future.exception()]
+            if errors:
+                self.discard()
+                raise errors[0]
+        wall_seconds = time.perf_counter() - started
+
+        for content_hash in missing:
+            stored_name, _ = futures[content_hash].result()
+            group = groups[content_hash]
+            names[content_hash] = ContentBlob.create_or_acquire(
+                content_hash, stored_name, group[0].size, len(group))
+            self.references += [names[content_hash]] * len(group)
+            self.stored.remove(stored_name)
+            if names[content_hash] == stored_name:
+                self.created.append(stored_name)
+            else:
+                ## the same content was stored concurrently by another request
+                group[0].storage.delete(stored_name)
+
+        for content_hash, group in groups.items():
+            for file in group:
+                file.name = names[content_hash]
+                file._committed = True
+
+        storage_upload_metrics.observe((files[0].storage.__class__.__name__,), {
+            'wall_ms': wall_seconds * 1000,
+            'estimated_sequential_ms': sum(futures[content_hash].result()[1] for content_hash in missing) * 1000,
+            'files': len(files),
+            'deduplicated': len(files) - len(missing),
+        })
+
+    def discard(self):
+        if connection.needs_rollback:
+            ## no query can run until the atomic block rolls back, which takes back the
+            ## references and the blobs this batch created; only their objects are left
+            names = self.stored + self.created
+        else:
+            names = self.stored + ContentBlob.release(self.references)
+        for name in names:
+            default_storage.delete(name)
+        self.stored, self.created, self.references = [], [], []